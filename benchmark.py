@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# Startup and build benchmarks for the PostHog Windows Standalone
+# The launcher suite runs the real standalone_launcher on Linux in a sandbox
+# where manage.py, the plugin server and the Celery worker are small stub
+# services, and times its startup phases and the first HTTP 200 for cold
+# (empty data directory) and warm starts. It does so for the runserver
+# baseline, for the waitress web tier and with the warm command runner, and
+# reports each variant next to the baseline. The build suite times the steps of
+# build_standalone.py or build_windows_exe.py with an empty download cache
+# that is filled from a local artifact mirror, and again with a warm cache.
+# Results are written to JSON and compared against a stored baseline:
+#   python3 benchmark.py launcher --runs 5
+#   python3 benchmark.py seed-mirror
+#   python3 benchmark.py build --script build_standalone.py setup copy
+#   python3 benchmark.py launcher --save-baseline
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import argparse
+import platform
+import importlib.util
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlsplit
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from build_downloads import CACHE_DIR, load_json, object_path, save_json
+from build_files import LAUNCHER_FILES
+from build_pipeline import report_file
+
+RESULTS_DIR = Path("build/benchmarks")
+MIRROR_DIR = Path(os.environ.get("POSTHOG_BUILD_MIRROR_DIR", "build/mirror"))
+# A metric that got slower by more than this fraction counts as a regression
+REGRESSION_THRESHOLD = 0.10
+LAUNCHER_TIMEOUT = 120
+STOP_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+# Services the launcher reports as ready in startup.json
+SERVICES = ("django", "plugin-server", "worker")
+
+# config.json overrides of each launcher variant, the first one is the
+# baseline the others are compared with
+LAUNCHER_VARIANTS = {
+    "runserver": {"server": {"mode": "runserver"}, "commands": {"warm": False}},
+    # The default web tier: web_server.py workers on a shared socket
+    "waitress": {"server": {}, "commands": {"warm": False}},
+    # migrate runs through call_command in command_runner.py
+    "warm-commands": {"server": {"mode": "runserver"}, "commands": {"warm": True}},
+}
+# Packages web_server.py needs, copied into the sandbox from this interpreter
+WAITRESS_PACKAGES = ("waitress", "whitenoise")
+
+# The stubs take this long to come up, roughly like a small Django project,
+# so that skipping work in the launcher shows up in the timings
+STUB_DELAYS = {
+    "BENCHMARK_MIGRATE_SECONDS": "1.0",
+    "BENCHMARK_APP_SECONDS": "0.5",
+    "BENCHMARK_PLUGIN_SERVER_SECONDS": "0.5",
+    "BENCHMARK_WORKER_SECONDS": "0.5",
+}
+
+# Also imported by the call_command stub, which is how the warm command
+# runner reaches migrate
+STUB_MANAGE_PY = """\
+import os
+import sys
+import time
+import sqlite3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def migrate():
+    time.sleep(float(os.environ["BENCHMARK_MIGRATE_SECONDS"]))
+    conn = sqlite3.connect(os.environ["DATABASE_URL"][len("sqlite:///"):])
+    conn.execute("CREATE TABLE IF NOT EXISTS django_migrations (id INTEGER PRIMARY KEY, app TEXT, name TEXT)")
+    if not conn.execute("SELECT COUNT(*) FROM django_migrations").fetchone()[0]:
+        conn.executemany("INSERT INTO django_migrations (app, name) VALUES ('posthog', ?)",
+                         [(f"{i:04}_migration",) for i in range(100)])
+    conn.commit()
+    conn.close()
+
+def runserver(address):
+    time.sleep(float(os.environ["BENCHMARK_APP_SECONDS"]))
+    host, port = address.rsplit(":", 1)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer((host, int(port)), Handler).serve_forever()
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "help"
+    if command == "migrate":
+        migrate()
+    elif command == "runserver":
+        runserver(sys.argv[2])
+"""
+
+STUB_PLUGIN_SERVER = """\
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+time.sleep(float(os.environ["BENCHMARK_PLUGIN_SERVER_SECONDS"]))
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+ThreadingHTTPServer(("127.0.0.1", 6738), Handler).serve_forever()
+"""
+
+STUB_CELERY = """\
+import os
+import time
+import socket
+
+time.sleep(float(os.environ["BENCHMARK_WORKER_SECONDS"]))
+print(f"celery@{socket.gethostname()} ready.", flush=True)
+while True:
+    time.sleep(60)
+"""
+
+# sqlite_profile.py wraps every Django process and hooks connection_created
+STUB_DJANGO_SIGNALS = """\
+class Signal:
+    def connect(self, receiver, **kwargs):
+        pass
+
+connection_created = Signal()
+"""
+
+# What command_runner.py and web_server.py use from Django. Loading the app
+# takes as long as it does in the runserver stub
+STUB_DJANGO = """\
+import os
+import time
+
+def setup():
+    time.sleep(float(os.environ["BENCHMARK_APP_SECONDS"]))
+"""
+
+STUB_DJANGO_CALL_COMMAND = """\
+def call_command(name, *args, **options):
+    import manage
+    if name == "migrate":
+        manage.migrate()
+"""
+
+STUB_DJANGO_COMMAND_ERROR = """\
+class CommandError(Exception):
+    pass
+"""
+
+STUB_DJANGO_CONNECTIONS = """\
+class Connections:
+    def close_all(self):
+        pass
+
+connections = Connections()
+"""
+
+STUB_DJANGO_WSGI = """\
+import os
+import time
+
+def application(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+def get_wsgi_application():
+    time.sleep(float(os.environ["BENCHMARK_APP_SECONDS"]))
+    return application
+"""
+
+class BenchmarkError(Exception):
+    pass
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def write_file(path, content, executable=False):
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    if executable:
+        os.chmod(path, 0o755)
+
+def create_sandbox(root):
+    """Lay out an installation directory with the launcher and stub services"""
+    for name in LAUNCHER_FILES:
+        if name.endswith(".py"):
+            shutil.copy2(name, root / name)
+    write_file(root / "manage.py", STUB_MANAGE_PY)
+    write_file(root / "plugin-server" / "dist" / "index.js", "")
+    # The launcher runs node\node.exe with the plugin server's entry point
+    write_file(root / "node" / "node.exe", f"#!{sys.executable}\n{STUB_PLUGIN_SERVER}", executable=True)
+
+    # Children get PYTHONHOME=python and PYTHONPATH=python\Lib, so the home
+    # links to this interpreter's standard library and Lib holds the stubs
+    home = root / "python"
+    os.makedirs(home / "Lib", exist_ok=True)
+    os.symlink(Path(sys.base_prefix) / "lib", home / "lib")
+    write_file(home / "Lib" / "celery" / "__init__.py", "")
+    write_file(home / "Lib" / "celery" / "__main__.py", STUB_CELERY)
+    django = home / "Lib" / "django"
+    write_file(django / "__init__.py", STUB_DJANGO)
+    write_file(django / "core" / "__init__.py", "")
+    write_file(django / "core" / "wsgi.py", STUB_DJANGO_WSGI)
+    write_file(django / "core" / "management" / "__init__.py", STUB_DJANGO_CALL_COMMAND)
+    write_file(django / "core" / "management" / "base.py", STUB_DJANGO_COMMAND_ERROR)
+    write_file(django / "db" / "__init__.py", STUB_DJANGO_CONNECTIONS)
+    write_file(django / "db" / "backends" / "__init__.py", "")
+    write_file(django / "db" / "backends" / "signals.py", STUB_DJANGO_SIGNALS)
+
+def copy_packages(names, dest):
+    """Copy installed pure-Python packages into the sandbox, False if one is missing"""
+    specs = [importlib.util.find_spec(name) for name in names]
+    if None in specs:
+        return False
+    for name, spec in zip(names, specs):
+        shutil.copytree(os.path.dirname(spec.origin), dest / name, ignore=shutil.ignore_patterns("__pycache__"))
+    return True
+
+def sandbox_config(port, variant):
+    """config.json for the sandbox: stub-friendly settings on free ports"""
+    config = {
+        "first_run": True,
+        "port": port,
+        "initialized": False,
+        "redis": {"port": free_port(), "snapshot": False},
+        "status": {"port": free_port()},
+        "logging": {"rate_limit": 0},
+    }
+    config.update(LAUNCHER_VARIANTS[variant])
+    return config
+
+def probe_ok(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+def run_launcher(root, port):
+    """Start the launcher once and return its timings"""
+    report_path = root / "data" / "run" / "startup.json"
+    if report_path.exists():
+        os.remove(report_path)
+    env = os.environ.copy()
+    env.update(STUB_DELAYS)
+    env.pop("PYTHONHOME", None)
+    env.pop("PYTHONPATH", None)
+    env["BROWSER"] = "true"  # webbrowser.open runs a no-op
+
+    began = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, str(root / "standalone_launcher.py")],
+        cwd=root,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+    output = []
+    threading.Thread(target=lambda: output.extend(process.stdout), daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{port}/"
+        deadline = began + LAUNCHER_TIMEOUT
+        first_200 = None
+        while first_200 is None:
+            if probe_ok(url):
+                first_200 = time.monotonic() - began
+            elif process.poll() is not None or time.monotonic() > deadline:
+                tail = b"".join(output[-20:]).decode(errors="replace")
+                raise BenchmarkError(f"Launcher did not answer on port {port}:\n{tail}")
+            else:
+                time.sleep(POLL_INTERVAL)
+
+        # The other services report to startup.json as they become ready
+        report = {}
+        while time.monotonic() < deadline:
+            try:
+                report = load_json(report_path)
+            except ValueError:
+                report = {}
+            if report.get("pid") == process.pid and set(SERVICES) <= set(report["services"]):
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    timings = {"first_200_seconds": first_200}
+    for phase, seconds in report.get("phases", {}).items():
+        timings[f"phase.{phase}_seconds"] = seconds
+    for service, seconds in report.get("services", {}).items():
+        timings[f"ready.{service}_seconds"] = seconds
+    return timings
+
+def benchmark_launcher(runs, variants=tuple(LAUNCHER_VARIANTS)):
+    """Cold and warm launcher starts of each variant in a fresh sandbox, `runs` times each"""
+    if os.name == "nt":
+        raise BenchmarkError("The launcher benchmark runs on Linux, with stub services")
+    samples = {}
+    with tempfile.TemporaryDirectory(prefix="posthog-benchmark-") as tmp:
+        root = Path(tmp)
+        create_sandbox(root)
+        if "waitress" in variants and not copy_packages(WAITRESS_PACKAGES, root / "python" / "Lib"):
+            print(f"  Skipping the waitress variant, {' and '.join(WAITRESS_PACKAGES)} "
+                  f"are not installed for {sys.executable}")
+            variants = [variant for variant in variants if variant != "waitress"]
+        for variant in variants:
+            for run in range(runs):
+                port = free_port()
+                shutil.rmtree(root / "data", ignore_errors=True)
+                save_json(root / "data" / "config.json", sandbox_config(port, variant))
+                for mode in ("cold", "warm"):
+                    timings = run_launcher(root, port)
+                    print(f"  {variant} {mode} start {run + 1}/{runs}: "
+                          f"first HTTP 200 after {timings['first_200_seconds']:.2f}s")
+                    for name, value in timings.items():
+                        samples.setdefault(f"launcher.{variant}.{mode}.{name}", []).append(value)
+    return samples
+
+def print_variants(metrics):
+    """Median time to the first HTTP 200 of each launcher variant next to the baseline variant"""
+    baseline_variant = next(iter(LAUNCHER_VARIANTS))
+    print(f"\n  {'variant':<16} {'cold':>9} {'change':>8} {'warm':>9} {'change':>8}")
+    for variant in LAUNCHER_VARIANTS:
+        line = f"  {variant:<16}"
+        for mode in ("cold", "warm"):
+            metric = metrics.get(f"launcher.{variant}.{mode}.first_200_seconds")
+            baseline = metrics.get(f"launcher.{baseline_variant}.{mode}.first_200_seconds")
+            if metric is None:
+                line += f" {'-':>9} {'':>8}"
+                continue
+            line += f" {metric['median']:8.3f}s"
+            if baseline is None or variant == baseline_variant:
+                line += f" {'':>8}"
+            else:
+                change = (metric["median"] - baseline["median"]) / baseline["median"]
+                line += f" {change * 100:+7.1f}%"
+        print(line)
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_mirror(mirror_dir):
+    """Serve the artifact mirror on a free local port, returning the server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(mirror_dir)))
+    threading.Thread(target=server.serve_forever, name="mirror", daemon=True).start()
+    return server
+
+def seed_mirror(mirror_dir=MIRROR_DIR):
+    """Lay out the download cache as a mirror: <mirror>/<host>/<path>"""
+    index = load_json(CACHE_DIR / "index.json")
+    if not index:
+        raise BenchmarkError(f"{CACHE_DIR} is empty, run a build once to fill it")
+    for url, entry in index.items():
+        parts = urlsplit(url)
+        dest = mirror_dir / parts.netloc / parts.path.lstrip("/")
+        os.makedirs(dest.parent, exist_ok=True)
+        shutil.copyfile(object_path(entry["sha256"]), dest)
+        print(f"  {url} -> {dest}")
+    print(f"Mirror of {len(index)} artifacts in {mirror_dir}")
+
+def run_build(script, steps, env, force):
+    """Run a build script once and return its pipeline report"""
+    # The scripts name their pipelines after themselves without the build_ prefix
+    path = report_file(Path(script).stem.replace("build_", "", 1))
+    if path.exists():
+        os.remove(path)
+    command = [sys.executable, script] + list(steps) + (["--force"] if force else [])
+    result = subprocess.run(command, env=env)
+    report = load_json(path)
+    if result.returncode != 0 or not report:
+        raise BenchmarkError(f"{' '.join(command)} failed with exit code {result.returncode}")
+    return report
+
+def benchmark_build(script, steps, runs, mirror_dir=MIRROR_DIR):
+    """Build with an empty download cache filled from the mirror, then with a warm cache"""
+    if not mirror_dir.is_dir():
+        raise BenchmarkError(f"Mirror {mirror_dir} is missing, create it with: benchmark.py seed-mirror")
+    suite = Path(script).stem
+    server = serve_mirror(mirror_dir)
+    samples = {}
+    try:
+        env = os.environ.copy()
+        env["POSTHOG_BUILD_MIRROR"] = f"http://127.0.0.1:{server.server_address[1]}"
+        env.pop("POSTHOG_BUILD_OFFLINE", None)
+        for run in range(runs):
+            with tempfile.TemporaryDirectory(prefix="posthog-benchmark-cache-") as cache:
+                env["POSTHOG_BUILD_CACHE"] = cache
+                for mode, force in (("cold", True), ("warm", False)):
+                    report = run_build(script, steps, env, force)
+                    print(f"  {mode} build {run + 1}/{runs}: {report['wall_seconds']:.1f}s")
+                    prefix = f"{suite}.{mode}"
+                    samples.setdefault(f"{prefix}.wall_seconds", []).append(report["wall_seconds"])
+                    samples.setdefault(f"{prefix}.cpu_seconds", []).append(report["cpu_seconds"])
+                    for name, entry in report["steps"].items():
+                        samples.setdefault(f"{prefix}.step.{name}_seconds", []).append(entry["wall_seconds"])
+    finally:
+        server.shutdown()
+    return samples
+
+def summarize(samples):
+    return {
+        name: {
+            "median": statistics.median(values),
+            "min": min(values),
+            "max": max(values),
+            "runs": values,
+        }
+        for name, values in sorted(samples.items())
+    }
+
+def compare(metrics, baseline, threshold):
+    """Relative change of each metric's median against the baseline"""
+    comparison = {}
+    for name, metric in metrics.items():
+        if name not in baseline.get("metrics", {}):
+            continue
+        before = baseline["metrics"][name]["median"]
+        after = metric["median"]
+        change = (after - before) / before if before else 0.0
+        comparison[name] = {
+            "baseline": before,
+            "current": after,
+            "change": round(change, 4),
+            # Tiny absolute differences are noise, even if large relatively
+            "regression": change > threshold and after - before > 0.05,
+        }
+    return comparison
+
+def print_report(metrics, comparison):
+    print(f"\n  {'metric':<60} {'median':>9} {'min':>9} {'max':>9} {'baseline':>9} {'change':>8}")
+    for name, metric in metrics.items():
+        line = f"  {name:<60} {metric['median']:8.3f}s {metric['min']:8.3f}s {metric['max']:8.3f}s"
+        if name in comparison:
+            compared = comparison[name]
+            flag = "  REGRESSION" if compared["regression"] else ""
+            line += f" {compared['baseline']:8.3f}s {compared['change'] * 100:+7.1f}%{flag}"
+        print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark PostHog standalone startup and builds")
+    parser.add_argument("suite", choices=["launcher", "build", "seed-mirror"])
+    parser.add_argument("steps", nargs="*", help="build steps to benchmark (default: all)")
+    parser.add_argument("--script", default="build_standalone.py",
+                        help="build script for the build suite (build_standalone.py or build_windows_exe.py)")
+    parser.add_argument("--runs", type=int, default=3, help="cold and warm runs each")
+    parser.add_argument("--variant", action="append", choices=list(LAUNCHER_VARIANTS), dest="variants",
+                        help="launcher variant to benchmark, can be repeated (default: all)")
+    parser.add_argument("--mirror", type=Path, default=MIRROR_DIR, help="local artifact mirror directory")
+    parser.add_argument("--output", type=Path, help="results file (default build/benchmarks/<suite>.json)")
+    parser.add_argument("--baseline", type=Path,
+                        help="baseline to compare against (default build/benchmarks/<suite>-baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown of a median that counts as a regression (default 0.10)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        if args.suite == "seed-mirror":
+            seed_mirror(args.mirror)
+            return 0
+        if args.suite == "launcher":
+            name = "launcher"
+            variants = args.variants or list(LAUNCHER_VARIANTS)
+            print(f"Benchmarking {args.runs} cold and warm launcher starts of {', '.join(variants)}...")
+            samples = benchmark_launcher(args.runs, variants)
+        else:
+            name = Path(args.script).stem
+            print(f"Benchmarking {args.runs} cold and warm runs of {args.script}...")
+            samples = benchmark_build(args.script, args.steps, args.runs, args.mirror)
+    except BenchmarkError as e:
+        print(f"Error: {e}")
+        return 1
+
+    output = args.output or RESULTS_DIR / f"{name}.json"
+    baseline_path = args.baseline or RESULTS_DIR / f"{name}-baseline.json"
+    metrics = summarize(samples)
+    baseline = load_json(baseline_path)
+    comparison = compare(metrics, baseline, args.threshold) if baseline else {}
+    results = {
+        "suite": name,
+        "timestamp": time.time(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "metrics": metrics,
+        "baseline": str(baseline_path) if baseline else None,
+        "comparison": comparison,
+    }
+    save_json(output, results)
+    print_report(metrics, comparison)
+    if name == "launcher":
+        print_variants(metrics)
+    print(f"\nResults written to {output}")
+
+    if args.save_baseline:
+        save_json(baseline_path, results)
+        print(f"Baseline saved to {baseline_path}")
+    regressions = [metric for metric, compared in comparison.items() if compared["regression"]]
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%} against {baseline_path}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
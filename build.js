@@ -103,14 +103,29 @@ CORS_ORIGIN_ALLOW_ALL = True
   console.log('Created local settings file');
 }
 
+// Preparation steps, runnable one at a time by the Python build pipeline
+const steps = {
+  source: checkPostHogDir,
+  'node-deps': installNodeDependencies,
+  settings: prepareBuild,
+};
+
 // Main function
 async function main() {
   console.log('PostHog Windows Executable Builder - Node.js Helper');
   
+  // Run the named steps, or all of them in order
+  const requested = process.argv.slice(2);
+  const unknown = requested.filter(name => !(name in steps));
+  if (unknown.length > 0) {
+    console.error(`Unknown steps: ${unknown.join(', ')} (available: ${Object.keys(steps).join(', ')})`);
+    process.exit(1);
+  }
+  
   try {
-    await checkPostHogDir();
-    await installNodeDependencies();
-    await prepareBuild();
+    for (const name of (requested.length > 0 ? requested : Object.keys(steps))) {
+      await steps[name]();
+    }
     
     console.log('Node.js build preparation completed');
   } catch (error) {
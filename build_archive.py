@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# Parallel zip handling for the PostHog Windows build
+# Extracts archives with a pool of threads that each stream members to disk
+# through their own ZipFile handle, and creates archives by compressing
+# members in parallel and appending the finished streams in order
+
+import os
+import sys
+import time
+import zlib
+import shutil
+import zipfile
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# POSTHOG_BUILD_ZIP_LEVEL picks the deflate level, 0 stores everything
+ZIP_LEVEL = int(os.environ.get("POSTHOG_BUILD_ZIP_LEVEL", "6"))
+MAX_ARCHIVE_THREADS = os.cpu_count() or 1
+
+CHUNK_SIZE = 1024 * 1024
+# Compressed members stay in memory up to this size, then go to a temp file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# write_member appends precompressed members through ZipFile internals
+# (_writecheck, _didModify, start_dir, ZipInfo.FileHeader), which are not API.
+# It is used on the interpreter versions it was checked on; other versions
+# compress members one at a time through ZipFile.write. Every archive is read
+# back with testzip before it replaces the previous one
+PARALLEL_WRITE_VERSIONS = {(3, 10), (3, 11), (3, 12), (3, 13)}
+
+class ArchiveError(Exception):
+    pass
+
+# Already compressed formats are stored, deflating them again only costs time
+STORED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".br", ".zst", ".whl", ".jar",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2", ".mp3", ".mp4",
+}
+
+def report(action, path, total_bytes, began):
+    elapsed = time.monotonic() - began
+    rate = total_bytes / max(elapsed, 1e-9) / 1e6
+    print(f"{action} {path}: {total_bytes / 1e6:.1f} MB in {elapsed:.1f}s ({rate:.1f} MB/s)")
+
+def member_path(name, root):
+    """Where a member extracts to, sanitized the way ZipFile.extract does it"""
+    arcname = name.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid = ("", os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(part for part in arcname.split(os.path.sep) if part not in invalid)
+    if os.path.sep == "\\":
+        arcname = zipfile.ZipFile._sanitize_windows_name(arcname, os.path.sep)
+    return os.path.normpath(os.path.join(root, arcname))
+
+def extract_file(zip_ref, member, path):
+    """Stream one file member to path, whose directory must already exist"""
+    with zip_ref.open(member) as src, open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+def extract_archive(zip_path, extract_to, workers=MAX_ARCHIVE_THREADS):
+    """Extract a zip file using several threads, streaming each member"""
+    began = time.monotonic()
+    os.makedirs(extract_to, exist_ok=True)
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        members = zip_ref.infolist()
+
+    # Directories are created up front, threads creating the same parent at
+    # the same time would fail with FileExistsError
+    files = []
+    for member in members:
+        path = member_path(member.filename, extract_to)
+        if member.is_dir():
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            files.append((member, path))
+
+    # Each thread reads through its own handle, ZipFile seeks aren't shared safely
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract_member(entry):
+        member, path = entry
+        if not hasattr(local, "zip_ref"):
+            local.zip_ref = zipfile.ZipFile(zip_path)
+            with handles_lock:
+                handles.append(local.zip_ref)
+        extract_file(local.zip_ref, member, path)
+        return member.file_size
+
+    # Largest members first keeps the threads busy until the end
+    files.sort(key=lambda entry: entry[0].file_size, reverse=True)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            total_bytes = sum(pool.map(extract_member, files))
+    finally:
+        for handle in handles:
+            handle.close()
+    report("Extracted", zip_path, total_bytes, began)
+    return total_bytes
+
+def compress_member(path, level):
+    """Deflate one file into a spooled buffer, returning (crc, size, buffer)"""
+    crc = 0
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    if spool.tell() >= size:
+        # Incompressible, store it instead
+        spool.close()
+        spool = None
+    return crc, size, spool
+
+def checksum_member(path):
+    crc = 0
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return crc, size, None
+
+def prepare_member(path, arcname, level):
+    """Build the ZipInfo and compressed data for one file"""
+    info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+    store = level == 0 or os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+    info.CRC, info.file_size, spool = checksum_member(path) if store else compress_member(path, level)
+    if spool is None:
+        info.compress_type = zipfile.ZIP_STORED
+        info.compress_size = info.file_size
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.compress_size = spool.tell()
+        spool.seek(0)
+    return path, info, spool
+
+def write_member(archive, path, info, spool):
+    """Append an already compressed member to an archive being written"""
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    info.header_offset = archive.fp.tell()
+    archive._writecheck(info)
+    archive._didModify = True
+    archive.fp.write(info.FileHeader(zip64))
+    if spool is None:
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, archive.fp, CHUNK_SIZE)
+    else:
+        with spool:
+            shutil.copyfileobj(spool, archive.fp, CHUNK_SIZE)
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+    archive.start_dir = archive.fp.tell()
+
+def create_archive(archive_path, root_dir, level=ZIP_LEVEL, workers=MAX_ARCHIVE_THREADS):
+    """Zip the contents of root_dir, compressing files in parallel"""
+    began = time.monotonic()
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, root_dir)
+        if rel_dir != os.curdir:
+            entries.append((dirpath, rel_dir.replace(os.sep, "/") + "/"))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            entries.append((path, os.path.relpath(path, root_dir).replace(os.sep, "/")))
+
+    tmp_path = f"{archive_path}.tmp"
+    if sys.version_info[:2] not in PARALLEL_WRITE_VERSIONS:
+        print(f"Python {sys.version_info[0]}.{sys.version_info[1]} is not checked for parallel zip writing, "
+              f"compressing {archive_path} on one core")
+        total_bytes = write_archive_serially(tmp_path, entries, level)
+    else:
+        total_bytes = write_archive_in_parallel(tmp_path, entries, level, workers)
+    try:
+        verify_archive(tmp_path, len(entries))
+    except (ArchiveError, zipfile.BadZipFile):
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, archive_path)
+
+    report("Created", archive_path, total_bytes, began)
+    return total_bytes
+
+def write_archive_serially(archive_path, entries, level):
+    """Zip entries through the public ZipFile API only"""
+    total_bytes = 0
+    with zipfile.ZipFile(archive_path, "w", allowZip64=True) as archive:
+        for path, arcname in entries:
+            store = level == 0 or os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+            compress_type = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+            archive.write(path, arcname, compress_type=compress_type, compresslevel=None if store else level)
+            if not arcname.endswith("/"):
+                total_bytes += os.path.getsize(path)
+    return total_bytes
+
+def verify_archive(archive_path, expected_members):
+    """Read every member back and check its CRC"""
+    with zipfile.ZipFile(archive_path) as archive:
+        members = len(archive.infolist())
+        try:
+            bad_member = archive.testzip()
+        except zlib.error as e:
+            raise ArchiveError(f"{archive_path} failed verification: {e}")
+    if bad_member is not None:
+        raise ArchiveError(f"{archive_path} failed verification at {bad_member}")
+    if members != expected_members:
+        raise ArchiveError(f"{archive_path} has {members} members, expected {expected_members}")
+
+def write_archive_in_parallel(archive_path, entries, level, workers):
+    """Zip entries, compressing files in parallel and writing them in order"""
+    total_bytes = 0
+    with zipfile.ZipFile(archive_path, "w", allowZip64=True) as archive:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded window of members in flight, written in order
+            pending = deque()
+            entry_iter = iter(entries)
+            while True:
+                while len(pending) < workers * 4:
+                    entry = next(entry_iter, None)
+                    if entry is None:
+                        break
+                    path, arcname = entry
+                    if arcname.endswith("/"):
+                        pending.append(zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False))
+                    else:
+                        pending.append(pool.submit(prepare_member, path, arcname, level))
+                if not pending:
+                    break
+                item = pending.popleft()
+                if isinstance(item, zipfile.ZipInfo):
+                    archive.writestr(item, b"")
+                    continue
+                path, info, spool = item.result()
+                write_member(archive, path, info, spool)
+                total_bytes += info.file_size
+    return total_bytes
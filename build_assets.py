@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Static asset processing for the PostHog Windows builds
+# Hashes every frontend asset and writes gzip and brotli variants next to it
+# at maximum compression, on all cores, so whitenoise serves them without
+# compressing anything at runtime. A manifest records each file's hash,
+# sizes and whether its name is content-hashed and can be cached forever.
+# Files whose hash didn't change since the last run are not compressed again
+
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from build_archive import STORED_EXTENSIONS
+from build_staging import place_file
+
+MANIFEST_NAME = "assets-manifest.json"
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Smaller files aren't worth a second request path
+MIN_COMPRESS_SIZE = 256
+# A variant is only kept if it saves at least this much
+MIN_SAVING = 0.05
+MAX_ASSET_PROCESSES = os.cpu_count() or 1
+
+# Names with a content hash: esbuild's "name-HASH.ext" and Django's "name.<12 hex>.ext"
+HASHED_NAME = re.compile(r"-(?=[A-Z0-9]*[0-9])[A-Z0-9]{8}\.\w+$|\.[0-9a-f]{12}\.\w+$")
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+COMPRESSED_SUFFIXES = tuple(VARIANT_SUFFIXES.values())
+
+class AssetError(Exception):
+    pass
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def write_variant(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def process_asset(src, dest, previous):
+    """Copy one asset and write its compressed variants, returning its manifest entry"""
+    # Imported here so that importing this module doesn't need the build requirements
+    import brotli
+
+    with open(src, "rb") as f:
+        data = f.read()
+    entry = {
+        "sha256": sha256_bytes(data),
+        "size": len(data),
+        "immutable": bool(HASHED_NAME.search(os.path.basename(src))),
+    }
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    place_file(src, dest)
+
+    encoders = {
+        "gzip": lambda: gzip.compress(data, GZIP_LEVEL, mtime=0),
+        "br": lambda: brotli.compress(data, quality=BROTLI_QUALITY),
+    }
+    if len(data) >= MIN_COMPRESS_SIZE and os.path.splitext(src)[1].lower() not in STORED_EXTENSIONS:
+        for encoding, encode in encoders.items():
+            variant = dest + VARIANT_SUFFIXES[encoding]
+            if previous.get("sha256") == entry["sha256"] and encoding in previous and os.path.exists(variant):
+                entry[encoding] = previous[encoding]
+                continue
+            encoded = encode()
+            if len(encoded) <= len(data) * (1 - MIN_SAVING):
+                write_variant(variant, encoded)
+                entry[encoding] = len(encoded)
+    # Variants from an earlier run that are no longer worth keeping
+    for encoding, suffix in VARIANT_SUFFIXES.items():
+        if encoding not in entry and os.path.exists(dest + suffix):
+            os.remove(dest + suffix)
+    return entry
+
+def process_assets(src_root, dest_root, workers=MAX_ASSET_PROCESSES):
+    """Mirror src_root to dest_root with precompressed variants and a manifest"""
+    began = time.monotonic()
+    src_root, dest_root = Path(src_root), Path(dest_root)
+    manifest_path = dest_root / MANIFEST_NAME
+    previous = {}
+    if manifest_path.exists():
+        with open(manifest_path) as f:
+            previous = json.load(f).get("files", {})
+
+    assets = []
+    for dirpath, dirnames, filenames in os.walk(src_root):
+        for filename in filenames:
+            # Variants shipped upstream are replaced by ours
+            if filename.endswith(COMPRESSED_SUFFIXES) or filename == MANIFEST_NAME:
+                continue
+            path = os.path.join(dirpath, filename)
+            assets.append(os.path.relpath(path, src_root).replace(os.sep, "/"))
+
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        raise AssetError("brotli is not installed, install the build requirements with pip install -r requirements.txt")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            rel_path: pool.submit(
+                process_asset, str(src_root / rel_path), str(dest_root / rel_path), previous.get(rel_path, {})
+            )
+            for rel_path in assets
+        }
+        files = {rel_path: future.result() for rel_path, future in futures.items()}
+
+    # Remove assets deleted upstream together with their variants
+    keep = {str(dest_root / rel_path) + suffix for rel_path in files for suffix in ("",) + COMPRESSED_SUFFIXES}
+    keep.add(str(manifest_path))
+    for dirpath, dirnames, filenames in os.walk(dest_root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if path not in keep:
+                os.remove(path)
+
+    manifest = {"version": 1, "files": files}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    total = sum(entry["size"] for entry in files.values())
+    gzipped = sum(entry.get("gzip", entry["size"]) for entry in files.values())
+    brotlied = sum(entry.get("br", entry.get("gzip", entry["size"])) for entry in files.values())
+    immutable = sum(1 for entry in files.values() if entry["immutable"])
+    print(f"Processed {len(files)} assets in {src_root} ({immutable} with hashed names) "
+          f"in {time.monotonic() - began:.1f}s")
+    print(f"  {total / 1e6:.1f} MB, gzip {gzipped / 1e6:.1f} MB, brotli {brotlied / 1e6:.1f} MB")
+    return manifest
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# Download manager for the PostHog Windows build
+# Fetches build artifacts in parallel into a content-addressed cache that
+# later builds reuse, verifies them against pinned SHA-256 hashes and can
+# resume interrupted downloads or run fully offline from the cache. Pinned
+# artifacts need their hash in the committed downloads.lock.json or published
+# upstream
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import urllib.request
+import urllib.error
+from urllib.parse import urlsplit
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Cache layout: objects/<sha256> holds the content, index.json maps URLs to
+# the hash they last resolved to, partial/ keeps interrupted downloads
+CACHE_DIR = Path(os.environ.get("POSTHOG_BUILD_CACHE", "build/cache"))
+LOCK_FILE = Path("downloads.lock.json")
+
+# POSTHOG_BUILD_OFFLINE=1 serves everything from the cache, and
+# POSTHOG_BUILD_MIRROR=http://host:port fetches <mirror>/<original host>/<path>
+OFFLINE = os.environ.get("POSTHOG_BUILD_OFFLINE", "") not in ("", "0")
+MIRROR = os.environ.get("POSTHOG_BUILD_MIRROR", "").rstrip("/")
+# POSTHOG_BUILD_UPDATE_LOCK=1 pins artifacts that have neither a lock entry
+# nor a published checksum to whatever they download as
+UPDATE_LOCK = os.environ.get("POSTHOG_BUILD_UPDATE_LOCK", "") not in ("", "0")
+
+CHUNK_SIZE = 1024 * 1024
+MAX_PARALLEL_DOWNLOADS = 8
+
+class DownloadError(Exception):
+    pass
+
+def artifact(name, url, dest, pin=True, checksums=None):
+    """Describe a build artifact; pinned ones must always hash the same.
+    checksums is the URL of the SHA-256 list the publisher ships with it"""
+    return {"name": name, "url": url, "dest": Path(dest), "pin": pin, "checksums": checksums}
+
+def load_json(path):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_json(path, data):
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def object_path(sha256):
+    return CACHE_DIR / "objects" / sha256
+
+def source_url(url):
+    """Rewrite a URL to the configured mirror, if any"""
+    if not MIRROR:
+        return url
+    parts = urlsplit(url)
+    return f"{MIRROR}/{parts.netloc}{parts.path}"
+
+def fetch_to_partial(url, partial_path, resume=True):
+    """Download url into partial_path, resuming from what is already there"""
+    os.makedirs(partial_path.parent, exist_ok=True)
+    if not resume and partial_path.exists():
+        os.remove(partial_path)
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    request = urllib.request.Request(source_url(url))
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        response = urllib.request.urlopen(request, timeout=60)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # Range not satisfiable: the partial file is already complete
+            return 0
+        raise
+    with response:
+        # A server that ignores Range answers 200 with the whole file
+        mode = "ab" if offset and response.status == 206 else "wb"
+        received = 0
+        with open(partial_path, mode) as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+                received += len(chunk)
+    return received
+
+def store_object(partial_path):
+    """Move a finished download into the content-addressed store"""
+    sha256 = sha256_file(partial_path)
+    target = object_path(sha256)
+    os.makedirs(target.parent, exist_ok=True)
+    if target.exists():
+        os.remove(partial_path)
+    else:
+        os.replace(partial_path, target)
+    return sha256
+
+def place(sha256, dest):
+    """Put a cached object at its destination, hardlinked when possible"""
+    os.makedirs(dest.parent, exist_ok=True)
+    if dest.exists():
+        if dest.stat().st_size == object_path(sha256).stat().st_size and sha256_file(dest) == sha256:
+            return
+        os.remove(dest)
+    try:
+        os.link(object_path(sha256), dest)
+    except OSError:
+        shutil.copyfile(object_path(sha256), dest)
+
+def published_sha256(item):
+    """The SHA-256 the publisher lists for an artifact in its checksums file"""
+    filename = urlsplit(item["url"]).path.rsplit("/", 1)[-1]
+    with urllib.request.urlopen(source_url(item["checksums"]), timeout=60) as response:
+        for line in response.read().decode("utf-8").splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].lstrip("*") == filename:
+                return parts[0].lower()
+    raise DownloadError(f"{item['checksums']} does not list {filename}")
+
+def resolve(item, pins, index):
+    """Make one artifact available at its destination, downloading if needed"""
+    name, url = item["name"], item["url"]
+    pinned = pins.get(name) if item["pin"] and pins.get(name, {}).get("url") == url else None
+    expected = pinned.get("sha256") if pinned else None
+    if item["pin"] and expected is None:
+        # Never trust whatever the first download happens to return
+        if item["checksums"] and not OFFLINE:
+            expected = published_sha256(item)
+        elif not UPDATE_LOCK:
+            published = f" from {pinned['published']}" if pinned and pinned.get("published") else ""
+            raise DownloadError(
+                f"{name} has no pinned sha256 for {url} in {LOCK_FILE}. Add the published hash{published}, "
+                f"or set POSTHOG_BUILD_UPDATE_LOCK=1 to pin what it downloads as now"
+            )
+
+    # Pinned artifacts are served from the cache whenever they are in it,
+    # unpinned ones only when offline
+    cached = expected or (index.get(url, {}).get("sha256") if OFFLINE else None)
+    if cached and object_path(cached).exists():
+        place(cached, item["dest"])
+        return {"name": name, "sha256": cached, "source": "cache", "bytes": 0, "seconds": 0.0}
+    if OFFLINE:
+        raise DownloadError(f"{name} is not in the download cache and the build is offline")
+
+    began = time.monotonic()
+    partial_path = CACHE_DIR / "partial" / hashlib.sha256(url.encode()).hexdigest()
+    print(f"Downloading {url}")
+    # Unpinned URLs can change content, a partial file may be from an older version
+    received = fetch_to_partial(url, partial_path, resume=expected is not None)
+    sha256 = store_object(partial_path)
+    if expected and sha256 != expected:
+        os.remove(object_path(sha256))
+        raise DownloadError(f"{name} failed verification: expected sha256 {expected}, got {sha256}")
+    place(sha256, item["dest"])
+    return {
+        "name": name,
+        "sha256": sha256,
+        "source": "download",
+        "bytes": received,
+        "seconds": time.monotonic() - began,
+    }
+
+def fetch_artifacts(items):
+    """Fetch all artifacts at the same time and pin new ones in the lock file"""
+    pins = load_json(LOCK_FILE)
+    index = load_json(CACHE_DIR / "index.json")
+    with ThreadPoolExecutor(max_workers=min(len(items), MAX_PARALLEL_DOWNLOADS) or 1) as pool:
+        futures = [(item, pool.submit(resolve, item, pins, index)) for item in items]
+        results, errors = [], []
+        for item, future in futures:
+            try:
+                results.append(future.result())
+            except (DownloadError, OSError, urllib.error.URLError) as e:
+                errors.append(f"{item['name']}: {e}")
+
+    by_name = {result["name"]: result for result in results}
+    for item in items:
+        result = by_name.get(item["name"])
+        if result is None:
+            continue
+        index[item["url"]] = {"sha256": result["sha256"], "fetched": time.time()}
+        pin = pins.get(item["name"], {})
+        if item["pin"] and (pin.get("url") != item["url"] or not pin.get("sha256")):
+            pins[item["name"]] = dict(pin, url=item["url"], sha256=result["sha256"])
+            print(f"Pinned {item['name']} to sha256 {result['sha256']} in {LOCK_FILE}")
+    save_json(CACHE_DIR / "index.json", index)
+    save_json(LOCK_FILE, pins)
+
+    for result in results:
+        if result["source"] == "download":
+            rate = result["bytes"] / max(result["seconds"], 1e-9) / 1e6
+            print(f"  {result['name']}: downloaded {result['bytes'] / 1e6:.1f} MB in {result['seconds']:.1f}s ({rate:.1f} MB/s)")
+        else:
+            print(f"  {result['name']}: served from cache")
+    if errors:
+        raise DownloadError("Failed to fetch build artifacts:\n  " + "\n  ".join(errors))
+    return by_name
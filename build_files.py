@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# Files shipped by the PostHog Windows builds
+# Only the standard library may be imported here, so that tools such as
+# benchmark.py can read these lists without the build requirements installed
+
+# Launcher files shipped next to the PostHog application
+LAUNCHER_FILES = [
+    "standalone_launcher.py",
+    "web_server.py",
+    "sqlite_profile.py",
+    "event_ingest.py",
+    "event_partitions.py",
+    "local_redis.py",
+    "launcher_logging.py",
+    "launcher_status.py",
+    "launcher_supervisor.py",
+    "command_runner.py",
+    "import_profile.py",
+    "loadtest.py",
+    "posthog.bat",
+]
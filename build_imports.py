@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# Import analysis for the PyInstaller build of PostHog
+# Runs the app through a scripted startup and smoke test in child
+# interpreters with -X importtime and records every module they import.
+# The spec's hiddenimports are the traced modules, and its excludes are a
+# fixed list of large packages the app doesn't use, as long as the trace
+# didn't import them. After PyInstaller has run, the
+# contents of the build are totalled per package next to the import time
+# each package cost during the trace
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from import_profile import parse_importtime
+
+TRACE_FILE = Path("build/import-trace.json")
+ANALYSIS_FILE = Path("build/pyinstaller-imports.json")
+# Written by the spec file with everything the Analysis collected
+CONTENTS_FILE = Path("build/pyinstaller-contents.json")
+REPORT_FILE = Path("build/pyinstaller-size-report.json")
+
+# Large packages the app never uses. Django, Celery and their plugins load
+# many modules lazily, on paths the trace can't reach, so a package is only
+# excluded when it is listed here, never just because the trace missed it.
+# POSTHOG_BUILD_EXCLUDE_PACKAGES (comma separated) adds to the list
+EXCLUDE_PACKAGES = {
+    # Build tools installed next to the app's requirements
+    "PyInstaller", "pip", "wheel", "brotli",
+    # Standard library
+    "tkinter", "turtle", "turtledemo", "idlelib", "lib2to3", "pydoc_data", "test", "unittest",
+    "doctest", "distutils", "ensurepip", "venv", "curses", "xmlrpc",
+} | {
+    name.strip() for name in os.environ.get("POSTHOG_BUILD_EXCLUDE_PACKAGES", "").split(",") if name.strip()
+}
+
+# The same environment the launcher gives the services
+TRACE_ENV = {
+    "DEBUG": "0",
+    "REDIS_URL": "",
+    "SECRET_KEY": "windows_standalone_secret_key",
+    "DISABLE_SECURE_SSL_REDIRECT": "1",
+    "SKIP_SERVICE_VERSION_REQUIREMENTS": "1",
+    "DJANGO_SETTINGS_MODULE": "posthog.settings",
+}
+
+SMOKE_PATHS = ["/_health", "/", "/login", "/signup", "/preflight", "/api/users/@me/", "/decide/", "/e/"]
+
+# Runs inside the traced interpreter: python tracer.py <scenario> <output>
+TRACER = """\
+import os
+import sys
+import json
+
+scenario, output = sys.argv[1], sys.argv[2]
+sys.path.insert(0, os.getcwd())
+import django
+django.setup()
+
+if scenario == "migrate":
+    from django.core.management import call_command
+    call_command("migrate", interactive=False, verbosity=0)
+elif scenario == "web":
+    from wsgiref.util import setup_testing_defaults
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import get_resolver
+    application = get_wsgi_application()
+    # Loads every urls and views module
+    get_resolver().url_patterns
+    for path in json.loads(os.environ["TRACE_SMOKE_PATHS"]):
+        environ = {"PATH_INFO": path, "REQUEST_METHOD": "GET"}
+        setup_testing_defaults(environ)
+        try:
+            response = application(environ, lambda status, headers, exc_info=None: None)
+            b"".join(response)
+            response.close()
+        except Exception as e:
+            print(f"{path}: {type(e).__name__}: {e}", file=sys.stderr)
+elif scenario == "worker":
+    import importlib
+    # Loaded by the worker command, which the trace doesn't start
+    importlib.import_module("celery.apps.worker")
+    from posthog.celery import app
+    app.loader.import_default_modules()
+
+modules = {
+    name: getattr(module, "__file__", None)
+    for name, module in list(sys.modules.items())
+    if module is not None and getattr(module, "__spec__", None) is not None and name != "__main__"
+}
+from importlib.metadata import packages_distributions
+with open(output, "w") as f:
+    json.dump({"modules": modules, "distributions": packages_distributions()}, f)
+"""
+
+class ImportAnalysisError(Exception):
+    pass
+
+def run_scenario(scenario, posthog_dir, python_exe, env, work_dir):
+    """Trace one scenario, returning its modules, distributions and import times"""
+    began = time.monotonic()
+    tracer = work_dir / "tracer.py"
+    output = work_dir / f"{scenario}.json"
+    result = subprocess.run(
+        [python_exe, "-X", "importtime", str(tracer), scenario, str(output)],
+        cwd=posthog_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace"
+    )
+    if result.returncode != 0 or not output.exists():
+        lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise ImportAnalysisError(f"Tracing {scenario} failed: {lines[-1] if lines else result.returncode}")
+    with open(output) as f:
+        traced = json.load(f)
+    traced["import_us"] = {module: self_us for module, self_us, _ in parse_importtime(result.stderr)}
+    print(f"  {scenario}: {len(traced['modules'])} modules in {time.monotonic() - began:.1f}s")
+    return traced
+
+def trace_imports(posthog_dir, python_exe=sys.executable):
+    """Run the scenarios and merge what they imported into TRACE_FILE"""
+    print("Tracing imports of the app...")
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        with open(work_dir / "tracer.py", "w") as f:
+            f.write(TRACER)
+        env = os.environ.copy()
+        env.update(TRACE_ENV)
+        env["DATABASE_URL"] = f"sqlite:///{(work_dir / 'posthog.db').as_posix()}"
+        env["TRACE_SMOKE_PATHS"] = json.dumps(SMOKE_PATHS)
+        env.pop("PYTHONIMPORTTIME", None)
+
+        # The web and worker scenarios run against the migrated database
+        runs = {"migrate": run_scenario("migrate", posthog_dir, python_exe, env, work_dir)}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = {
+                scenario: pool.submit(run_scenario, scenario, posthog_dir, python_exe, env, work_dir)
+                for scenario in ("web", "worker")
+            }
+            runs.update({scenario: future.result() for scenario, future in futures.items()})
+
+    modules = {}
+    import_us = defaultdict(int)
+    for scenario, traced in runs.items():
+        for name, path in traced["modules"].items():
+            modules.setdefault(name, {"file": path, "scenarios": []})["scenarios"].append(scenario)
+        for name, self_us in traced["import_us"].items():
+            import_us[name] = max(import_us[name], self_us)
+    trace = {
+        "modules": modules,
+        "import_us": dict(import_us),
+        "distributions": runs["migrate"]["distributions"],
+    }
+    os.makedirs(TRACE_FILE.parent, exist_ok=True)
+    with open(TRACE_FILE, "w") as f:
+        json.dump(trace, f, indent=2, sort_keys=True)
+    return trace
+
+def analyze_imports(posthog_dir, python_exe=sys.executable):
+    """Derive the spec's hiddenimports and excludes from a fresh trace"""
+    trace = trace_imports(posthog_dir, python_exe)
+    traced_packages = {name.split(".")[0] for name in trace["modules"]}
+
+    excludes = EXCLUDE_PACKAGES - traced_packages
+    # Only reported: PyInstaller's own analysis and hooks decide about these
+    untraced = {package for package in trace["distributions"] if package.isidentifier()} - traced_packages
+
+    analysis = {
+        "hiddenimports": sorted(trace["modules"]),
+        "excludes": sorted(excludes),
+        "untraced": sorted(untraced - excludes),
+    }
+    with open(ANALYSIS_FILE, "w") as f:
+        json.dump(analysis, f, indent=2)
+    print(f"Traced {len(analysis['hiddenimports'])} modules from {len(traced_packages)} packages, "
+          f"excluding {len(analysis['excludes'])} unused packages, "
+          f"{len(analysis['untraced'])} installed packages were not imported by the trace")
+    return analysis
+
+def package_of(entry_type, name):
+    """Top-level package a collected file belongs to"""
+    if entry_type == "pure":
+        return name.split(".")[0]
+    parts = name.replace("\\", "/").split("/")
+    # Extension modules are collected as package/module.pyd
+    return parts[0].split(".")[0] if len(parts) == 1 else parts[0]
+
+def report_contents(top=25):
+    """Print which packages the build's size and import time come from"""
+    if not CONTENTS_FILE.exists():
+        raise ImportAnalysisError(f"{CONTENTS_FILE} is missing, it is written when PyInstaller runs the spec")
+    with open(CONTENTS_FILE) as f:
+        contents = json.load(f)
+    with open(TRACE_FILE) as f:
+        trace = json.load(f)
+
+    packages = defaultdict(lambda: {"bytes": 0, "files": 0, "import_ms": 0.0})
+    for entry_type, entries in contents.items():
+        for name, path in entries:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            package = packages[package_of(entry_type, name)]
+            package["bytes"] += size
+            package["files"] += 1
+    for module, self_us in trace["import_us"].items():
+        packages[module.split(".")[0]]["import_ms"] += self_us / 1000
+
+    total_bytes = sum(package["bytes"] for package in packages.values())
+    total_ms = sum(package["import_ms"] for package in packages.values())
+    with open(REPORT_FILE, "w") as f:
+        json.dump({"bytes": total_bytes, "import_ms": total_ms, "packages": packages}, f, indent=2, sort_keys=True)
+
+    print(f"\nBuild contents: {total_bytes / 1e6:.1f} MB, {total_ms:.0f} ms of imports during the trace")
+    print(f"  {'package':<30} {'size':>10} {'files':>7} {'import':>9}")
+    ranked = sorted(
+        (item for item in packages.items() if item[1]["bytes"] or item[1]["import_ms"] >= 1),
+        key=lambda item: (item[1]["bytes"], item[1]["import_ms"]),
+        reverse=True
+    )
+    for name, package in ranked[:top]:
+        print(f"  {name:<30} {package['bytes'] / 1e6:8.1f}MB {package['files']:7} {package['import_ms']:7.0f}ms")
+    print(f"Full report written to {REPORT_FILE}")
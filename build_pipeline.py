@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# Build step engine for the PostHog Windows builds
+# Each step declares the steps it depends on and the files it reads and
+# writes. Steps whose dependencies are done run in parallel, and a step is
+# skipped when its inputs, its code and its dependencies' outputs hash the
+# same as on its last successful run and its outputs are still in place.
+# Wall-clock and CPU time per step are written to a report
+
+import os
+import json
+import time
+import hashlib
+import inspect
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Each build script keeps its own state and report, they share step names
+STATE_FILE = "build/pipeline-state-{pipeline}.json"
+REPORT_FILE = "build/pipeline-report-{pipeline}.json"
+
+# Generated caches that don't make an input or output different
+IGNORED_NAMES = {"__pycache__", ".git"}
+
+# CPU time of child processes, per step thread
+step_local = threading.local()
+
+class PipelineError(Exception):
+    pass
+
+def step(name, run, deps=(), inputs=(), outputs=(), params=()):
+    """Describe a build step; run() raises or returns False when it fails"""
+    return {
+        "name": name,
+        "run": run,
+        "deps": list(deps),
+        "inputs": [Path(path) for path in inputs],
+        "outputs": [Path(path) for path in outputs],
+        "params": [str(param) for param in params],
+    }
+
+def fingerprint_paths(paths, content=True):
+    """Hash files and directory trees; tree files are hashed by size and mtime"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(str(path).encode())
+        if path.is_file():
+            if content:
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            else:
+                st = path.stat()
+                digest.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        elif path.is_dir():
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(name for name in dirnames if name not in IGNORED_NAMES)
+                for filename in sorted(filenames):
+                    file_path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                    digest.update(f"{os.path.relpath(file_path, path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+        else:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+def input_hash(item, dep_outputs):
+    """Hash everything a step's result depends on"""
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(item["run"]).encode())
+    except (OSError, TypeError):
+        digest.update(repr(item["run"]).encode())
+    digest.update("\0".join(item["params"]).encode())
+    digest.update(fingerprint_paths(item["inputs"]).encode())
+    for dep in item["deps"]:
+        digest.update(f"{dep}:{dep_outputs.get(dep)}".encode())
+    return digest.hexdigest()
+
+def load_json(path):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_json(path, data):
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def child_cpu_posix(process):
+    """Wait for a child and return its CPU time including its own children"""
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return usage.ru_utime + usage.ru_stime
+
+def windows_kernel32():
+    """kernel32 with the prototypes the job object accounting uses"""
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+    kernel32.CreateJobObjectW.argtypes = [wintypes.LPVOID, wintypes.LPCWSTR]
+    kernel32.AssignProcessToJobObject.argtypes = [wintypes.HANDLE, wintypes.HANDLE]
+    kernel32.QueryInformationJobObject.argtypes = [
+        wintypes.HANDLE, ctypes.c_int, wintypes.LPVOID, wintypes.DWORD, wintypes.LPDWORD
+    ]
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+    kernel32.Thread32First.argtypes = [wintypes.HANDLE, wintypes.LPVOID]
+    kernel32.Thread32Next.argtypes = [wintypes.HANDLE, wintypes.LPVOID]
+    kernel32.OpenThread.restype = wintypes.HANDLE
+    kernel32.OpenThread.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+    kernel32.ResumeThread.restype = wintypes.DWORD
+    kernel32.ResumeThread.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    return kernel32
+
+def resume_process_windows(kernel32, pid):
+    """Resume the main thread of a process created with CREATE_SUSPENDED"""
+    import ctypes
+    from ctypes import wintypes
+
+    class THREADENTRY32(ctypes.Structure):
+        _fields_ = [
+            ("dwSize", wintypes.DWORD),
+            ("cntUsage", wintypes.DWORD),
+            ("th32ThreadID", wintypes.DWORD),
+            ("th32OwnerProcessID", wintypes.DWORD),
+            ("tpBasePri", wintypes.LONG),
+            ("tpDeltaPri", wintypes.LONG),
+            ("dwFlags", wintypes.DWORD),
+        ]
+
+    TH32CS_SNAPTHREAD = 0x4
+    THREAD_SUSPEND_RESUME = 0x2
+    # subprocess closes the thread handle CreateProcess returns, so the
+    # thread is found through a snapshot of the system's threads
+    snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPTHREAD, 0)
+    if snapshot in (None, wintypes.HANDLE(-1).value):
+        raise ctypes.WinError(ctypes.get_last_error())
+    resumed = 0
+    try:
+        entry = THREADENTRY32(dwSize=ctypes.sizeof(THREADENTRY32))
+        found = kernel32.Thread32First(snapshot, ctypes.byref(entry))
+        while found:
+            if entry.th32OwnerProcessID == pid:
+                thread = kernel32.OpenThread(THREAD_SUSPEND_RESUME, False, entry.th32ThreadID)
+                if not thread:
+                    raise ctypes.WinError(ctypes.get_last_error())
+                try:
+                    if kernel32.ResumeThread(thread) == 0xFFFFFFFF:
+                        raise ctypes.WinError(ctypes.get_last_error())
+                finally:
+                    kernel32.CloseHandle(thread)
+                resumed += 1
+            found = kernel32.Thread32Next(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+    if not resumed:
+        raise OSError(f"Found no thread to resume in process {pid}")
+
+def start_process_windows(command, cwd=None):
+    """Start a shell command in a new job object, returning the process and the job.
+
+    The child is created suspended and only resumed once it belongs to the
+    job, so the processes it starts are accounted to the job from the first
+    instruction on. Without a job the child runs unaccounted"""
+    CREATE_SUSPENDED = 0x4
+    kernel32 = windows_kernel32()
+    job = kernel32.CreateJobObjectW(None, None)
+    if not job:
+        return subprocess.Popen(command, shell=True, cwd=cwd), None
+    try:
+        process = subprocess.Popen(command, shell=True, cwd=cwd, creationflags=CREATE_SUSPENDED)
+    except BaseException:
+        kernel32.CloseHandle(job)
+        raise
+    try:
+        if not kernel32.AssignProcessToJobObject(job, int(process._handle)):
+            kernel32.CloseHandle(job)
+            job = None
+        resume_process_windows(kernel32, process.pid)
+    except BaseException:
+        process.kill()
+        process.wait()
+        if job:
+            kernel32.CloseHandle(job)
+        raise
+    return process, job
+
+def child_cpu_windows(process, job):
+    """Wait for a child and return the CPU time of its whole process tree"""
+    import ctypes
+    from ctypes import wintypes
+
+    class JOBOBJECT_BASIC_ACCOUNTING_INFORMATION(ctypes.Structure):
+        _fields_ = [
+            ("TotalUserTime", ctypes.c_int64),
+            ("TotalKernelTime", ctypes.c_int64),
+            ("ThisPeriodTotalUserTime", ctypes.c_int64),
+            ("ThisPeriodTotalKernelTime", ctypes.c_int64),
+            ("TotalPageFaultCount", wintypes.DWORD),
+            ("TotalProcesses", wintypes.DWORD),
+            ("ActiveProcesses", wintypes.DWORD),
+            ("TotalTerminatedProcesses", wintypes.DWORD),
+        ]
+
+    if job is None:
+        process.wait()
+        return 0.0
+    kernel32 = windows_kernel32()
+    try:
+        process.wait()
+        info = JOBOBJECT_BASIC_ACCOUNTING_INFORMATION()
+        kernel32.QueryInformationJobObject(job, 1, ctypes.byref(info), ctypes.sizeof(info), None)
+    finally:
+        kernel32.CloseHandle(job)
+    return (info.TotalUserTime + info.TotalKernelTime) / 1e7
+
+def run_process(command, cwd=None):
+    """Run a shell command like subprocess.run(check=True), accounting its CPU to the step"""
+    if os.name == "nt":
+        process, job = start_process_windows(command, cwd)
+    else:
+        process, job = subprocess.Popen(command, shell=True, cwd=cwd), None
+    try:
+        cpu = child_cpu_windows(process, job) if os.name == "nt" else child_cpu_posix(process)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    step_local.child_cpu = getattr(step_local, "child_cpu", 0.0) + cpu
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return subprocess.CompletedProcess(command, process.returncode)
+
+def select_steps(steps, targets):
+    """Return the steps needed for targets, in declaration order"""
+    by_name = {item["name"]: item for item in steps}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise PipelineError(f"Unknown build steps: {', '.join(unknown)} (available: {', '.join(by_name)})")
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(by_name[name]["deps"])
+    return [item for item in steps if item["name"] in needed]
+
+def execute_step(item, dep_outputs, state, force):
+    """Run one step unless it is up to date, returning its report entry"""
+    began = time.monotonic()
+    cpu_began = time.thread_time()
+    step_local.child_cpu = 0.0
+    digest = input_hash(item, dep_outputs)
+    previous = state.get(item["name"], {})
+    if (
+        not force
+        and previous.get("input_hash") == digest
+        and previous.get("output_hash") == fingerprint_paths(item["outputs"], content=False)
+        and all(path.exists() for path in item["outputs"])
+    ):
+        return {"status": "skipped", "input_hash": digest, "output_hash": previous["output_hash"],
+                "wall_seconds": time.monotonic() - began, "cpu_seconds": 0.0, "child_cpu_seconds": 0.0}
+
+    print(f"==> {item['name']}")
+    status, error = "ran", None
+    try:
+        if item["run"]() is False:
+            status, error = "failed", "step reported failure"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    entry = {
+        "status": status,
+        "input_hash": digest,
+        "output_hash": fingerprint_paths(item["outputs"], content=False),
+        "wall_seconds": time.monotonic() - began,
+        "cpu_seconds": time.thread_time() - cpu_began + step_local.child_cpu,
+        "child_cpu_seconds": step_local.child_cpu,
+    }
+    if error:
+        entry["error"] = error
+        print(f"==> {item['name']} failed: {error}")
+    return entry
+
+def state_file(pipeline):
+    return Path(STATE_FILE.format(pipeline=pipeline))
+
+def report_file(pipeline):
+    return Path(REPORT_FILE.format(pipeline=pipeline))
+
+def run_pipeline(steps, pipeline, targets=None, force=False, jobs=None):
+    """Run the steps needed for targets, independent ones in parallel"""
+    steps = select_steps(steps, targets) if targets else steps
+    state = load_json(state_file(pipeline))
+    report = {}
+    dep_outputs = {}
+    began = time.monotonic()
+    cpu_began = time.process_time()
+
+    names = {item["name"] for item in steps}
+    for item in steps:
+        missing = [dep for dep in item["deps"] if dep not in names]
+        if missing:
+            raise PipelineError(f"Step {item['name']} depends on unknown steps: {', '.join(missing)}")
+
+    pending = {item["name"]: item for item in steps}
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or len(steps) or 1) as pool:
+        while pending or running:
+            progressed = False
+            for name, item in list(pending.items()):
+                dep_status = [report[dep]["status"] for dep in item["deps"] if dep in report]
+                if any(status in ("failed", "blocked") for status in dep_status):
+                    report[name] = {"status": "blocked", "wall_seconds": 0.0, "cpu_seconds": 0.0, "child_cpu_seconds": 0.0}
+                elif len(dep_status) == len(item["deps"]):
+                    running[pool.submit(execute_step, item, dict(dep_outputs), state, force)] = name
+                else:
+                    continue
+                del pending[name]
+                progressed = True
+            if not running:
+                if not progressed:
+                    raise PipelineError(f"Dependency cycle between build steps: {', '.join(pending)}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                report[name] = future.result()
+                dep_outputs[name] = report[name]["output_hash"]
+                if report[name]["status"] != "failed":
+                    state[name] = {key: report[name][key] for key in ("input_hash", "output_hash")}
+                    save_json(state_file(pipeline), state)
+
+    total_wall = time.monotonic() - began
+    # This process on all threads, plus every child process the steps ran
+    total_cpu = time.process_time() - cpu_began + sum(entry["child_cpu_seconds"] for entry in report.values())
+    print_report(steps, report, total_wall, total_cpu)
+    save_json(report_file(pipeline), {"steps": report, "wall_seconds": total_wall, "cpu_seconds": total_cpu})
+    return all(entry["status"] in ("ran", "skipped") for entry in report.values())
+
+def print_report(steps, report, total_wall, total_cpu):
+    print("\nBuild steps:")
+    print(f"  {'step':<20} {'status':<8} {'wall':>8} {'cpu':>8}")
+    for item in steps:
+        entry = report[item["name"]]
+        print(f"  {item['name']:<20} {entry['status']:<8} {entry['wall_seconds']:7.1f}s {entry['cpu_seconds']:7.1f}s")
+    step_wall = sum(entry["wall_seconds"] for entry in report.values())
+    parallelism = f", {step_wall / total_wall:.1f}x parallel" if total_wall >= 1 else ""
+    print(f"  {'total':<20} {'':<8} {total_wall:7.1f}s {total_cpu:7.1f}s (steps {step_wall:.1f}s{parallelism})")
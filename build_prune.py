@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# Plugin server pruning for the PostHog Windows builds
+# Follows require() and import statements from the plugin server's dist
+# files through node_modules the way Node resolves them, and writes a
+# node_modules with only the files that can be loaded. Packages are laid out
+# flat with one copy per version, instead of pnpm's symlinked store that the
+# installer would otherwise copy once per link. Optionally the plugin server
+# is bundled into a single file with esbuild. The startup time of the plugin
+# server is measured before and after
+#
+# Packages whose code requires computed paths or reads files next to itself
+# can't be followed statically; those are kept whole, minus tests, docs and
+# source maps
+
+import os
+import re
+import json
+import time
+import shutil
+import statistics
+import subprocess
+from pathlib import Path
+from collections import defaultdict, deque
+
+from build_staging import place_file, scan_tree
+
+# POSTHOG_BUILD_BUNDLE_PLUGIN_SERVER=1 also bundles dist/index.js with esbuild
+BUNDLE = os.environ.get("POSTHOG_BUILD_BUNDLE_PLUGIN_SERVER", "") not in ("", "0")
+REPORT_FILE = Path("build/plugin-server-prune.json")
+STARTUP_RUNS = 3
+STARTUP_TIMEOUT = 120
+
+BUILTIN_MODULES = {
+    "assert", "async_hooks", "buffer", "child_process", "cluster", "console", "constants",
+    "crypto", "dgram", "diagnostics_channel", "dns", "domain", "events", "fs", "http", "http2",
+    "https", "inspector", "module", "net", "os", "path", "perf_hooks", "process", "punycode",
+    "querystring", "readline", "repl", "stream", "string_decoder", "sys", "timers", "tls",
+    "trace_events", "tty", "url", "util", "v8", "vm", "wasi", "worker_threads", "zlib",
+}
+# Tried in this order for a path without a matching file, like Node does
+EXTENSIONS = ["", ".js", ".json", ".node", ".cjs", ".mjs"]
+SCANNED_EXTENSIONS = {".js", ".cjs", ".mjs"}
+EXPORT_CONDITIONS = {"node", "require", "import", "default"}
+
+# Never needed at runtime in packages that are kept whole
+JUNK_DIRS = {
+    "test", "tests", "__tests__", "__mocks__", "spec", "fixtures", "example", "examples",
+    "doc", "docs", "benchmark", "benchmarks", "coverage", ".github", ".vscode",
+}
+JUNK_EXTENSIONS = {".map", ".md", ".markdown", ".ts", ".tsx", ".flow", ".coffee", ".tgz"}
+# Kept for every package that ships anything
+LICENSE_PREFIXES = ("license", "licence", "notice", "copying")
+
+SPECIFIER_PATTERNS = [
+    re.compile(r"""\brequire(?:\.resolve)?\s*\(\s*(['"`])([^'"`$]+)\1\s*\)"""),
+    re.compile(r"""\b(?:import|export)\s[^;'"`]*?\bfrom\s*(['"])([^'"]+)\1"""),
+    re.compile(r"""\bimport\s*(?:\(\s*)?(['"])([^'"]+)\1"""),
+]
+# A require() of anything but a plain string, or code that locates files itself
+DYNAMIC_PATTERN = re.compile(r"""\brequire\s*\(\s*(?!(['"`])[^'"`$]*\1\s*\))(?!\))|\b__dirname\b|\b__filename\b|\bimport\.meta\.url\b""")
+
+START_PROBE = """\
+const began = process.hrtime.bigint();
+setImmediate(() => {
+    process.stdout.write(`STARTUP_MS ${Number(process.hrtime.bigint() - began) / 1e6}\\n`);
+    process.exit(0);
+});
+"""
+
+class PruneError(Exception):
+    pass
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def split_specifier(specifier):
+    """Split a bare specifier into its package name and subpath"""
+    parts = specifier.split("/")
+    count = 2 if specifier.startswith("@") else 1
+    return "/".join(parts[:count]), "/".join(parts[count:])
+
+def is_builtin(specifier):
+    if specifier.startswith("node:"):
+        return True
+    return specifier.split("/")[0] in BUILTIN_MODULES
+
+class Resolver:
+    """Node's module resolution over real paths, so pnpm's links are followed"""
+
+    def __init__(self):
+        self.package_roots = {}
+        self.manifests = {}
+
+    def manifest(self, root):
+        if root not in self.manifests:
+            self.manifests[root] = read_json(os.path.join(root, "package.json")) or {}
+        return self.manifests[root]
+
+    def package_root(self, path):
+        """Nearest directory above path with a package.json naming a package"""
+        directory = os.path.dirname(path)
+        if directory in self.package_roots:
+            return self.package_roots[directory]
+        root = None
+        candidate = directory
+        while True:
+            if os.path.isfile(os.path.join(candidate, "package.json")) and self.manifest(candidate).get("name"):
+                root = candidate
+                break
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+        self.package_roots[directory] = root
+        return root
+
+    def resolve_file(self, path):
+        for extension in EXTENSIONS:
+            if os.path.isfile(path + extension):
+                return [os.path.realpath(path + extension)]
+        if os.path.isdir(path):
+            main = (read_json(os.path.join(path, "package.json")) or {}).get("main")
+            if isinstance(main, str):
+                found = self.resolve_file(os.path.join(path, main))
+                if found:
+                    return found
+            for extension in EXTENSIONS[1:]:
+                index = os.path.join(path, "index" + extension)
+                if os.path.isfile(index):
+                    return [os.path.realpath(index)]
+        return []
+
+    def export_targets(self, value):
+        """Every file an exports entry can point at, for any runtime condition"""
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, list):
+            return [target for item in value for target in self.export_targets(item)]
+        if isinstance(value, dict):
+            return [
+                target for key, item in value.items() if key in EXPORT_CONDITIONS
+                for target in self.export_targets(item)
+            ]
+        return []
+
+    def resolve_exports(self, package_dir, exports, subpath):
+        key = "./" + subpath if subpath else "."
+        if not isinstance(exports, dict) or not any(name.startswith(".") for name in exports):
+            exports = {".": exports}
+        targets = []
+        if key in exports:
+            targets = self.export_targets(exports[key])
+        else:
+            for pattern, value in exports.items():
+                prefix, star, suffix = pattern.partition("*")
+                if star and key.startswith(prefix) and key.endswith(suffix) and len(key) >= len(prefix) + len(suffix):
+                    match = key[len(prefix):len(key) - len(suffix)]
+                    targets = [target.replace("*", match) for target in self.export_targets(value)]
+                    break
+        return [
+            os.path.realpath(os.path.join(package_dir, target))
+            for target in targets if os.path.isfile(os.path.join(package_dir, target))
+        ]
+
+    def resolve(self, specifier, from_file):
+        """Return (package directory name, files) for a specifier, or None"""
+        specifier = specifier.split("?")[0]
+        directory = os.path.dirname(from_file)
+        if specifier.startswith((".", "/")):
+            found = self.resolve_file(os.path.normpath(os.path.join(directory, specifier)))
+            return (None, found) if found else None
+        if is_builtin(specifier):
+            return None
+        name, subpath = split_specifier(specifier)
+        while True:
+            package_dir = os.path.join(directory, "node_modules", name)
+            if os.path.isdir(package_dir):
+                package_dir = os.path.realpath(package_dir)
+                exports = self.manifest(package_dir).get("exports")
+                found = self.resolve_exports(package_dir, exports, subpath) if exports is not None else []
+                found = found or self.resolve_file(os.path.join(package_dir, subpath) if subpath else package_dir)
+                if found:
+                    return name, found
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+
+def scan_source(path):
+    """Return the specifiers a file loads and whether it loads computed paths"""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return [], False
+    specifiers = [match.group(2) for pattern in SPECIFIER_PATTERNS for match in pattern.finditer(source)]
+    return specifiers, bool(DYNAMIC_PATTERN.search(source))
+
+def walk_graph(plugin_server_dir):
+    """Find every file reachable from the plugin server's dist files"""
+    resolver = Resolver()
+    root = os.path.realpath(plugin_server_dir)
+    dist_dir = os.path.join(root, "dist")
+    entries = [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(dist_dir)
+        for filename in filenames if os.path.splitext(filename)[1] in SCANNED_EXTENSIONS
+    ]
+    if not entries:
+        raise PruneError(f"No plugin server code in {dist_dir}, build the plugin server first")
+
+    files = defaultdict(set)          # package root -> reachable files
+    whole = set()                     # package roots kept whole
+    edges = defaultdict(set)          # package root -> {(name, dependency root)}
+    unresolved = set()
+    seen = set()
+    queue = deque(entries)
+
+    while queue:
+        path = queue.popleft()
+        if path in seen:
+            continue
+        seen.add(path)
+        package_root = resolver.package_root(path) or root
+        if package_root != root:
+            files[package_root].add(path)
+        if os.path.splitext(path)[1] not in SCANNED_EXTENSIONS:
+            continue
+        specifiers, dynamic = scan_source(path)
+        if dynamic and package_root not in whole:
+            # Keep the package and everything it declares it may load
+            whole.add(package_root)
+            manifest = resolver.manifest(package_root)
+            for section in ("dependencies", "optionalDependencies", "peerDependencies"):
+                specifiers.extend((manifest.get(section) or {}).keys())
+        for specifier in specifiers:
+            result = resolver.resolve(specifier, path)
+            if result is None:
+                if not specifier.startswith((".", "/")) and not is_builtin(specifier):
+                    unresolved.add(specifier)
+                continue
+            name, found = result
+            for target in found:
+                target_root = resolver.package_root(target) or root
+                if name and target_root != package_root:
+                    edges[package_root].add((name, target_root))
+                queue.append(target)
+    return resolver, root, files, whole, edges, unresolved
+
+def layout_packages(root, edges):
+    """Place packages in a flat node_modules tree, nesting only conflicting versions"""
+    placements = {}                   # location (tuple of names) -> package root
+    queue = deque([(root, ())])
+    while queue:
+        package_root, location = queue.popleft()
+        placed = []
+        # Claim every direct dependency first, so nested copies are in place
+        # before anything deeper looks them up
+        for name, dependency in sorted(edges[package_root]):
+            found = None
+            for depth in range(len(location), -1, -1):
+                key = location[:depth] + (name,)
+                if key in placements:
+                    found = placements[key]
+                    break
+            if found == dependency:
+                continue
+            key = (name,) if found is None else location + (name,)
+            placements[key] = dependency
+            placed.append((dependency, key))
+        queue.extend(placed)
+    return placements
+
+def is_junk(rel_path):
+    parts = rel_path.lower().split("/")
+    return any(part in JUNK_DIRS for part in parts[:-1]) or os.path.splitext(parts[-1])[1] in JUNK_EXTENSIONS
+
+def package_files(package_root, reachable, keep_whole):
+    """Relative paths of the files to ship for one package"""
+    keep = set()
+    for dirpath, dirnames, filenames in os.walk(package_root):
+        # Nested node_modules belong to other packages
+        dirnames[:] = [name for name in dirnames if name != "node_modules"]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, package_root).replace(os.sep, "/")
+            if keep_whole:
+                if not is_junk(rel_path):
+                    keep.add(rel_path)
+            elif (
+                path in reachable
+                or filename == "package.json"
+                or filename.endswith(".node")
+                or (dirpath == package_root and filename.lower().startswith(LICENSE_PREFIXES))
+            ):
+                # package.json files decide how Node resolves and loads the
+                # code, and native addons are found through computed paths
+                keep.add(rel_path)
+    return keep
+
+def write_tree(plugin_server_dir, out_dir, files, whole, placements):
+    """Write dist and the pruned node_modules to out_dir"""
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    shutil.copytree(plugin_server_dir / "dist", out_dir / "dist")
+    shutil.copy2(plugin_server_dir / "package.json", out_dir / "package.json")
+
+    contents = {}
+    for package_root in set(placements.values()):
+        contents[package_root] = package_files(package_root, files[package_root], package_root in whole)
+
+    for location, package_root in sorted(placements.items()):
+        dest_dir = out_dir.joinpath(*[part for name in location for part in ("node_modules", name)])
+        for rel_path in sorted(contents[package_root]):
+            src = os.path.join(package_root, rel_path)
+            dest = dest_dir / rel_path
+            os.makedirs(dest.parent, exist_ok=True)
+            place_file(src, dest)
+
+def bundle(out_dir, esbuild):
+    """Bundle dist/index.js and what it loads statically into one file"""
+    index = out_dir / "dist" / "index.js"
+    bundled = out_dir / "dist" / "index.bundle.js"
+    command = [
+        esbuild, str(index), "--bundle", "--platform=node", "--target=node18", "--log-level=warning",
+        # Native addons and optional dependencies that aren't installed stay
+        # regular requires, resolved from the pruned node_modules at runtime
+        "--external:*.node", f"--outfile={bundled}",
+    ]
+    print(f"Running: {' '.join(command)}")
+    subprocess.run(command, check=True)
+    os.replace(bundled, index)
+
+def find_esbuild(plugin_server_dir):
+    for name in ("esbuild.cmd", "esbuild") if os.name == "nt" else ("esbuild",):
+        path = plugin_server_dir / "node_modules" / ".bin" / name
+        if path.exists():
+            return str(path)
+    return shutil.which("esbuild")
+
+def measure_startup(plugin_server_dir, node_exe, runs=STARTUP_RUNS):
+    """Median time in ms from process start until dist/index.js and everything
+    it loads synchronously has been evaluated, or None if it didn't get there"""
+    probe = REPORT_FILE.parent / "startup-probe.js"
+    os.makedirs(probe.parent, exist_ok=True)
+    with open(probe, "w") as f:
+        f.write(START_PROBE)
+    timings = []
+    for _ in range(runs):
+        try:
+            result = subprocess.run(
+                [node_exe, "--require", str(probe.resolve()), os.path.join("dist", "index.js")],
+                cwd=plugin_server_dir,
+                capture_output=True,
+                text=True,
+                errors="replace",
+                timeout=STARTUP_TIMEOUT
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"Could not time plugin server startup: {e}")
+            return None
+        match = re.search(r"^STARTUP_MS ([\d.]+)$", result.stdout, re.MULTILINE)
+        if not match:
+            lines = result.stderr.strip().splitlines()
+            error = next((line for line in lines if "Error" in line), lines[-1] if lines else "no output")
+            print(f"Plugin server in {plugin_server_dir} exited before starting: {error.strip()}")
+            return None
+        timings.append(float(match.group(1)))
+    return statistics.median(timings)
+
+def tree_size(root):
+    """(files, bytes) of a tree as it would be copied, links followed"""
+    files = scan_tree(root) if root.exists() else {}
+    return len(files), sum(st.st_size for st in files.values())
+
+def prune_plugin_server(plugin_server_dir, out_dir, node_exe="node", bundle_code=BUNDLE):
+    """Write a pruned copy of the plugin server to out_dir and report the savings"""
+    began = time.monotonic()
+    plugin_server_dir, out_dir = Path(plugin_server_dir), Path(out_dir)
+    resolver, root, files, whole, edges, unresolved = walk_graph(plugin_server_dir)
+    placements = layout_packages(root, edges)
+    write_tree(plugin_server_dir, out_dir, files, whole, placements)
+
+    if bundle_code:
+        esbuild = find_esbuild(plugin_server_dir)
+        if not esbuild:
+            raise PruneError("POSTHOG_BUILD_BUNDLE_PLUGIN_SERVER is set but esbuild isn't installed")
+        bundle(out_dir, esbuild)
+
+    before_files, before_bytes = tree_size(plugin_server_dir / "node_modules")
+    after_files, after_bytes = tree_size(out_dir / "node_modules")
+    versions = defaultdict(set)
+    for package_root in placements.values():
+        versions[resolver.manifest(package_root).get("name")].add(package_root)
+    report = {
+        "packages": len(set(placements.values())),
+        "packages_kept_whole": len(whole & set(placements.values())),
+        "duplicate_versions": sum(len(roots) - 1 for roots in versions.values()),
+        "nested_copies": len(placements) - len(set(placements.values())),
+        "unresolved": sorted(unresolved),
+        "bundled": bool(bundle_code),
+        "before": {"files": before_files, "bytes": before_bytes},
+        "after": {"files": after_files, "bytes": after_bytes},
+        "startup_ms": {
+            "before": measure_startup(plugin_server_dir, node_exe),
+            "after": measure_startup(out_dir, node_exe),
+        },
+        "seconds": round(time.monotonic() - began, 1),
+    }
+    os.makedirs(REPORT_FILE.parent, exist_ok=True)
+    with open(REPORT_FILE, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Pruned plugin server node_modules to {report['packages']} packages "
+          f"({report['packages_kept_whole']} kept whole, {report['duplicate_versions']} duplicate versions)")
+    print(f"  files: {before_files} -> {after_files} ({before_files - after_files} fewer)")
+    print(f"  size:  {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e6:.1f} MB "
+          f"({(before_bytes - after_bytes) / 1e6:.1f} MB saved)")
+    startup = report["startup_ms"]
+    if startup["before"] is not None and startup["after"] is not None:
+        print(f"  startup: {startup['before']:.0f} ms -> {startup['after']:.0f} ms")
+    if unresolved:
+        print(f"  {len(unresolved)} imports couldn't be resolved (optional dependencies?): "
+              f"{', '.join(sorted(unresolved)[:10])}")
+    return report
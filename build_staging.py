@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Incremental staging for the PostHog Windows build
+# Mirrors source trees into the distribution directory, copying only files
+# that changed since the last build. A manifest per tree records the size,
+# mtime and SHA-256 of every staged file, so unchanged files are skipped
+# without reading them and files deleted upstream are removed from staging
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_DIR = Path("build/staging")
+
+# POSTHOG_BUILD_LINK_MODE=copy always copies; the default "auto" clones the
+# file where the filesystem supports it, then tries a hardlink, then copies
+LINK_MODE = os.environ.get("POSTHOG_BUILD_LINK_MODE", "auto")
+
+CHUNK_SIZE = 1024 * 1024
+MAX_STAGING_THREADS = min(32, (os.cpu_count() or 1) * 4)
+
+# Linux ioctl that makes dest share src's extents (btrfs, XFS)
+FICLONE = 0x40049409
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(path):
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+def save_manifest(path, manifest):
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp_path, path)
+
+def scan_tree(root):
+    """Return {relative path: os.stat_result} for every file under root"""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                files[os.path.relpath(path, root).replace(os.sep, "/")] = os.stat(path)
+            except FileNotFoundError:
+                # Dangling symlink
+                continue
+    return files
+
+def reflink(src, dest):
+    """Clone src to dest without copying data, where the filesystem allows it"""
+    import fcntl
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dest)
+
+def place_file(src, dest):
+    """Put src at dest, returning how it was placed"""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if LINK_MODE == "auto":
+        if os.name != "nt":
+            try:
+                reflink(src, dest)
+                return "cloned"
+            except (OSError, ImportError):
+                if os.path.exists(dest):
+                    os.remove(dest)
+        try:
+            os.link(src, dest)
+            return "linked"
+        except OSError:
+            pass
+    shutil.copy2(src, dest)
+    return "copied"
+
+def stage_file(src_root, dest_root, rel_path, st, previous):
+    """Bring one file up to date, returning its manifest entry and the action"""
+    src = os.path.join(src_root, rel_path)
+    dest = os.path.join(dest_root, rel_path)
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    dest_ok = os.path.isfile(dest) and os.path.getsize(dest) == st.st_size
+
+    if previous and dest_ok and previous["size"] == st.st_size:
+        # Same size and mtime: trust the manifest without reading the file
+        if previous["mtime_ns"] == st.st_mtime_ns:
+            entry["sha256"] = previous["sha256"]
+            return entry, "unchanged"
+        # Touched but maybe not modified, e.g. by a fresh checkout
+        entry["sha256"] = sha256_file(src)
+        if entry["sha256"] == previous["sha256"]:
+            return entry, "unchanged"
+    else:
+        entry["sha256"] = sha256_file(src)
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    return entry, place_file(src, dest)
+
+def remove_empty_dirs(root):
+    """Remove directories left empty after deleting stale files"""
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != str(root) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+def stage_tree(src_root, dest_root, name):
+    """Mirror src_root into dest_root, touching only what changed"""
+    began = time.monotonic()
+    manifest_path = MANIFEST_DIR / f"{name}.json"
+    previous = load_manifest(manifest_path)
+    src_files = scan_tree(src_root)
+    os.makedirs(dest_root, exist_ok=True)
+
+    if previous is None:
+        # No manifest yet, so anything in dest that isn't in src is stale
+        stale = set(scan_tree(dest_root)) - set(src_files)
+        previous = {}
+    else:
+        stale = set(previous) - set(src_files)
+
+    counts = {"unchanged": 0, "copied": 0, "cloned": 0, "linked": 0, "removed": 0}
+    manifest = {}
+    with ThreadPoolExecutor(max_workers=MAX_STAGING_THREADS) as pool:
+        futures = {
+            rel_path: pool.submit(stage_file, src_root, dest_root, rel_path, st, previous.get(rel_path))
+            for rel_path, st in src_files.items()
+        }
+        try:
+            for rel_path, future in futures.items():
+                manifest[rel_path], action = future.result()
+                counts[action] += 1
+        finally:
+            # Record whatever was staged, even if a file failed
+            save_manifest(manifest_path, manifest)
+
+    for rel_path in stale:
+        dest = os.path.join(dest_root, rel_path)
+        if os.path.lexists(dest):
+            os.remove(dest)
+            counts["removed"] += 1
+    if stale:
+        remove_empty_dirs(dest_root)
+
+    changed = counts["copied"] + counts["cloned"] + counts["linked"]
+    print(
+        f"Staged {src_root} -> {dest_root} in {time.monotonic() - began:.1f}s: "
+        f"{changed} updated ({counts['copied']} copied, {counts['cloned']} cloned, {counts['linked']} linked), "
+        f"{counts['unchanged']} unchanged, {counts['removed']} removed"
+    )
+    return counts
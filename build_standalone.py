@@ -3,13 +3,21 @@
 
 import os
 import sys
-import subprocess
 import shutil
-import zipfile
-import urllib.request
+import argparse
 import tempfile
+import time
 from pathlib import Path
 
+from build_archive import extract_archive
+from build_assets import process_assets
+from build_downloads import artifact, fetch_artifacts
+from build_files import LAUNCHER_FILES
+from build_pipeline import PipelineError, run_pipeline, run_process, step
+from build_prune import prune_plugin_server
+from build_staging import stage_tree
+from build_wheels import REQUIREMENTS_FILE, LOCK_FILE as WHEELS_LOCK_FILE, prepare_wheelhouse, install_wheels
+
 # Define paths
 POSTHOG_DIR = Path("posthog-master")
 BUILD_DIR = Path("build")
@@ -17,30 +25,31 @@ DIST_DIR = Path("dist/posthog")
 OUTPUT_DIR = Path("output")
 EMBEDDED_DIR = Path("embedded")
 SCRIPTS_DIR = Path("scripts")
+PRUNED_PLUGIN_SERVER_DIR = BUILD_DIR / "plugin-server"
+ASSETS_DIR = BUILD_DIR / "frontend-dist"
+
+# Names this script's pipeline state and report in build/
+PIPELINE = "standalone"
 
 # Define URLs for downloading bundled runtimes
 NODE_URL = "https://nodejs.org/dist/v18.19.1/node-v18.19.1-win-x64.zip"
+NODE_CHECKSUMS_URL = "https://nodejs.org/dist/v18.19.1/SHASUMS256.txt"
 PYTHON_URL = "https://www.python.org/ftp/python/3.11.9/python-3.11.9-embed-amd64.zip"
 INNO_SETUP_URL = "https://files.jrsoftware.org/is/6/innosetup-6.2.2.exe"
 POSTHOG_URL = "https://github.com/PostHog/posthog/archive/refs/heads/master.zip"
 
+# Build artifacts, fetched together through the download cache. The source
+# archive follows upstream, so it is not pinned. Node.js publishes the
+# SHA-256 of its downloads, the others are pinned in downloads.lock.json
+NODE_ARTIFACT = artifact("node", NODE_URL, BUILD_DIR / "node.zip", checksums=NODE_CHECKSUMS_URL)
+PYTHON_ARTIFACT = artifact("python", PYTHON_URL, BUILD_DIR / "python.zip")
+INNO_SETUP_ARTIFACT = artifact("innosetup", INNO_SETUP_URL, BUILD_DIR / "innosetup.exe")
+POSTHOG_ARTIFACT = artifact("posthog", POSTHOG_URL, BUILD_DIR / "posthog.zip", pin=False)
+
 def run_command(command, cwd=None):
     """Run a command and print output"""
     print(f"Running: {command}")
-    result = subprocess.run(command, shell=True, cwd=cwd, check=True)
-    return result
-
-def download_file(url, dest):
-    """Download a file from a URL to a destination"""
-    print(f"Downloading {url} to {dest}")
-    
-    # Create parent directory if it doesn't exist
-    os.makedirs(os.path.dirname(dest), exist_ok=True)
-    
-    # Download the file
-    urllib.request.urlretrieve(url, dest)
-    
-    print(f"Downloaded {url}")
+    return run_process(command, cwd=cwd)
 
 def extract_zip(zip_path, extract_to):
     """Extract a zip file to a destination"""
@@ -49,11 +58,8 @@ def extract_zip(zip_path, extract_to):
     # Create the destination directory if it doesn't exist
     os.makedirs(extract_to, exist_ok=True)
     
-    # Extract the zip file
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
-    
-    print(f"Extracted {zip_path}")
+    # Extract the zip file, streaming members on several threads
+    extract_archive(zip_path, extract_to)
 
 def setup_environment():
     """Set up the build environment"""
@@ -66,35 +72,33 @@ def setup_environment():
     os.makedirs(EMBEDDED_DIR, exist_ok=True)
     os.makedirs(SCRIPTS_DIR, exist_ok=True)
     
-    # Download PostHog source code if it doesn't exist
+    # Download everything at once, reusing the download cache
+    artifacts = [NODE_ARTIFACT, PYTHON_ARTIFACT, INNO_SETUP_ARTIFACT]
+    if not POSTHOG_DIR.exists():
+        artifacts.append(POSTHOG_ARTIFACT)
+    fetch_artifacts(artifacts)
+    
+    # Extract PostHog source code if it doesn't exist
     if not POSTHOG_DIR.exists():
-        posthog_zip = BUILD_DIR / "posthog.zip"
-        download_file(POSTHOG_URL, posthog_zip)
-        extract_zip(posthog_zip, ".")
+        extract_zip(POSTHOG_ARTIFACT["dest"], ".")
     
-    # Download Node.js
-    node_zip = BUILD_DIR / "node.zip"
-    download_file(NODE_URL, node_zip)
+    # Extract Node.js
     node_dir = EMBEDDED_DIR / "node"
     if node_dir.exists():
         shutil.rmtree(node_dir)
-    extract_zip(node_zip, EMBEDDED_DIR)
+    extract_zip(NODE_ARTIFACT["dest"], EMBEDDED_DIR)
     # Move the contents from the nested directory to node_dir
     node_extracted = list(EMBEDDED_DIR.glob("node-v*-win-x64"))[0]
     shutil.move(str(node_extracted), str(node_dir))
     
-    # Download Python
-    python_zip = BUILD_DIR / "python.zip"
-    download_file(PYTHON_URL, python_zip)
+    # Extract Python
     python_dir = EMBEDDED_DIR / "python"
     if python_dir.exists():
         shutil.rmtree(python_dir)
     os.makedirs(python_dir, exist_ok=True)
-    extract_zip(python_zip, python_dir)
+    extract_zip(PYTHON_ARTIFACT["dest"], python_dir)
     
-    # Download Inno Setup
-    inno_setup_exe = BUILD_DIR / "innosetup.exe"
-    download_file(INNO_SETUP_URL, inno_setup_exe)
+    inno_setup_exe = INNO_SETUP_ARTIFACT["dest"]
     
     # Install Inno Setup (silently)
     run_command(f'"{inno_setup_exe}" /VERYSILENT /SUPPRESSMSGBOXES /NORESTART')
@@ -109,27 +113,23 @@ def copy_posthog_files():
     os.makedirs(DIST_DIR, exist_ok=True)
     
     # Copy launcher scripts
-    shutil.copy("standalone_launcher.py", DIST_DIR)
-    shutil.copy("posthog.bat", DIST_DIR)
+    for launcher_file in LAUNCHER_FILES:
+        shutil.copy(launcher_file, DIST_DIR)
     
-    # Copy PostHog Python files
-    posthog_dir = DIST_DIR / "posthog"
-    os.makedirs(posthog_dir, exist_ok=True)
-    shutil.copytree(POSTHOG_DIR / "posthog", posthog_dir, dirs_exist_ok=True)
+    # Stage PostHog Python files, only copying what changed since the last build
+    stage_tree(POSTHOG_DIR / "posthog", DIST_DIR / "posthog", "posthog")
     
     # Copy Django management scripts
     shutil.copy(POSTHOG_DIR / "manage.py", DIST_DIR)
     
-    # Copy frontend assets
-    frontend_dist = DIST_DIR / "frontend" / "dist"
-    os.makedirs(frontend_dist, exist_ok=True)
-    shutil.copytree(POSTHOG_DIR / "frontend" / "dist", frontend_dist, dirs_exist_ok=True)
+    # Stage the precompressed frontend assets
+    stage_tree(ASSETS_DIR, DIST_DIR / "frontend" / "dist", "frontend-dist")
     
-    # Copy plugin server
+    # Stage the pruned plugin server
     plugin_server = DIST_DIR / "plugin-server"
-    os.makedirs(plugin_server, exist_ok=True)
-    shutil.copytree(POSTHOG_DIR / "plugin-server" / "dist", plugin_server / "dist", dirs_exist_ok=True)
-    shutil.copytree(POSTHOG_DIR / "plugin-server" / "node_modules", plugin_server / "node_modules", dirs_exist_ok=True)
+    stage_tree(PRUNED_PLUGIN_SERVER_DIR / "dist", plugin_server / "dist", "plugin-server-dist")
+    stage_tree(PRUNED_PLUGIN_SERVER_DIR / "node_modules", plugin_server / "node_modules", "plugin-server-node-modules")
+    shutil.copy(PRUNED_PLUGIN_SERVER_DIR / "package.json", plugin_server)
     
     # Create data directory
     data_dir = DIST_DIR / "data"
@@ -137,44 +137,47 @@ def copy_posthog_files():
     
     print("PostHog files copied")
 
+def compress_frontend_assets():
+    """Hash the frontend assets and precompress them for whitenoise"""
+    print("Compressing frontend assets...")
+    process_assets(POSTHOG_DIR / "frontend" / "dist", ASSETS_DIR)
+
+def prune_plugin_server_modules():
+    """Reduce the plugin server's node_modules to the files it can load"""
+    print("Pruning plugin server dependencies...")
+    prune_plugin_server(POSTHOG_DIR / "plugin-server", PRUNED_PLUGIN_SERVER_DIR,
+                        node_exe=EMBEDDED_DIR / "node" / "node.exe" if os.name == "nt" else "node")
+
 def install_python_dependencies():
     """Install Python dependencies to the embedded Python"""
     print("Installing Python dependencies...")
     
-    # Create a requirements file with the necessary dependencies
-    requirements = [
-        "Django~=4.2.17",
-        "dj-database-url==0.5.0",
-        "whitenoise==6.5.0",
-        "django-cors-headers==3.5.0",
-        "djangorestframework==3.15.1",
-        "celery==5.3.4",
-        "fakeredis[lua]==2.23.3",
-        "psycopg2-binary==2.9.7",
-        "python-dateutil>=2.8.2",
-        "sentry-sdk~=1.44.1",
-        "requests~=2.32.3",
-        "pillow==10.2.0",
-    ]
-    
-    with open(BUILD_DIR / "requirements.txt", "w") as f:
-        f.write("\n".join(requirements))
+    # Resolve requirements-standalone.txt through the committed lock into the
+    # wheelhouse, downloading only wheels that are missing
+    wheels = prepare_wheelhouse(REQUIREMENTS_FILE)
     
-    # Install pip to the embedded Python
+    # Unpack the wheels straight into the embedded Python's site-packages
     python_dir = EMBEDDED_DIR / "python"
-    get_pip_url = "https://bootstrap.pypa.io/get-pip.py"
-    get_pip_path = BUILD_DIR / "get-pip.py"
-    download_file(get_pip_url, get_pip_path)
-    
-    # Run get-pip.py with the embedded Python
-    python_exe = python_dir / "python.exe"
-    run_command(f'"{python_exe}" "{get_pip_path}"')
-    
-    # Install the requirements
-    run_command(f'"{python_dir / "Scripts" / "pip.exe"}" install -r "{BUILD_DIR / "requirements.txt"}" --no-warn-script-location')
+    install_wheels(wheels, python_dir / "Lib" / "site-packages", python_dir)
     
     print("Python dependencies installed")
 
+def precompile_bytecode():
+    """Compile the bundled Python sources to .pyc so startup skips compilation"""
+    print("Precompiling Python bytecode...")
+    began = time.monotonic()
+    
+    # Compile with the embedded interpreter so the .pyc files match its version.
+    # checked-hash .pyc files stay valid whatever timestamps the installer sets
+    python_exe = EMBEDDED_DIR / "python" / "python.exe"
+    site_packages = EMBEDDED_DIR / "python" / "Lib" / "site-packages"
+    run_command(
+        f'"{python_exe}" -m compileall -q -j 0 --invalidation-mode checked-hash '
+        f'-x "node_modules" "{DIST_DIR}" "{site_packages}"'
+    )
+    
+    print(f"Bytecode precompiled in {time.monotonic() - began:.1f}s")
+
 def create_license_file():
     """Create a license file for the installer"""
     license_content = """PostHog Windows Standalone Edition
@@ -222,25 +225,73 @@ def build_installer():
     print("Installer built successfully!")
     return True
 
+def build_steps():
+    """Build steps of the installer and what they read and write"""
+    python_dir = EMBEDDED_DIR / "python"
+    plugin_server_dir = POSTHOG_DIR / "plugin-server"
+    return [
+        step("setup", setup_environment,
+             inputs=["build_downloads.py", "build_archive.py"],
+             params=[NODE_URL, PYTHON_URL, INNO_SETUP_URL],
+             outputs=[EMBEDDED_DIR / "node" / "node.exe", python_dir / "python.exe", POSTHOG_DIR / "manage.py"]),
+        step("prune", prune_plugin_server_modules, deps=["setup"],
+             inputs=["build_prune.py", "build_staging.py", plugin_server_dir / "dist", plugin_server_dir / "package.json",
+                     plugin_server_dir / "node_modules"],
+             params=[os.environ.get("POSTHOG_BUILD_BUNDLE_PLUGIN_SERVER", "")],
+             outputs=[PRUNED_PLUGIN_SERVER_DIR]),
+        step("assets", compress_frontend_assets, deps=["setup"],
+             inputs=["build_assets.py", "build_archive.py", "build_staging.py", POSTHOG_DIR / "frontend" / "dist"],
+             outputs=[ASSETS_DIR]),
+        step("copy", copy_posthog_files, deps=["setup", "prune", "assets"],
+             inputs=LAUNCHER_FILES + [
+                 "build_files.py",
+                 "build_staging.py",
+                 POSTHOG_DIR / "posthog",
+                 POSTHOG_DIR / "manage.py",
+             ],
+             outputs=[DIST_DIR]),
+        step("python-deps", install_python_dependencies, deps=["setup"],
+             inputs=["build_wheels.py", "build_archive.py", "build_downloads.py", REQUIREMENTS_FILE, WHEELS_LOCK_FILE],
+             outputs=[python_dir / "Lib" / "site-packages"]),
+        step("precompile", precompile_bytecode, deps=["copy", "python-deps"]),
+        step("license", create_license_file, outputs=["LICENSE.txt"]),
+        step("installer", build_installer,
+             deps=["setup", "copy", "python-deps", "precompile", "license"],
+             inputs=["posthog_installer.iss", SCRIPTS_DIR],
+             outputs=[OUTPUT_DIR / "posthog-windows-setup.exe"]),
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the PostHog Windows standalone installer")
+    parser.add_argument("steps", nargs="*", help="only build these steps and the steps they depend on")
+    parser.add_argument("--force", action="store_true", help="run steps even if their inputs are unchanged")
+    parser.add_argument("--jobs", type=int, help="maximum number of steps running at the same time")
+    parser.add_argument("--list", action="store_true", help="list the build steps and exit")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    steps = build_steps()
+    if args.list:
+        for item in steps:
+            print(item["name"] + (f" (after {', '.join(item['deps'])})" if item["deps"] else ""))
+        return 0
+    
     print("Building PostHog Windows Standalone Executable")
     
     try:
-        setup_environment()
-        copy_posthog_files()
-        install_python_dependencies()
-        create_license_file()
-        
-        if build_installer():
-            print("\nBuild completed successfully!")
-            print(f"The installer is available at: {OUTPUT_DIR / 'posthog-windows-setup.exe'}")
-        else:
-            print("\nBuild failed to create the installer. See errors above.")
-    except Exception as e:
+        succeeded = run_pipeline(steps, PIPELINE, args.steps, force=args.force, jobs=args.jobs)
+    except PipelineError as e:
         print(f"Error during build: {e}")
         return 1
     
+    if not succeeded:
+        print("\nBuild failed. See errors above.")
+        return 1
+    print("\nBuild completed successfully!")
+    if not args.steps or "installer" in args.steps:
+        print(f"The installer is available at: {OUTPUT_DIR / 'posthog-windows-setup.exe'}")
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
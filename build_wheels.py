@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# Wheelhouse for the embedded Python of the PostHog Windows build
+# Installs the wheels locked in the committed requirements.lock.json, which
+# is resolved from requirements-standalone.txt with their SHA-256. The wheels
+# are kept in a local wheelhouse and unpacked in parallel straight into
+# site-packages, without pip, PyPI or the network once the wheelhouse is
+# filled. POSTHOG_BUILD_UPDATE_LOCK=1 resolves the requirements again
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import base64
+import shutil
+import hashlib
+import zipfile
+import subprocess
+import configparser
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from build_archive import extract_file, member_path
+from build_downloads import OFFLINE, UPDATE_LOCK
+
+WHEELHOUSE_DIR = Path("build/wheelhouse")
+REQUIREMENTS_FILE = Path("requirements-standalone.txt")
+LOCK_FILE = Path("requirements.lock.json")
+INSTALLER_NAME = "posthog-build"
+
+# Wheels are resolved for the embedded interpreter, not the one running the build
+TARGET_ARGS = [
+    "--platform", "win_amd64",
+    "--python-version", "3.11",
+    "--implementation", "cp",
+    "--only-binary=:all:",
+]
+
+MAX_INSTALL_THREADS = os.cpu_count() or 1
+
+# Written next to each console script, which a .cmd file in Scripts runs
+SCRIPT_TEMPLATE = """import re
+import sys
+from {module} import {name}
+if __name__ == '__main__':
+    sys.argv[0] = re.sub(r'(-script\\.pyw?|\\.cmd)?$', '', sys.argv[0])
+    sys.exit({function}())
+"""
+
+class WheelError(Exception):
+    pass
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_requirements(path):
+    """Requirement lines of a requirements file, without comments"""
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def requirements_fingerprint(requirements):
+    """Hash the requirements together with the target they are resolved for"""
+    return hashlib.sha256("\n".join(sorted(requirements) + TARGET_ARGS).encode()).hexdigest()
+
+def parse_wheel_name(filename):
+    """Return (name, version) from a wheel file name"""
+    name, version = filename.split("-")[:2]
+    return name, version
+
+def load_lock():
+    if LOCK_FILE.exists():
+        with open(LOCK_FILE) as f:
+            return json.load(f)
+    return {}
+
+def save_lock(lock):
+    tmp_path = LOCK_FILE.with_name(LOCK_FILE.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, LOCK_FILE)
+
+def pip_download(args, dest):
+    """Download wheels for the target platform with the build's own pip"""
+    os.makedirs(dest, exist_ok=True)
+    command = [sys.executable, "-m", "pip", "download", "--dest", str(dest)] + TARGET_ARGS + args
+    print(f"Running: {' '.join(command)}")
+    subprocess.run(command, check=True)
+
+def print_lock_changes(old_packages, new_packages):
+    old = {package["name"].lower(): package["version"] for package in old_packages}
+    new = {package["name"].lower(): package["version"] for package in new_packages}
+    for name in sorted(set(old) | set(new)):
+        if name not in old:
+            print(f"  + {name} {new[name]}")
+        elif name not in new:
+            print(f"  - {name} {old[name]}")
+        elif old[name] != new[name]:
+            print(f"  ~ {name} {old[name]} -> {new[name]}")
+
+def resolve_lock(requirements_path, fingerprint, old_lock):
+    """Resolve the requirements into a fresh set of wheels and lock them"""
+    if OFFLINE:
+        raise WheelError(f"Can't resolve {requirements_path} while the build is offline")
+    os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+    resolve_dir = WHEELHOUSE_DIR.parent / "wheelhouse-resolve"
+    if resolve_dir.exists():
+        shutil.rmtree(resolve_dir)
+    pip_download(["-r", str(requirements_path)], resolve_dir)
+
+    packages = []
+    for wheel in sorted(resolve_dir.glob("*.whl")):
+        name, version = parse_wheel_name(wheel.name)
+        packages.append({"name": name, "version": version, "filename": wheel.name, "sha256": sha256_file(wheel)})
+        os.replace(wheel, WHEELHOUSE_DIR / wheel.name)
+    shutil.rmtree(resolve_dir)
+
+    print_lock_changes(old_lock.get("packages", []), packages)
+    lock = {"requirements_sha256": fingerprint, "packages": packages}
+    save_lock(lock)
+    print(f"Locked {len(packages)} packages in {LOCK_FILE}, commit it with {requirements_path}")
+    return lock
+
+def fill_wheelhouse(lock):
+    """Download locked wheels missing from the wheelhouse, verifying their hashes"""
+    missing = [
+        package for package in lock["packages"]
+        if not (WHEELHOUSE_DIR / package["filename"]).exists()
+    ]
+    if not missing:
+        return
+    if OFFLINE:
+        names = ", ".join(package["filename"] for package in missing)
+        raise WheelError(f"Wheels missing from {WHEELHOUSE_DIR} and the build is offline: {names}")
+    os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+    pinned_path = WHEELHOUSE_DIR.parent / "requirements-pinned.txt"
+    with open(pinned_path, "w") as f:
+        for package in missing:
+            f.write(f"{package['name']}=={package['version']} --hash=sha256:{package['sha256']}\n")
+    pip_download(["--no-deps", "--require-hashes", "-r", str(pinned_path)], WHEELHOUSE_DIR)
+
+def prepare_wheelhouse(requirements_path=REQUIREMENTS_FILE):
+    """Make sure the wheelhouse holds exactly the locked wheels, returning them"""
+    fingerprint = requirements_fingerprint(read_requirements(requirements_path))
+    lock = load_lock()
+    if lock.get("requirements_sha256") != fingerprint:
+        problem = f"{requirements_path} changed since {LOCK_FILE} was written" if lock else f"{LOCK_FILE} is missing"
+        if not UPDATE_LOCK:
+            # Resolving here would trust whatever PyPI serves today
+            raise WheelError(f"{problem}. Set POSTHOG_BUILD_UPDATE_LOCK=1 to resolve it again and commit the lock file")
+        print(f"{problem}, resolving requirements")
+        lock = resolve_lock(requirements_path, fingerprint, lock)
+    else:
+        fill_wheelhouse(lock)
+
+    wheels = []
+    for package in lock["packages"]:
+        path = WHEELHOUSE_DIR / package["filename"]
+        if sha256_file(path) != package["sha256"]:
+            raise WheelError(f"{path} does not match the sha256 in {LOCK_FILE}")
+        wheels.append(path)
+    return wheels
+
+def record_hash(path):
+    """A file's hash in the format of a RECORD entry"""
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def read_record(archive, dist_info):
+    """Hash and size of every member listed in a wheel's RECORD"""
+    text = archive.read(f"{dist_info}/RECORD").decode("utf-8")
+    return {row[0]: (row[1], row[2]) for row in csv.reader(text.splitlines()) if row}
+
+def write_console_scripts(archive, dist_info, prefix):
+    """Write a script and a .cmd that runs it for every console and GUI entry
+    point, which pip would turn into .exe launchers. Returns their paths"""
+    try:
+        text = archive.read(f"{dist_info}/entry_points.txt").decode("utf-8")
+    except KeyError:
+        return []
+    entry_points = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+    entry_points.optionxform = str
+    entry_points.read_string(text)
+    scripts_dir = prefix / "Scripts"
+    written = []
+    for section, interpreter, suffix in (("console_scripts", "python.exe", ".py"), ("gui_scripts", "pythonw.exe", ".pyw")):
+        if not entry_points.has_section(section):
+            continue
+        for script, target in entry_points.items(section):
+            module, _, function = re.sub(r"\[.*\]", "", target).strip().partition(":")
+            os.makedirs(scripts_dir, exist_ok=True)
+            script_path = scripts_dir / f"{script}-script{suffix}"
+            with open(script_path, "w") as f:
+                f.write(SCRIPT_TEMPLATE.format(module=module, name=function.split(".")[0], function=function))
+            cmd_path = scripts_dir / f"{script}.cmd"
+            with open(cmd_path, "w", newline="") as f:
+                f.write(f'@"%~dp0..\\{interpreter}" "%~dp0{script_path.name}" %*\r\n')
+            written += [script_path, cmd_path]
+    return written
+
+def unpack_wheel(wheel, site_packages, prefix):
+    """Install one wheel by extracting it, returning (name, version, seconds, bytes)"""
+    began = time.monotonic()
+    name, version = parse_wheel_name(wheel.name)
+    total_bytes = 0
+    with zipfile.ZipFile(wheel) as archive:
+        members = archive.infolist()
+        # The .dist-info and .data names don't always match the file name's case
+        top_level = {member.filename.split("/")[0] for member in members}
+        dist_info = next(entry for entry in top_level if entry.endswith(".dist-info"))
+        data_dir = dist_info[:-len(".dist-info")] + ".data"
+        record = read_record(archive, dist_info)
+        installed = []
+        # .data/<scheme>/ entries go to the matching install location
+        schemes = {
+            "purelib": site_packages,
+            "platlib": site_packages,
+            "scripts": prefix / "Scripts",
+            "headers": prefix / "Include" / name,
+            "data": prefix,
+        }
+        for member in members:
+            target_root, arcname = site_packages, member.filename
+            if arcname.startswith(data_dir + "/"):
+                scheme, _, arcname = arcname[len(data_dir) + 1:].partition("/")
+                target_root = schemes[scheme]
+            if not arcname or member.is_dir():
+                continue
+            path = member_path(arcname, target_root)
+            # Wheels unpacked at the same time share directories such as Scripts
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            extract_file(archive, member, path)
+            total_bytes += member.file_size
+            if member.filename != f"{dist_info}/RECORD":
+                installed.append((path, *record.get(member.filename, ("", ""))))
+        scripts = write_console_scripts(archive, dist_info, prefix)
+
+    # RECORD lists the installed paths relative to site-packages, so the next
+    # build can remove exactly what this one installed
+    installer_path = site_packages / dist_info / "INSTALLER"
+    with open(installer_path, "w") as f:
+        f.write(INSTALLER_NAME + "\n")
+    for path in scripts + [installer_path]:
+        installed.append((path, record_hash(path), str(os.path.getsize(path))))
+    record_path = site_packages / dist_info / "RECORD"
+    with open(record_path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        for path, digest, size in installed:
+            writer.writerow([os.path.relpath(path, site_packages).replace(os.sep, "/"), digest, size])
+        writer.writerow([os.path.relpath(record_path, site_packages).replace(os.sep, "/"), "", ""])
+    return name, version, time.monotonic() - began, total_bytes
+
+def uninstall_previous(site_packages):
+    """Remove the files of the packages an earlier build installed, as listed
+    in their RECORD, leaving anything else in site-packages alone"""
+    if not site_packages.exists():
+        return 0
+    removed = 0
+    for dist_info in site_packages.glob("*.dist-info"):
+        installer_path = dist_info / "INSTALLER"
+        if not installer_path.exists() or installer_path.read_text().strip() != INSTALLER_NAME:
+            continue
+        directories = set()
+        with open(dist_info / "RECORD", newline="") as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                path = Path(os.path.normpath(site_packages / row[0]))
+                if path.suffix == ".py":
+                    for cached in (path.parent / "__pycache__").glob(f"{path.stem}.*.pyc"):
+                        os.remove(cached)
+                    directories.add(path.parent / "__pycache__")
+                if path.exists():
+                    os.remove(path)
+                directories.add(path.parent)
+        shutil.rmtree(dist_info, ignore_errors=True)
+        # Deepest first, so emptied packages disappear with their subpackages
+        for directory in sorted(directories, key=lambda directory: len(directory.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+        removed += 1
+    return removed
+
+def install_wheels(wheels, site_packages, prefix):
+    """Unpack all wheels into site-packages at the same time"""
+    began = time.monotonic()
+    removed = uninstall_previous(site_packages)
+    if removed:
+        print(f"Removed {removed} previously installed packages")
+    os.makedirs(site_packages, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=MAX_INSTALL_THREADS) as pool:
+        results = list(pool.map(lambda wheel: unpack_wheel(wheel, site_packages, prefix), wheels))
+
+    for name, version, seconds, total_bytes in sorted(results, key=lambda result: result[2], reverse=True):
+        print(f"  {name} {version}: {seconds:.2f}s ({total_bytes / 1e6:.1f} MB)")
+    print(f"Installed {len(results)} packages in {time.monotonic() - began:.1f}s")
+    return results
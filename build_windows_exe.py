@@ -3,22 +3,31 @@
 
 import os
 import sys
-import subprocess
 import shutil
+import argparse
 from pathlib import Path
 
+from build_archive import create_archive
+from build_assets import process_assets
+from build_imports import analyze_imports, report_contents
+from build_pipeline import PipelineError, run_pipeline, run_process, step
+from build_prune import prune_plugin_server
+
 # Define paths
 POSTHOG_DIR = Path("posthog-master")
 BUILD_DIR = Path("build")
 DIST_DIR = Path("dist")
 TEMP_DIR = Path("temp")
 OUTPUT_DIR = Path("posthog-windows")
+PRUNED_PLUGIN_SERVER_DIR = BUILD_DIR / "plugin-server"
+
+# Names this script's pipeline state and report in build/
+PIPELINE = "windows_exe"
 
 def run_command(command, cwd=None):
     """Run a command and print output"""
     print(f"Running: {command}")
-    result = subprocess.run(command, shell=True, cwd=cwd, check=True)
-    return result
+    return run_process(command, cwd=cwd)
 
 def setup_environment():
     """Set up the build environment"""
@@ -41,9 +50,7 @@ def build_frontend():
     print("Building frontend...")
     frontend_dir = POSTHOG_DIR / "frontend"
     
-    # Install Node.js dependencies
-    run_command("pnpm install", cwd=POSTHOG_DIR)
-    
+    # Node.js dependencies are installed by the node-deps step
     # Build frontend
     run_command("pnpm run build", cwd=frontend_dir)
 
@@ -58,18 +65,36 @@ def build_plugin_server():
     # Build plugin server
     run_command("pnpm run build", cwd=plugin_server_dir)
 
+def compress_static_assets():
+    """Hash the frontend and Django static files and precompress them"""
+    print("Compressing static assets...")
+    process_assets(POSTHOG_DIR / "frontend" / "dist", BUILD_DIR / "frontend-dist")
+    process_assets(POSTHOG_DIR / "staticfiles", BUILD_DIR / "staticfiles")
+
+def prune_plugin_server_modules():
+    """Reduce the plugin server's node_modules to the files it can load"""
+    print("Pruning plugin server dependencies...")
+    prune_plugin_server(POSTHOG_DIR / "plugin-server", PRUNED_PLUGIN_SERVER_DIR)
+
 def create_spec_file():
     """Create a PyInstaller spec file for PostHog"""
     spec_content = """# -*- mode: python ; coding: utf-8 -*-
 
+import json
+
 block_cipher = None
 
+# Generated by the imports step from a traced startup and smoke test
+with open('build/pyinstaller-imports.json') as f:
+    traced = json.load(f)
+
 django_files = [
     ('posthog-master/posthog', 'posthog'),
-    ('posthog-master/frontend/dist', 'frontend/dist'),
-    ('posthog-master/plugin-server/dist', 'plugin-server/dist'),
-    ('posthog-master/plugin-server/node_modules', 'plugin-server/node_modules'),
-    ('posthog-master/staticfiles', 'staticfiles'),
+    ('build/frontend-dist', 'frontend/dist'),
+    ('build/plugin-server/dist', 'plugin-server/dist'),
+    ('build/plugin-server/node_modules', 'plugin-server/node_modules'),
+    ('build/plugin-server/package.json', 'plugin-server'),
+    ('build/staticfiles', 'staticfiles'),
 ]
 
 a = Analysis(
@@ -77,32 +102,25 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=django_files,
-    hiddenimports=[
-        'django.contrib.admin',
-        'django.contrib.auth',
-        'django.contrib.contenttypes',
-        'django.contrib.sessions',
-        'django.contrib.messages',
-        'django.contrib.staticfiles',
-        'posthog',
-        'dj_database_url',
-        'whitenoise',
-        'corsheaders',
-        'social_django',
-        'django_filters',
-        'rest_framework',
-        'celery',
-    ],
+    hiddenimports=traced['hiddenimports'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=traced['excludes'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
     noarchive=False,
 )
 
+# Record what was collected for the size report
+with open('build/pyinstaller-contents.json', 'w') as f:
+    json.dump({
+        'pure': [(name, path) for name, path, typecode in a.pure],
+        'binaries': [(name, path) for name, path, typecode in a.binaries],
+        'datas': [(name, path) for name, path, typecode in a.datas],
+    }, f)
+
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
 exe = EXE(
@@ -142,7 +160,7 @@ coll = COLLECT(
 
 def create_launcher_script():
     """Create a launcher script for PostHog"""
-    launcher_content = """#!/usr/bin/env python
+    launcher_content = '''#!/usr/bin/env python
 # PostHog Windows Launcher
 
 import os
@@ -226,7 +244,7 @@ def main():
 
 if __name__ == '__main__':
     main()
-"""
+'''
     
     with open("launcher.py", "w") as f:
         f.write(launcher_content)
@@ -237,6 +255,7 @@ def build_executable():
     """Build the executable with PyInstaller"""
     print("Building Windows executable...")
     run_command("pyinstaller --clean posthog.spec")
+    report_contents()
     
     # Copy additional files to the distribution
     shutil.copy("posthog-master/bin/start-worker.bat", "dist/posthog/")
@@ -267,20 +286,84 @@ official Docker deployment method.
 For more information, visit: https://posthog.com
 """)
     
-    # Create the final zip file
-    shutil.make_archive("posthog-windows", "zip", "dist/posthog")
+    # Create the final zip file, compressing members in parallel
+    create_archive("posthog-windows.zip", "dist/posthog")
     
     print("PostHog Windows executable has been built! The final package is: posthog-windows.zip")
 
+def build_steps():
+    """Build steps of the executable and what they read and write"""
+    frontend_dir = POSTHOG_DIR / "frontend"
+    plugin_server_dir = POSTHOG_DIR / "plugin-server"
+    return [
+        # Preparation steps of build.js
+        step("builder-deps", lambda: run_command("npm install"),
+             inputs=["package.json"], outputs=["node_modules"]),
+        step("source", lambda: run_command("node build.js source"),
+             deps=["builder-deps"], outputs=[POSTHOG_DIR / "manage.py"]),
+        step("node-deps", lambda: run_command("node build.js node-deps"),
+             deps=["builder-deps", "source"],
+             inputs=[POSTHOG_DIR / "package.json", POSTHOG_DIR / "pnpm-lock.yaml"],
+             outputs=[POSTHOG_DIR / "node_modules" / ".modules.yaml"]),
+        step("settings", lambda: run_command("node build.js settings"),
+             deps=["builder-deps", "source"], outputs=[POSTHOG_DIR / "posthog" / "local_settings.py"]),
+        
+        step("python-deps", setup_environment, deps=["source"],
+             inputs=[POSTHOG_DIR / "pyproject.toml", POSTHOG_DIR / "requirements.txt"]),
+        step("frontend", build_frontend, deps=["node-deps"],
+             inputs=[frontend_dir / "src", frontend_dir / "public", frontend_dir / "package.json",
+                     frontend_dir / "build.mjs", frontend_dir / "utils.mjs", POSTHOG_DIR / "tsconfig.json"],
+             outputs=[frontend_dir / "dist"]),
+        step("plugin-server", build_plugin_server, deps=["node-deps"],
+             inputs=[plugin_server_dir / "src", plugin_server_dir / "package.json",
+                     plugin_server_dir / "pnpm-lock.yaml", plugin_server_dir / "tsconfig.json"],
+             outputs=[plugin_server_dir / "dist", plugin_server_dir / "node_modules" / ".modules.yaml"]),
+        step("assets", compress_static_assets, deps=["frontend"],
+             inputs=["build_assets.py", "build_archive.py", "build_staging.py", POSTHOG_DIR / "staticfiles"],
+             outputs=[BUILD_DIR / "frontend-dist", BUILD_DIR / "staticfiles"]),
+        step("prune", prune_plugin_server_modules, deps=["plugin-server"],
+             inputs=["build_prune.py", "build_staging.py"],
+             params=[os.environ.get("POSTHOG_BUILD_BUNDLE_PLUGIN_SERVER", "")],
+             outputs=[PRUNED_PLUGIN_SERVER_DIR]),
+        step("imports", lambda: analyze_imports(POSTHOG_DIR), deps=["python-deps", "settings"],
+             inputs=["build_imports.py", POSTHOG_DIR / "posthog", POSTHOG_DIR / "ee"],
+             params=[os.environ.get("POSTHOG_BUILD_EXCLUDE_PACKAGES", "")],
+             outputs=[BUILD_DIR / "pyinstaller-imports.json"]),
+        step("launcher", create_launcher_script, outputs=["launcher.py"]),
+        step("spec", create_spec_file, outputs=["posthog.spec"]),
+        step("executable", build_executable,
+             deps=["python-deps", "settings", "assets", "prune", "imports", "launcher", "spec"],
+             inputs=["build_archive.py", POSTHOG_DIR / "posthog", POSTHOG_DIR / "bin"],
+             outputs=["posthog-windows.zip"]),
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the PostHog Windows executable")
+    parser.add_argument("steps", nargs="*", help="only build these steps and the steps they depend on")
+    parser.add_argument("--force", action="store_true", help="run steps even if their inputs are unchanged")
+    parser.add_argument("--jobs", type=int, help="maximum number of steps running at the same time")
+    parser.add_argument("--list", action="store_true", help="list the build steps and exit")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    steps = build_steps()
+    if args.list:
+        for item in steps:
+            print(item["name"] + (f" (after {', '.join(item['deps'])})" if item["deps"] else ""))
+        return 0
+    
     print("Building PostHog Windows executable")
-    setup_environment()
-    build_frontend()
-    build_plugin_server()
-    create_launcher_script()
-    create_spec_file()
-    build_executable()
+    try:
+        succeeded = run_pipeline(steps, PIPELINE, args.steps, force=args.force, jobs=args.jobs)
+    except PipelineError as e:
+        print(f"Error during build: {e}")
+        return 1
+    if not succeeded:
+        print("Build failed. See errors above.")
+        return 1
     print("Build completed!")
+    return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
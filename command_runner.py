@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone management command runner
+# Loads Django once and then runs management commands through call_command
+# as the launcher requests them, so one-shot commands skip the bootstrap.
+# Requests arrive on stdin and output and results go to stdout, one JSON
+# message per line:
+#   {"id": 1, "command": "migrate", "args": ["--noinput"]}
+#   {"id": 1, "stream": "stdout", "line": "Operations to perform:"}
+#   {"id": 1, "exit_code": 0, "error": null, "duration_seconds": 1.2}
+
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+
+class LineStream:
+    """File-like object that sends each written line to the launcher"""
+
+    def __init__(self, send, name):
+        self.send = send
+        self.name = name
+        self.request_id = None
+        self.pending = ''
+
+    def write(self, text):
+        self.pending += text
+        while '\n' in self.pending:
+            line, self.pending = self.pending.split('\n', 1)
+            self.send({"id": self.request_id, "stream": self.name, "line": line.rstrip('\r')})
+        return len(text)
+
+    def flush(self):
+        # Commands flush partial lines such as "Applying ...", keep them
+        # until the line is complete
+        pass
+
+    def finish(self):
+        if self.pending:
+            self.write('\n')
+
+    def isatty(self):
+        return False
+
+def main():
+    # Only the protocol goes to the real stdout. Stray writes to file
+    # descriptor 1 end up on stderr, which the launcher logs as plain text
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            protocol.write(json.dumps(message) + '\n')
+
+    began = time.monotonic()
+    sys.path.insert(0, base_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posthog.settings')
+    import sqlite_profile
+    sqlite_profile.install_connection_hook()
+    import django
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    from django.db import connections
+    django.setup()
+    send({"ready": True, "startup_seconds": round(time.monotonic() - began, 2)})
+
+    stdout = LineStream(send, 'stdout')
+    stderr = LineStream(send, 'stderr')
+    for raw in sys.stdin:
+        try:
+            request = json.loads(raw)
+        except ValueError:
+            continue
+        stdout.request_id = stderr.request_id = request.get("id")
+        result = {"id": request.get("id"), "exit_code": 0, "error": None}
+        began = time.monotonic()
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            call_command(request["command"], *request.get("args", []), stdout=stdout, stderr=stderr)
+        except CommandError as e:
+            result["exit_code"] = getattr(e, 'returncode', 1)
+            result["error"] = str(e)
+        except SystemExit as e:
+            result["exit_code"] = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            traceback.print_exc()
+            result["exit_code"] = 1
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            stdout.finish()
+            stderr.finish()
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            # Don't hold SQLite locks while waiting for the next command
+            connections.close_all()
+        result["duration_seconds"] = round(time.monotonic() - began, 2)
+        send(result)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone event ingest buffer
+# Captured events are queued in memory and written to SQLite in multi-row
+# transactions, flushed when a batch fills up or the flush interval passes.
+# With partitioned storage the batches go to event_partitions instead
+
+import os
+import gzip
+import json
+import time
+import uuid
+import zlib
+import queue
+import base64
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+import sqlite_profile
+
+logger = logging.getLogger('posthog_launcher.ingest')
+
+# Environment variable the launcher uses to hand the settings to web workers
+INGEST_ENV = 'POSTHOG_INGEST_CONFIG'
+
+DEFAULT_INGEST_CONFIG = {
+    "enabled": True,
+    "batch_size": 500,
+    "flush_interval": 1.0,
+    "max_queue": 50000,
+    "durability": "none",  # "none", "fsync" (fsync on every flush) or "spill"
+    "stats_interval": 60,
+}
+DURABILITY_MODES = ("none", "fsync", "spill")
+
+# Endpoints posthog-js and the server SDKs send events to
+CAPTURE_PATHS = ("/e/", "/capture/", "/batch/", "/track/", "/i/v0/e/")
+
+EVENTS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS standalone_events (
+    id INTEGER PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    event TEXT NOT NULL,
+    distinct_id TEXT,
+    team_token TEXT,
+    properties TEXT,
+    timestamp TEXT NOT NULL,
+    created_at TEXT NOT NULL
+)
+"""
+EVENTS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS standalone_events_timestamp ON standalone_events (timestamp)"
+INSERT_SQL = (
+    "INSERT INTO standalone_events (uuid, event, distinct_id, team_token, properties, timestamp, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+def load_ingest_config(overrides=None):
+    """Return the ingest settings merged over their defaults"""
+    config = dict(DEFAULT_INGEST_CONFIG)
+    config.update(overrides or {})
+    if config["durability"] not in DURABILITY_MODES:
+        raise ValueError(f"Unknown ingest durability mode: {config['durability']!r}")
+    return config
+
+def to_row(event, token=None):
+    """Turn a captured event into a standalone_events row"""
+    now = datetime.now(timezone.utc).isoformat()
+    properties = event.get("properties") or {}
+    return (
+        str(event.get("uuid") or uuid.uuid4()),
+        str(event.get("event") or "$unknown"),
+        event.get("distinct_id") or properties.get("distinct_id"),
+        event.get("api_key") or event.get("token") or properties.get("token") or token,
+        json.dumps(properties, separators=(',', ':')),
+        event.get("timestamp") or now,
+        now,
+    )
+
+class EventWriteBuffer:
+    """Bounded in-memory queue that writes events to SQLite in batches"""
+
+    def __init__(self, db_path, config, profile=None, name='ingest', spill_dir=None, partitions=None):
+        self.db_path = db_path
+        self.config = config
+        self.profile = profile or sqlite_profile.load_profile()
+        self.partitions = partitions
+        self.name = name
+        self.queue = queue.Queue(maxsize=config["max_queue"])
+        self.spill_dir = spill_dir or os.path.join(os.path.dirname(db_path), "ingest-spill")
+        self.spill_file = None
+        self.spill_sequence = 0
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.stats = {
+            "accepted": 0,
+            "written": 0,
+            "dropped": 0,
+            "expired": 0,  # Older than partitions.retention_days, never written
+            "batches": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self.conn = None
+        self.thread = threading.Thread(target=self.run, name=f'{name}-writer', daemon=True)
+
+    def start(self):
+        """Prepare the events table, replay spilled events and start the writer"""
+        if self.partitions is not None:
+            # Partition files are created as events for them arrive
+            if self.config["durability"] == "fsync":
+                self.partitions.profile = dict(self.partitions.profile, synchronous="full")
+        else:
+            self.conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            sqlite_profile.apply_connection_pragmas(self.conn, self.profile)
+            if self.config["durability"] == "fsync":
+                self.conn.execute("PRAGMA synchronous=FULL")
+            self.conn.execute(EVENTS_TABLE_SQL)
+            self.conn.execute(EVENTS_INDEX_SQL)
+        if self.config["durability"] == "spill":
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.replay_spill()
+            self.open_spill_segment()
+        self.thread.start()
+        return self
+
+    def submit(self, rows):
+        """Queue rows for writing, dropping all of them if they don't fit so that
+        the client can retry the request without duplicating events"""
+        accepted = 0
+        with self.lock:
+            # Only submit() adds to the queue, so the free space can't shrink under the lock
+            if self.queue.maxsize - self.queue.qsize() < len(rows):
+                self.stats["dropped"] += len(rows)
+                return 0
+            for row in rows:
+                self.queue.put_nowait(row)
+                if self.spill_file is not None:
+                    self.spill_file.write(json.dumps(row) + "\n")
+                accepted += 1
+            if self.spill_file is not None:
+                self.spill_file.flush()
+            self.stats["accepted"] += accepted
+        return accepted
+
+    def run(self):
+        """Collect batches and flush them on size or time"""
+        batch_size = self.config["batch_size"]
+        interval = self.config["flush_interval"]
+        next_stats = time.monotonic() + self.config["stats_interval"]
+        last_stats = None
+        while not self.closed.is_set():
+            deadline = time.monotonic() + interval
+            while self.queue.qsize() < batch_size and time.monotonic() < deadline:
+                if self.closed.wait(min(0.05, interval)):
+                    break
+            try:
+                self.flush()
+                if self.partitions is not None:
+                    # Also when no events arrive, so compaction can take the files
+                    self.partitions.close_idle()
+                if time.monotonic() >= next_stats:
+                    stats = self.format_stats()
+                    if stats != last_stats:
+                        logger.info(stats)
+                        last_stats = stats
+                    next_stats = time.monotonic() + self.config["stats_interval"]
+            except Exception:
+                # Requests keep being acknowledged, so the writer must not die
+                logger.exception("Ingest writer error")
+
+    def drain(self):
+        """Take everything currently queued, rotating the spill segment with it"""
+        rows = []
+        with self.lock:
+            while True:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            finished_segment = self.rotate_spill_segment() if rows else None
+        return rows, finished_segment
+
+    def flush(self):
+        """Write all queued events in a single transaction"""
+        rows, finished_segment = self.drain()
+        if not rows:
+            return 0
+        began = time.perf_counter()
+        try:
+            written = self.write_rows(rows)
+        except (sqlite3.Error, OSError) as e:
+            # The rows stay in the spill segment if there is one
+            logger.error(f"Failed to write {len(rows)} events: {e}")
+            self.stats["dropped"] += len(rows)
+            return 0
+        elapsed_ms = (time.perf_counter() - began) * 1000
+        if finished_segment is not None:
+            try:
+                os.remove(finished_segment)
+            except OSError as e:
+                # Replayed on the next start, which writes its events again
+                logger.error(f"Could not remove spill segment {finished_segment}: {e}")
+        self.stats["written"] += written
+        self.stats["expired"] += len(rows) - written
+        self.stats["batches"] += 1
+        self.stats["last_flush_ms"] = elapsed_ms
+        self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed_ms)
+        self.stats["total_flush_ms"] += elapsed_ms
+        return written
+
+    def write_rows(self, rows):
+        """Insert rows in one IMMEDIATE transaction, returning how many were written"""
+        if self.partitions is not None:
+            return self.partitions.write_rows(rows)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(INSERT_SQL, rows)
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def open_spill_segment(self):
+        """Start a new append-only spill segment"""
+        self.spill_sequence += 1
+        path = os.path.join(self.spill_dir, f"{self.name}-{os.getpid()}-{self.spill_sequence}.jsonl")
+        self.spill_file = open(path, 'a', encoding='utf-8')
+
+    def rotate_spill_segment(self):
+        """Close the current spill segment and return its path"""
+        if self.spill_file is None:
+            return None
+        finished = self.spill_file.name
+        self.spill_file.close()
+        self.open_spill_segment()
+        return finished
+
+    def replay_spill(self):
+        """Write events left in spill segments by an earlier run of this worker"""
+        for filename in sorted(os.listdir(self.spill_dir)):
+            if not filename.startswith(f"{self.name}-") or not filename.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.spill_dir, filename)
+            rows = []
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rows.append(tuple(json.loads(line)))
+                    except ValueError:
+                        # A crash can leave a torn last line
+                        continue
+            if rows:
+                written = self.write_rows(rows)
+                self.stats["expired"] += len(rows) - written
+                logger.info(f"Recovered {written} spilled events from {filename}")
+            os.remove(path)
+
+    def get_stats(self):
+        """Return the buffer counters together with the current queue depth"""
+        stats = dict(self.stats)
+        stats["queue_depth"] = self.queue.qsize()
+        stats["avg_flush_ms"] = stats["total_flush_ms"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def format_stats(self):
+        stats = self.get_stats()
+        return (
+            f"Ingest {self.name}: queue={stats['queue_depth']} written={stats['written']} "
+            f"dropped={stats['dropped']} expired={stats['expired']} batches={stats['batches']} "
+            f"flush avg={stats['avg_flush_ms']:.1f}ms max={stats['max_flush_ms']:.1f}ms"
+        )
+
+    def close(self):
+        """Stop the writer and flush whatever is still queued"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush()
+        if self.spill_file is not None:
+            path = self.spill_file.name
+            self.spill_file.close()
+            self.spill_file = None
+            os.remove(path)
+        if self.partitions is not None:
+            self.partitions.close()
+        else:
+            self.conn.close()
+
+def decode_payload(body, content_encoding='', query=None):
+    """Decode a capture request body into a list of events and a token"""
+    query = query or {}
+    if body[:2] == b'\x1f\x8b' or 'gzip' in content_encoding or query.get('compression') == ['gzip-js']:
+        body = gzip.decompress(body)
+    text = body.decode('utf-8')
+    if text.startswith('data='):
+        form = parse_qs(text)
+        text = form['data'][0]
+    if text and text.lstrip()[:1] not in ('{', '['):
+        text = base64.b64decode(text + '=' * (-len(text) % 4)).decode('utf-8')
+    payload = json.loads(text) if text else {}
+    token = None
+    if isinstance(payload, dict):
+        token = payload.get('api_key') or payload.get('token')
+        events = payload.get('batch') or payload.get('data') or [payload]
+    else:
+        events = payload
+    if not isinstance(events, list):
+        raise ValueError("Capture payload must be an event, a list of events or a batch")
+    return [event for event in events if isinstance(event, dict)], token
+
+class CaptureMiddleware:
+    """WSGI middleware that answers capture requests from the write buffer"""
+
+    def __init__(self, application, buffer):
+        self.application = application
+        self.buffer = buffer
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith(CAPTURE_PATHS):
+            return self.application(environ, start_response)
+        if environ['REQUEST_METHOD'] == 'OPTIONS':
+            return self.application(environ, start_response)
+
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(length) if length else b''
+            if not body and 'data' in query:
+                body = query['data'][0].encode()
+            events, token = decode_payload(body, environ.get('HTTP_CONTENT_ENCODING', ''), query)
+        except (ValueError, KeyError, TypeError, OSError, EOFError, zlib.error) as e:
+            return self.respond(start_response, '400 Bad Request', {"status": 0, "error": str(e)})
+
+        rows = [to_row(event, token) for event in events]
+        if self.buffer.submit(rows) < len(rows):
+            # SDKs retry on 503, so the events aren't lost while the queue is full
+            return self.respond(start_response, '503 Service Unavailable',
+                                {"status": 0, "error": "Event queue is full"}, [('Retry-After', '1')])
+        return self.respond(start_response, '200 OK', {"status": 1})
+
+    def respond(self, start_response, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Access-Control-Allow-Origin', '*'),
+        ] + list(headers))
+        return [body]
@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone partitioned event storage
+# Captured events are written to one SQLite file per day or per ISO week
+# under data\events instead of the standalone_events table in posthog.db.
+# Queries attach only the partitions their time range touches, retention
+# deletes whole partition files, and partitions older than compact_after_days
+# are rewritten with VACUUM INTO into read-only files. From the installation
+# directory:
+#   python\python.exe event_partitions.py list
+#   python\python.exe event_partitions.py maintain
+#   python\python.exe event_partitions.py query "SELECT event, COUNT(*) FROM standalone_events GROUP BY event" --since 2026-10-01
+
+import os
+import re
+import sys
+import json
+import stat
+import time
+import sqlite3
+import logging
+import argparse
+from pathlib import Path
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+import sqlite_profile
+from event_ingest import EVENTS_TABLE_SQL, EVENTS_INDEX_SQL, INSERT_SQL
+
+logger = logging.getLogger('posthog_launcher.partitions')
+
+# Environment variable the launcher uses to hand the settings to web workers
+PARTITIONS_ENV = 'POSTHOG_PARTITION_CONFIG'
+
+DEFAULT_PARTITION_CONFIG = {
+    "enabled": False,
+    "granularity": "day",  # "day" or "week"
+    "retention_days": 0,  # 0 keeps every partition
+    "compact_after_days": 2,
+    "maintenance_interval": 3600,
+    "max_open": 4,  # Partition files a web worker keeps open for writing
+    "idle_timeout": 300,  # Seconds before a web worker closes a partition it stopped writing to
+}
+GRANULARITIES = ("day", "week")
+
+PARTITION_DIR = "events"
+# events-2026-10-17.db, events-2026-W42.db and their compacted .ro.db versions
+PARTITION_NAME = re.compile(r"^events-(\d{4}-\d{2}-\d{2}|\d{4}-W\d{2})(\.ro)?\.db$")
+SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+# A live partition is renamed to this while it is being compacted
+TOMBSTONE_SUFFIX = ".compacting"
+# Queries spanning more partitions than this run per group of partitions
+DEFAULT_ATTACH_LIMIT = 10
+
+Partition = namedtuple('Partition', ['key', 'start', 'end', 'live_path', 'compact_path'])
+
+def load_partition_config(overrides=None):
+    """Return the partition settings merged over their defaults"""
+    config = dict(DEFAULT_PARTITION_CONFIG)
+    config.update(overrides or {})
+    if config["granularity"] not in GRANULARITIES:
+        raise ValueError(f"Unknown partition granularity: {config['granularity']!r}")
+    if config["retention_days"] and config["retention_days"] <= config["compact_after_days"]:
+        # Writers may still hold partitions younger than compact_after_days
+        raise ValueError("partitions.retention_days must be 0 or larger than compact_after_days")
+    return config
+
+def partition_range(key):
+    """First day and the day after the last day of a partition key"""
+    if 'W' in key:
+        year, week = key.split('-W')
+        start = date.fromisocalendar(int(year), int(week), 1)
+        return start, start + timedelta(days=7)
+    start = date.fromisoformat(key)
+    return start, start + timedelta(days=1)
+
+def to_day(value):
+    """The date of a date, datetime or ISO 8601 string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def is_day(value):
+    return not isinstance(value, datetime) and (isinstance(value, date) or len(str(value)) == 10)
+
+def range_conditions(start, end):
+    """Timestamp conditions for [start, end], where a day as the end includes all of it"""
+    conditions = []
+    if start is not None:
+        value = start.isoformat() if isinstance(start, date) else str(start)
+        conditions.append(f"timestamp >= {sql_literal(value)}")
+    if end is not None:
+        if is_day(end):
+            conditions.append(f"timestamp < {sql_literal((to_day(end) + timedelta(days=1)).isoformat())}")
+        else:
+            conditions.append(f"timestamp <= {sql_literal(end.isoformat() if isinstance(end, date) else end)}")
+    return conditions
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def read_only_uri(path, immutable=False):
+    return Path(path).absolute().as_uri() + ('?mode=ro&immutable=1' if immutable else '?mode=ro')
+
+def remove_database(path):
+    """Remove a database file and its journal files"""
+    for suffix in ("",) + SIDECAR_SUFFIXES:
+        target = path + suffix
+        if os.path.exists(target):
+            # Compacted partitions are read-only, which Windows won't delete
+            os.chmod(target, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(target)
+
+def move_database(source, target):
+    """Rename a database file and its journal files, undoing the renames that
+    succeeded if one fails, e.g. because another process has the file open"""
+    moved = []
+    try:
+        for suffix in ("",) + SIDECAR_SUFFIXES:
+            if os.path.exists(source + suffix):
+                os.replace(source + suffix, target + suffix)
+                moved.append(suffix)
+    except OSError:
+        for suffix in reversed(moved):
+            os.replace(target + suffix, source + suffix)
+        raise
+
+class PartitionStore:
+    """The event partition files of one data directory.
+
+    Events are filed by the day of their timestamp while it is within
+    compact_after_days of today. Older events go to today's partition, so
+    nothing writes to a partition once it is old enough to be compacted, and
+    events older than retention_days are dropped instead of outliving their
+    retention in today's partition. A partition can therefore hold events from
+    before its own range, so queries read every live partition that ends after
+    their range starts and pick compacted partitions by the timestamps they
+    actually contain."""
+
+    def __init__(self, data_dir, config, profile=None):
+        self.root = os.path.join(data_dir, PARTITION_DIR)
+        self.config = config
+        self.profile = profile or sqlite_profile.load_profile()
+        self.writers = OrderedDict()
+        self.last_write = {}
+        self.bounds = {}
+
+    def key_for_day(self, day):
+        if self.config["granularity"] == "week":
+            year, week, _ = day.isocalendar()
+            return f"{year}-W{week:02d}"
+        return day.isoformat()
+
+    def live_path(self, key):
+        return os.path.join(self.root, f"events-{key}.db")
+
+    def compact_path(self, key):
+        return os.path.join(self.root, f"events-{key}.ro.db")
+
+    def write_horizon(self, today=None):
+        """Events before this day are written to today's partition"""
+        return (today or datetime.now(timezone.utc).date()) - timedelta(days=self.config["compact_after_days"])
+
+    def retention_cutoff(self, today=None):
+        """Events and partitions before this day are past retention, None keeps everything"""
+        if not self.config["retention_days"]:
+            return None
+        return (today or datetime.now(timezone.utc).date()) - timedelta(days=self.config["retention_days"])
+
+    def is_expired(self, row, cutoff):
+        try:
+            return to_day(row[5]) < cutoff
+        except ValueError:
+            return False  # Filed under today
+
+    def partition_for_row(self, row, today, horizon):
+        """Partition key of a standalone_events row"""
+        try:
+            day = to_day(row[5])
+        except ValueError:
+            day = today
+        return self.key_for_day(day if day >= horizon else today)
+
+    def partitions(self):
+        """All partitions on disk, oldest first"""
+        found = {}
+        if os.path.isdir(self.root):
+            for filename in os.listdir(self.root):
+                match = PARTITION_NAME.match(filename)
+                if match is None:
+                    continue
+                key, compacted = match.groups()
+                paths = found.setdefault(key, {})
+                paths['compact' if compacted else 'live'] = os.path.join(self.root, filename)
+        partitions = []
+        for key, paths in found.items():
+            try:
+                start, end = partition_range(key)
+            except ValueError:
+                continue
+            partitions.append(Partition(key, start, end, paths.get('live'), paths.get('compact')))
+        return sorted(partitions, key=lambda partition: partition.start)
+
+    def timestamp_bounds(self, path):
+        """First and last day of the events in a compacted partition, or None
+        when it is empty. Compacted files don't change, so this is cached"""
+        cache_key = (path, os.path.getmtime(path))
+        if cache_key not in self.bounds:
+            conn = sqlite3.connect(read_only_uri(path, immutable=True), uri=True)
+            try:
+                # Both ends come from the timestamp index
+                first = conn.execute("SELECT MIN(timestamp) FROM standalone_events").fetchone()[0]
+                last = conn.execute("SELECT MAX(timestamp) FROM standalone_events").fetchone()[0]
+            finally:
+                conn.close()
+            self.bounds[cache_key] = None if first is None else (to_day(first), to_day(last))
+        return self.bounds[cache_key]
+
+    def prune(self, start=None, end=None):
+        """Partitions that can hold events with timestamps in [start, end]"""
+        start_day = to_day(start) if start is not None else None
+        end_day = to_day(end) if end is not None else None
+        selected = []
+        for partition in self.partitions():
+            if start_day is not None and partition.end <= start_day:
+                continue
+            if partition.live_path is None:
+                # Late events put a compacted partition's contents before its range
+                try:
+                    bounds = self.timestamp_bounds(partition.compact_path)
+                except (OSError, ValueError, sqlite3.Error):
+                    bounds = (date.min, date.max)
+                if bounds is None:
+                    continue
+                if end_day is not None and bounds[0] > end_day:
+                    continue
+                if start_day is not None and bounds[1] < start_day:
+                    continue
+            selected.append(partition)
+        return selected
+
+    def open_writer(self, key):
+        """Connection for writing to a partition, creating the file if needed"""
+        conn = self.writers.pop(key, None)
+        if conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(self.live_path(key), isolation_level=None, check_same_thread=False)
+            sqlite_profile.initialize_storage(conn, self.profile)
+            conn.execute(EVENTS_TABLE_SQL)
+            conn.execute(EVENTS_INDEX_SQL)
+        self.writers[key] = conn
+        self.last_write[key] = time.monotonic()
+        while len(self.writers) > self.config["max_open"]:
+            self.close_writer(next(iter(self.writers)))
+        return conn
+
+    def close_writer(self, key):
+        self.last_write.pop(key, None)
+        self.writers.pop(key).close()
+
+    def close_idle(self):
+        """Close partitions that weren't written to for idle_timeout seconds
+        and those about to be compacted. An open file keeps Windows from
+        renaming it, which compaction needs"""
+        now = time.monotonic()
+        horizon = self.write_horizon()
+        for key in list(self.writers):
+            if now - self.last_write[key] >= self.config["idle_timeout"] or partition_range(key)[1] <= horizon:
+                self.close_writer(key)
+
+    def write_rows(self, rows):
+        """Insert standalone_events rows, one IMMEDIATE transaction per partition.
+        Returns how many were written, rows past retention are left out"""
+        today = datetime.now(timezone.utc).date()
+        horizon = self.write_horizon(today)
+        cutoff = self.retention_cutoff(today)
+        if cutoff is not None:
+            rows = [row for row in rows if not self.is_expired(row, cutoff)]
+        batches = {}
+        for row in rows:
+            batches.setdefault(self.partition_for_row(row, today, horizon), []).append(row)
+        for key, batch in batches.items():
+            conn = self.open_writer(key)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(INSERT_SQL, batch)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        self.close_idle()
+        return len(rows)
+
+    def close(self):
+        while self.writers:
+            self.close_writer(next(iter(self.writers)))
+
+    def query(self, sql, params=(), start=None, end=None):
+        """Run sql against a standalone_events view of the partitions that
+        overlap [start, end], limited to that range. When the range spans more
+        partitions than SQLite can attach, sql runs once per group of partitions
+        and the rows are concatenated, so aggregates should group by a time
+        bucket or be combined by the caller"""
+        conn = sqlite3.connect('file::memory:', uri=True)
+        try:
+            sqlite_profile.apply_connection_pragmas(conn, dict(self.profile, journal_mode=None))
+            try:
+                limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            except AttributeError:  # Python before 3.11
+                limit = DEFAULT_ATTACH_LIMIT
+            sources = []
+            for partition in self.prune(start, end):
+                if partition.compact_path:
+                    sources.append(read_only_uri(partition.compact_path, immutable=True))
+                if partition.live_path:
+                    sources.append(read_only_uri(partition.live_path))
+            conditions = range_conditions(start, end)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            rows = []
+            for offset in range(0, max(len(sources), 1), limit):
+                group = sources[offset:offset + limit]
+                for i, uri in enumerate(group):
+                    conn.execute(f"ATTACH DATABASE ? AS p{i}", (uri,))
+                selects = [f"SELECT * FROM p{i}.standalone_events{where}" for i in range(len(group))]
+                if not selects:
+                    # No partitions yet, an empty table with the same columns
+                    conn.execute(EVENTS_TABLE_SQL.replace("CREATE TABLE IF NOT EXISTS", "CREATE TEMP TABLE"))
+                else:
+                    conn.execute(f"CREATE TEMP VIEW standalone_events AS {' UNION ALL '.join(selects)}")
+                rows.extend(conn.execute(sql, params).fetchall())
+                conn.execute(f"DROP {'VIEW' if selects else 'TABLE'} temp.standalone_events")
+                for i in range(len(group)):
+                    conn.execute(f"DETACH DATABASE p{i}")
+            return rows
+        finally:
+            conn.close()
+
+    def apply_retention(self, today=None):
+        """Delete partitions that ended more than retention_days ago"""
+        cutoff = self.retention_cutoff(today)
+        if cutoff is None:
+            return []
+        removed = []
+        for partition in self.partitions():
+            if partition.end > cutoff:
+                continue
+            try:
+                for path in (partition.live_path, partition.compact_path):
+                    if path:
+                        remove_database(path)
+            except OSError as e:
+                logger.warning(f"Could not remove partition {partition.key}: {e}")
+                continue
+            removed.append(partition.key)
+        if removed:
+            logger.info(f"Retention removed {len(removed)} event partitions: {', '.join(removed)}")
+        return removed
+
+    def compact_partition(self, partition):
+        """Rewrite a live partition into a read-only file with VACUUM INTO.
+
+        The live file is renamed to a tombstone first, which fails on Windows
+        while a worker still has it open, so the compacted file is only
+        published once no writer can add to the live one any more. Events
+        already in an earlier compacted file are folded in once by uuid, which
+        also repairs a compaction that was interrupted after publishing"""
+        tombstone = partition.live_path + TOMBSTONE_SUFFIX
+        tmp_path = f"{self.compact_path(partition.key)}.tmp"
+        remove_database(tmp_path)
+        move_database(partition.live_path, tombstone)
+        try:
+            conn = sqlite3.connect(tombstone, isolation_level=None)
+            try:
+                sqlite_profile.apply_connection_pragmas(conn, self.profile)
+                if partition.compact_path:
+                    # Fold in an earlier compaction, e.g. after compact_after_days changed
+                    conn.execute("ATTACH DATABASE ? AS compacted", (read_only_uri(partition.compact_path, immutable=True),))
+                    columns = "uuid, event, distinct_id, team_token, properties, timestamp, created_at"
+                    conn.execute(f"INSERT INTO main.standalone_events ({columns}) "
+                                 f"SELECT {columns} FROM compacted.standalone_events "
+                                 f"WHERE uuid NOT IN (SELECT uuid FROM main.standalone_events)")
+                    conn.execute("DETACH DATABASE compacted")
+                conn.execute("VACUUM INTO ?", (tmp_path,))
+            finally:
+                conn.close()
+            os.chmod(tmp_path, stat.S_IREAD)
+        except (OSError, sqlite3.Error):
+            remove_database(tmp_path)
+            move_database(tombstone, partition.live_path)
+            raise
+        if partition.compact_path:
+            remove_database(partition.compact_path)
+        os.replace(tmp_path, self.compact_path(partition.key))
+        remove_database(tombstone)
+
+    def restore_tombstones(self):
+        """Put back live partitions left renamed by an interrupted compaction"""
+        if not os.path.isdir(self.root):
+            return
+        for filename in os.listdir(self.root):
+            if not filename.endswith(".db" + TOMBSTONE_SUFFIX):
+                continue
+            live_path = os.path.join(self.root, filename[:-len(TOMBSTONE_SUFFIX)])
+            if os.path.exists(live_path):
+                logger.warning(f"Both {filename} and its live partition exist, leaving them for inspection")
+                continue
+            move_database(live_path + TOMBSTONE_SUFFIX, live_path)
+            logger.info(f"Restored {os.path.basename(live_path)} after an interrupted compaction")
+
+    def compact(self, today=None):
+        """Compact live partitions that no writer uses any more"""
+        # One day of slack for workers whose clock is just before midnight
+        horizon = self.write_horizon(today) - timedelta(days=1)
+        compacted = []
+        try:
+            self.restore_tombstones()
+        except OSError as e:
+            logger.warning(f"Could not restore an interrupted compaction: {e}")
+        for partition in self.partitions():
+            if partition.live_path is None or partition.end > horizon:
+                continue
+            try:
+                before = os.path.getsize(partition.live_path)
+                self.compact_partition(partition)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Could not compact partition {partition.key}: {e}")
+                continue
+            after = os.path.getsize(self.compact_path(partition.key))
+            logger.info(f"Compacted event partition {partition.key}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+            compacted.append(partition.key)
+        return compacted
+
+    def maintain(self, today=None):
+        """Apply retention, then compact what is left"""
+        return {"removed": self.apply_retention(today), "compacted": self.compact(today)}
+
+    def describe(self):
+        """Size and event count of every partition"""
+        details = []
+        for partition in self.partitions():
+            paths = [path for path in (partition.compact_path, partition.live_path) if path]
+            size = sum(os.path.getsize(path + suffix) for path in paths
+                       for suffix in ("",) + SIDECAR_SUFFIXES if os.path.exists(path + suffix))
+            events = 0
+            for path in paths:
+                conn = sqlite3.connect(read_only_uri(path, immutable=path == partition.compact_path), uri=True)
+                try:
+                    # Rows are never deleted from a partition, so the highest id is the count
+                    events += conn.execute("SELECT MAX(id) FROM standalone_events").fetchone()[0] or 0
+                except sqlite3.Error:
+                    pass
+                finally:
+                    conn.close()
+            details.append({
+                "key": partition.key,
+                "start": partition.start.isoformat(),
+                "end": partition.end.isoformat(),
+                "compacted": partition.compact_path is not None and partition.live_path is None,
+                "bytes": size,
+                "events": events,
+            })
+        return details
+
+    def total_bytes(self):
+        """Size of all partition files on disk"""
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.is_file())
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the partitioned event storage")
+    parser.add_argument('--data-dir', default=os.path.join(os.path.abspath(os.path.dirname(__file__)), "data"))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="show every partition with its size and event count")
+    commands.add_parser('maintain', help="apply retention and compact old partitions now")
+    query = commands.add_parser('query', help="run SQL against standalone_events across partitions")
+    query.add_argument('sql')
+    query.add_argument('--since', help="first day or timestamp to read")
+    query.add_argument('--until', help="last day or timestamp to read")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        with open(os.path.join(args.data_dir, "config.json")) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    store = PartitionStore(
+        args.data_dir,
+        load_partition_config(config.get("partitions")),
+        sqlite_profile.load_profile(config.get("sqlite"))
+    )
+    if args.command == 'list':
+        partitions = store.describe()
+        for partition in partitions:
+            state = "compacted" if partition["compacted"] else "live"
+            print(f"{partition['key']:<12} {state:<10} {partition['events']:>10} events {partition['bytes'] / 1e6:>9.1f} MB")
+        print(f"{len(partitions)} partitions, {store.total_bytes() / 1e6:.1f} MB in {store.root}")
+    elif args.command == 'maintain':
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        result = store.maintain()
+        print(f"Removed {len(result['removed'])} and compacted {len(result['compacted'])} partitions")
+    else:
+        try:
+            rows = store.query(args.sql, start=args.since, end=args.until)
+        except sqlite3.Error as e:
+            print(f"Query failed: {e}")
+            return 1
+        for row in rows:
+            print("\t".join("" if value is None else str(value) for value in row))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
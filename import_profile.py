@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone import-time profiler
+# Runs a startup target under "python -X importtime" and aggregates the
+# report per module and per top-level package, to find what makes the
+# launcher and its Django processes slow to start. Run it with the bundled
+# interpreter from the installation directory:
+#   python\python.exe import_profile.py django
+#   python\python.exe import_profile.py --runs 3 --json data\imports.json -- -m celery --help
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+from collections import defaultdict
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Importing standalone_launcher sets up the same paths and environment the
+# services get, without starting anything
+TARGETS = {
+    "launcher": "import standalone_launcher",
+    "django": (
+        "import standalone_launcher, os, django;"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posthog.settings');"
+        "django.setup()"
+    ),
+    "web": (
+        "import standalone_launcher, os;"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posthog.settings');"
+        "import waitress, whitenoise;"
+        "from django.core.wsgi import get_wsgi_application;"
+        "get_wsgi_application()"
+    ),
+}
+
+def parse_importtime(output):
+    """Parse -X importtime lines into (module, self_us, cumulative_us) tuples"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+            imports.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return imports
+
+def run_target(python_args, python_exe):
+    """Run the interpreter once with -X importtime and return the parsed imports"""
+    env = os.environ.copy()
+    env.pop("PYTHONIMPORTTIME", None)
+    result = subprocess.run(
+        [python_exe, "-X", "importtime"] + python_args,
+        cwd=base_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace"
+    )
+    imports = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        print(f"Warning: target exited with code {result.returncode}", file=sys.stderr)
+        print(result.stderr.splitlines()[-1] if result.stderr else "", file=sys.stderr)
+    return imports
+
+def aggregate(runs):
+    """Average per-module times over the runs and total them per package"""
+    self_times = defaultdict(list)
+    cumulative_times = defaultdict(list)
+    for imports in runs:
+        for module, self_us, cumulative_us in imports:
+            self_times[module].append(self_us)
+            cumulative_times[module].append(cumulative_us)
+
+    modules = {
+        module: {
+            "self_ms": statistics.mean(self_times[module]) / 1000,
+            "cumulative_ms": statistics.mean(cumulative_times[module]) / 1000,
+        }
+        for module in self_times
+    }
+    packages = defaultdict(lambda: {"self_ms": 0.0, "modules": 0})
+    for module, times in modules.items():
+        package = packages[module.split(".")[0]]
+        package["self_ms"] += times["self_ms"]
+        package["modules"] += 1
+    return {
+        "runs": len(runs),
+        "total_ms": sum(times["self_ms"] for times in modules.values()),
+        "modules": modules,
+        "packages": dict(packages),
+    }
+
+def print_report(report, top):
+    print(f"Total import time: {report['total_ms']:.1f} ms over {len(report['modules'])} modules "
+          f"(mean of {report['runs']} run{'s' if report['runs'] != 1 else ''})")
+
+    print(f"\nTop {top} packages by total self time:")
+    packages = sorted(report["packages"].items(), key=lambda item: item[1]["self_ms"], reverse=True)
+    for name, times in packages[:top]:
+        share = times["self_ms"] / report["total_ms"] * 100 if report["total_ms"] else 0
+        print(f"  {times['self_ms']:9.1f} ms {share:5.1f}%  {name} ({times['modules']} modules)")
+
+    print(f"\nTop {top} modules by self time:")
+    modules = sorted(report["modules"].items(), key=lambda item: item[1]["self_ms"], reverse=True)
+    for name, times in modules[:top]:
+        print(f"  {times['self_ms']:9.1f} ms  {name}")
+
+    print(f"\nTop {top} modules by cumulative time:")
+    modules.sort(key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    for name, times in modules[:top]:
+        print(f"  {times['cumulative_ms']:9.1f} ms  {name}")
+
+def parse_args(argv):
+    # Everything after "--" is passed to the interpreter instead of a target
+    python_args = None
+    if '--' in argv:
+        python_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(description="Profile import time of PostHog startup targets")
+    parser.add_argument('target', nargs='?', default='django', choices=list(TARGETS),
+                        help="startup target to profile (default django), or -- followed by interpreter arguments")
+    parser.add_argument('--runs', type=int, default=1, help="number of runs to average")
+    parser.add_argument('--top', type=int, default=25, help="rows per table")
+    parser.add_argument('--json', help="also write the full report to this file")
+    parser.add_argument('--python', default=sys.executable, help="interpreter to profile")
+    args = parser.parse_args(argv)
+    args.python_args = python_args or ["-c", TARGETS[args.target]]
+    return args
+
+def main():
+    args = parse_args(sys.argv[1:])
+    python_args = args.python_args
+
+    runs = [run_target(python_args, args.python) for _ in range(args.runs)]
+    if not any(runs):
+        print("No import timings were collected")
+        return 1
+    report = aggregate(runs)
+    print_report(report, args.top)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nFull report written to {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone launcher logging
+# Log calls only put records on a bounded queue; a listener thread writes
+# them to rotating files under data\logs, one file for the launcher and one
+# per service. Rotated files are gzipped, lines are JSON by default, and each
+# source is rate limited so a chatty service can't flood the disk
+
+import os
+import json
+import gzip
+import time
+import queue
+import shutil
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+DEFAULT_LOGGING_CONFIG = {
+    "level": "info",
+    "format": "json",  # "json" or "text"
+    "rotate": "size",  # "size" or "time"
+    "max_bytes": 10 * 1024 * 1024,
+    "when": "midnight",  # Rotation interval for "time", as for TimedRotatingFileHandler
+    "backup_count": 5,
+    "compress": True,
+    "per_service": True,
+    "rate_limit": 200,  # Lines per second per source, 0 disables the limit
+    "burst": 1000,
+    "queue_size": 10000,
+}
+LOG_FORMATS = ("json", "text")
+ROTATE_MODES = ("size", "time")
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records dropped because the queue was full, by source
+dropped_records = {}
+dropped_lock = threading.Lock()
+
+def load_logging_config(overrides=None):
+    """Return the logging settings merged over their defaults"""
+    config = dict(DEFAULT_LOGGING_CONFIG)
+    config.update(overrides or {})
+    if config["format"] not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {config['format']!r}")
+    if config["rotate"] not in ROTATE_MODES:
+        raise ValueError(f"Unknown log rotation: {config['rotate']!r}")
+    return config
+
+def record_source(record):
+    """The service a record came from, or the launcher itself"""
+    return getattr(record, 'service', None) or 'launcher'
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "service": record_source(record),
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            text += f" ({record.suppressed} lines suppressed before this one)"
+        return text
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per source; warnings and errors always pass"""
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.rate or record.levelno >= logging.WARNING:
+            return True
+        source = record_source(record)
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, suppressed = self.buckets.get(source, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[source] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[source] = (tokens - 1, now, 0)
+        # The first line through after a burst says how many were dropped
+        record.suppressed = suppressed
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            source = record_source(record)
+            with dropped_lock:
+                dropped_records[source] = dropped_records.get(source, 0) + 1
+
+    def prepare(self, record):
+        # Keep exc_info for the file formatter, but render it here since
+        # tracebacks can't be formatted after the frames are gone
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.message = record.getMessage()
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+def gzip_rotator(source, dest):
+    """Compress a rotated log file"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def create_file_handler(path, config):
+    """Rotating file handler for one log file"""
+    if config["rotate"] == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=config["when"], backupCount=config["backup_count"], encoding='utf-8', delay=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config["max_bytes"], backupCount=config["backup_count"], encoding='utf-8', delay=True
+        )
+    if config["compress"]:
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = gzip_rotator
+    handler.setFormatter(JsonFormatter() if config["format"] == "json" else TextFormatter(TEXT_FORMAT))
+    return handler
+
+class ServiceRouter(logging.Handler):
+    """Writes each record to its source's file, opening files as sources appear"""
+
+    def __init__(self, log_dir, config):
+        super().__init__()
+        self.log_dir = log_dir
+        self.config = config
+        self.handlers = {}
+
+    def handler_for(self, source):
+        if not self.config["per_service"]:
+            source = 'launcher'
+        if source not in self.handlers:
+            filename = "".join(c if c.isalnum() or c in '-_.' else '_' for c in source) + ".log"
+            self.handlers[source] = create_file_handler(os.path.join(self.log_dir, filename), self.config)
+        return self.handlers[source]
+
+    def emit(self, record):
+        # Only the listener thread calls this
+        self.handler_for(record_source(record)).handle(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+def setup_logging(log_dir, config):
+    """Send all logging through a queue to per-service rotating files; returns the listener"""
+    os.makedirs(log_dir, exist_ok=True)
+    log_queue = queue.Queue(maxsize=config["queue_size"])
+    router = ServiceRouter(log_dir, config)
+    listener = logging.handlers.QueueListener(log_queue, router, respect_handler_level=False)
+
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(config["rate_limit"], config["burst"]))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config["level"].upper())
+    listener.start()
+    return listener
+
+def stop_logging(listener):
+    """Write out queued records and close the files"""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone status endpoint
+# Serves the launcher's metrics snapshot on a local port:
+#   /metrics  Prometheus text format
+#   /status   JSON
+# The snapshot is collected by the launcher when a request comes in.
+# A POST to /reload asks the launcher to replace its web workers
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('posthog_launcher.status')
+
+DEFAULT_STATUS_CONFIG = {
+    "enabled": True,
+    "port": 16380,
+}
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def load_status_config(overrides=None):
+    """Return the status endpoint settings merged over their defaults"""
+    config = dict(DEFAULT_STATUS_CONFIG)
+    config.update(overrides or {})
+    return config
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+def metric_families(snapshot):
+    """Turn a launcher snapshot into (name, type, help, samples) families, where
+    samples are (labels, value) or (labels, value, name suffix)"""
+    services = snapshot["services"]
+
+    def per_service(key):
+        return [
+            ({"service": name}, metrics[key])
+            for name, metrics in services.items() if metrics.get(key) is not None
+        ]
+
+    families = [
+        ("posthog_launcher_uptime_seconds", "gauge", "Seconds since the launcher started",
+         [({}, snapshot["uptime_seconds"])]),
+        ("posthog_service_up", "gauge", "1 if the service is running",
+         [({"service": name}, int(metrics["state"] == "running")) for name, metrics in services.items()]),
+        ("posthog_service_state", "gauge", "1 for the service's current supervisor state",
+         [({"service": name, "state": metrics["state"]}, 1) for name, metrics in services.items()]),
+        ("posthog_service_uptime_seconds", "gauge", "Seconds since the service was last started",
+         per_service("uptime_seconds")),
+        ("posthog_service_restarts_total", "counter", "Times the supervisor restarted the service",
+         per_service("restarts")),
+        ("posthog_service_cpu_seconds_total", "counter", "CPU time of the service and its children",
+         per_service("cpu_seconds")),
+        ("posthog_service_resident_memory_bytes", "gauge", "Resident memory of the service and its children",
+         per_service("rss_bytes")),
+        ("posthog_service_open_fds", "gauge", "Open file descriptors (handles on Windows) of the service and its children",
+         per_service("open_fds")),
+    ]
+
+    latency = snapshot.get("request_latency") or {}
+    if latency.get("count"):
+        samples = [
+            ({"quantile": quantile}, latency[f"p{key}_ms"] / 1000)
+            for quantile, key in (("0.5", 50), ("0.9", 90), ("0.95", 95), ("0.99", 99))
+        ]
+        samples.append(({}, latency["count"], "_count"))
+        families.append(("posthog_request_latency_seconds", "summary",
+                         f"Web request latency over the last {latency['window_seconds']}s", samples))
+
+    database = snapshot.get("database") or {}
+    families.append(("posthog_sqlite_bytes", "gauge", "Size of the SQLite database files",
+                     [({"file": name}, size) for name, size in database.items()]))
+
+    queues = snapshot.get("queues")
+    if queues is not None:
+        families.append(("posthog_celery_queue_length", "gauge", "Tasks waiting in the Celery queue",
+                         [({"queue": name}, length) for name, length in queues.items()]))
+
+    families.append(("posthog_worker_tasks_total", "counter", "Celery tasks finished by worker group", [
+        ({"worker": name, "outcome": outcome}, count)
+        for name, totals in snapshot.get("workers", {}).items() for outcome, count in totals.items()
+    ]))
+    return families
+
+def render_prometheus(snapshot):
+    """Prometheus text exposition of a launcher snapshot"""
+    lines = []
+    for name, metric_type, help_text, samples in metric_families(snapshot):
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample in samples:
+            labels, value = sample[:2]
+            suffix = sample[2] if len(sample) > 2 else ''
+            lines.append(f"{name}{suffix}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path not in ('/metrics', '/status', ''):
+            self.send_error(404)
+            return
+        try:
+            snapshot = self.server.collect()
+        except Exception as e:
+            logger.exception("Could not collect status")
+            self.send_error(500, str(e))
+            return
+        if path == '/metrics':
+            body, content_type = render_prometheus(snapshot).encode(), PROMETHEUS_CONTENT_TYPE
+        else:
+            body, content_type = json.dumps(snapshot, indent=2).encode(), 'application/json'
+        self.send_body(200, body, content_type)
+
+    def do_POST(self):
+        if self.path.split('?')[0].rstrip('/') != '/reload' or self.server.reload is None:
+            self.send_error(404)
+            return
+        self.server.reload()
+        self.send_body(202, json.dumps({"reload": "requested"}).encode(), 'application/json')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port, collect, reload=None):
+        super().__init__(('127.0.0.1', port), StatusRequestHandler)
+        self.collect = collect
+        self.reload = reload
+
+def start_status_server(config, collect, reload=None):
+    """Serve the status endpoint, returning None if it is disabled or the port is taken"""
+    if not config["enabled"]:
+        return None
+    try:
+        server = StatusServer(config["port"], collect, reload)
+    except OSError as e:
+        logger.error(f"Could not start the status endpoint on port {config['port']}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='status', daemon=True).start()
+    logger.info(f"Status endpoint on http://127.0.0.1:{config['port']}/metrics and /status")
+    return server
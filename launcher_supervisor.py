@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone service supervisor
+# Runs the launcher's child processes as supervised services: their output is
+# drained into the log, crashed services are restarted with exponential
+# backoff, and each service reports its state and resource usage. Celery
+# worker groups also report task throughput and latency parsed from their log
+
+import os
+import re
+import time
+import queue
+import base64
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import launcher_logging
+
+try:
+    import psutil
+except ImportError:  # Resource accounting is skipped without psutil
+    psutil = None
+
+logger = logging.getLogger('posthog_launcher.supervisor')
+
+# Services managed by the supervisor, keyed by name
+services = {}
+shutting_down = threading.Event()
+
+# Restart policy
+SUPERVISE_INTERVAL = 1
+RESTART_BACKOFF_INITIAL = 1
+RESTART_BACKOFF_MAX = 60
+RESTART_BACKOFF_RESET = 60
+STOP_GRACE_PERIOD = 10
+
+# Child process output is drained by reader threads into a bounded queue, so a
+# slow log file can only ever drop lines, never block a child on a full pipe
+OUTPUT_BUFFER_LINES = 500
+OUTPUT_QUEUE_SIZE = 10000
+output_queue = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+recent_output = {}
+dropped_output = {}
+dropped_output_lock = threading.Lock()
+
+def log_output_lines():
+    """Write queued child process output to the service's log"""
+    while True:
+        service, line = output_queue.get()
+        logging.getLogger(f'posthog_launcher.{service}').info(line, extra={"service": service})
+
+def pump_stream(service, stream, on_line=None):
+    """Read a child's output stream line by line until it closes"""
+    try:
+        for raw in iter(stream.readline, b''):
+            line = raw.decode('utf-8', errors='replace').rstrip()
+            if on_line is not None:
+                on_line(line)
+            record_output(service, line)
+    finally:
+        stream.close()
+
+def record_output(service, line):
+    """Keep a line of service output for diagnostics and queue it for the log"""
+    recent_output.setdefault(service, deque(maxlen=OUTPUT_BUFFER_LINES)).append(line)
+    try:
+        output_queue.put_nowait((service, line))
+    except queue.Full:
+        with dropped_output_lock:
+            dropped_output[service] = dropped_output.get(service, 0) + 1
+
+def start_output_pump(service, process, on_line=None):
+    """Drain a child's stdout and stderr on background reader threads"""
+    threads = []
+    for stream in (process.stdout, process.stderr):
+        if stream is None:
+            continue
+        thread = threading.Thread(
+            target=pump_stream,
+            args=(service, stream, on_line),
+            name=f'{service}-output',
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def get_recent_output(service, lines=20):
+    """Return the last lines a service wrote to stdout or stderr"""
+    return list(recent_output.get(service, ()))[-lines:]
+
+def log_recent_output(service):
+    """Log the tail of a service's output, e.g. after it failed"""
+    for line in get_recent_output(service):
+        logger.error(f"[{service}] {line}")
+    if dropped_output.get(service):
+        logger.warning(f"Dropped {dropped_output[service]} output lines from {service}")
+    if launcher_logging.dropped_records.get(service):
+        logger.warning(f"Log queue was full, dropped {launcher_logging.dropped_records[service]} lines from {service}")
+class ManagedService:
+    """A child process that the supervisor keeps running"""
+
+    def __init__(self, name, command, on_line=None, listen_socket=None, ready_line=None):
+        self.name = name
+        self.command = command
+        self.on_line = on_line
+        self.listen_socket = listen_socket
+        self.ready_line = ready_line
+        self.ready = threading.Event()
+        self.process = None
+        self.state = 'stopped'
+        self.started_at = None
+        self.restarts = 0
+        self.failures = 0
+        self.restart_at = None
+        self.last_exit_code = None
+        self.cpu_seconds = None
+        self.rss_bytes = None
+        self.open_fds = None
+
+    def start(self):
+        """Start the child process and begin draining its output"""
+        logger.info(f"Starting {self.name}: {' '.join(self.command)}")
+        command = list(self.command)
+        handoff = {}
+        if self.listen_socket is not None:
+            # stdin carries the socket on Windows and control commands everywhere
+            handoff['stdin'] = subprocess.PIPE
+            if os.name != 'nt':
+                fd = self.listen_socket.fileno()
+                command += ['--fd', str(fd)]
+                handoff['pass_fds'] = (fd,)
+        self.process = subprocess.Popen(
+            command,
+            env=os.environ.copy(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **handoff
+        )
+        if self.listen_socket is not None and os.name == 'nt':
+            try:
+                share = self.listen_socket.share(self.process.pid)
+                self.process.stdin.write(base64.b64encode(share) + b'\n')
+                self.process.stdin.flush()
+            except OSError:
+                # A worker that never got the socket can't serve, don't leave it behind
+                self.process.kill()
+                self.process.wait()
+                raise
+        self.state = 'running'
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        self.ready.clear()
+        start_output_pump(self.name, self.process, on_line=self.handle_line)
+        return self.process
+
+    def handle_line(self, line):
+        if self.ready_line is not None and line == self.ready_line:
+            self.ready.set()
+        if self.on_line is not None:
+            self.on_line(line)
+
+    def drain(self, timeout):
+        """Ask a web worker to finish its in-flight requests and exit, stopping it after the timeout"""
+        self.state = 'draining'
+        process = self.process
+        try:
+            process.stdin.write(b'drain\n')
+            process.stdin.flush()
+        except (OSError, ValueError):
+            pass  # Already gone
+        try:
+            process.wait(timeout + STOP_GRACE_PERIOD)
+            logger.info(f"Retired {self.name} (pid {process.pid})")
+            self.state = 'stopped'
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{self.name} did not drain within {timeout}s")
+            self.stop()
+
+    def stop(self, grace_period=STOP_GRACE_PERIOD):
+        """Terminate the child, killing it if it outlives the grace period"""
+        self.state = 'stopping'
+        process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                process.terminate()
+                process.wait(grace_period)
+                logger.info(f"Terminated {self.name} (pid {process.pid})")
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                logger.warning(f"Killed {self.name} (pid {process.pid}) after {grace_period}s grace period")
+            except OSError as e:
+                logger.error(f"Failed to stop {self.name}: {e}")
+        self.state = 'stopped'
+
+    def check(self):
+        """Notice a crashed child and restart it with exponential backoff"""
+        if self.state == 'running' and self.process.poll() is not None:
+            self.last_exit_code = self.process.returncode
+            if time.monotonic() - self.started_at >= RESTART_BACKOFF_RESET:
+                self.failures = 0
+            delay = self.schedule_restart('restarting')
+            logger.error(f"{self.name} exited with code {self.last_exit_code}, restarting in {delay}s")
+            log_recent_output(self.name)
+        elif self.state in ('restarting', 'failed') and time.monotonic() >= self.restart_at:
+            try:
+                self.start()
+                self.restarts += 1
+            except OSError as e:
+                # Stays down until the next attempt, backing off like a crash
+                delay = self.schedule_restart('failed')
+                logger.error(f"Failed to restart {self.name}: {e}, retrying in {delay}s")
+
+    def schedule_restart(self, state):
+        """Wait out the next backoff delay in the given state, returning the delay"""
+        delay = min(RESTART_BACKOFF_INITIAL * 2 ** self.failures, RESTART_BACKOFF_MAX)
+        self.failures += 1
+        self.state = state
+        self.restart_at = time.monotonic() + delay
+        return delay
+
+    def sample(self):
+        """Update CPU time, RSS and open handles for the child and its descendants"""
+        if psutil is None or self.process is None or self.process.poll() is not None:
+            self.cpu_seconds = self.rss_bytes = self.open_fds = None
+            return
+        try:
+            parent = psutil.Process(self.process.pid)
+            members = [parent] + parent.children(recursive=True)
+            cpu_seconds = rss_bytes = open_fds = 0
+            for member in members:
+                with member.oneshot():
+                    times = member.cpu_times()
+                    cpu_seconds += times.user + times.system
+                    rss_bytes += member.memory_info().rss
+                    open_fds += member.num_handles() if os.name == 'nt' else member.num_fds()
+        except psutil.Error:
+            return
+        self.cpu_seconds = cpu_seconds
+        self.rss_bytes = rss_bytes
+        self.open_fds = open_fds
+
+    def metrics(self):
+        """Return the service's current state and resource usage"""
+        running = self.process is not None and self.state == 'running'
+        return {
+            "state": self.state,
+            "pid": self.process.pid if running else None,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1) if running else 0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "cpu_seconds": self.cpu_seconds,
+            "rss_bytes": self.rss_bytes,
+            "open_fds": self.open_fds,
+        }
+
+def supervise(name, command, on_line=None, listen_socket=None, ready_line=None):
+    """Start a command as a supervised service"""
+    service = ManagedService(name, command, on_line=on_line, listen_socket=listen_socket, ready_line=ready_line)
+    service.start()
+    services[name] = service
+    return service
+
+def run_supervisor(periodic=()):
+    """Restart crashed services and run each (interval, task) as it comes due, interval 0 on every check"""
+    due = [time.monotonic()] * len(periodic)
+    while not shutting_down.wait(SUPERVISE_INTERVAL):
+        for service in list(services.values()):
+            service.check()
+        for index, (interval, task) in enumerate(periodic):
+            if time.monotonic() >= due[index]:
+                task()
+                due[index] = time.monotonic() + interval
+
+class TaskStats:
+    """Task throughput and latency of one worker group, parsed from its log"""
+
+    # Celery logs "Task <name>[<id>] received" and then "... succeeded in <s>s"
+    # or "... raised unexpected" at INFO level
+    TASK_LINE = re.compile(r"Task (\S+)\[([0-9a-f-]+)\] (received|succeeded in ([0-9.e-]+)s|raised|retry)")
+
+    def __init__(self, name, queues):
+        self.name = name
+        self.queues = queues
+        self.received = {}
+        self.lock = threading.Lock()
+        self.totals = {"succeeded": 0, "failed": 0, "retried": 0}
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_started = time.monotonic()
+        self.window_done = 0
+        self.window_failed = 0
+        self.runtimes = []
+        self.latencies = []
+
+    def on_line(self, line):
+        match = self.TASK_LINE.search(line)
+        if not match:
+            return
+        task_id, outcome = match.group(2), match.group(3)
+        now = time.monotonic()
+        with self.lock:
+            if outcome == 'received':
+                self.received[task_id] = now
+                return
+            received_at = self.received.pop(task_id, None)
+            if outcome == 'retry':
+                self.totals["retried"] += 1
+                return
+            self.window_done += 1
+            if outcome == 'raised':
+                self.totals["failed"] += 1
+                self.window_failed += 1
+            else:
+                self.totals["succeeded"] += 1
+                self.runtimes.append(float(match.group(4)))
+            if received_at is not None:
+                self.latencies.append(now - received_at)
+
+    def summary(self):
+        """Return and reset the stats collected since the last summary"""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.window_started, 1e-9)
+            runtimes = sorted(self.runtimes)
+            latencies = sorted(self.latencies)
+            summary = {
+                "tasks": self.window_done,
+                "failed": self.window_failed,
+                "throughput_per_second": self.window_done / elapsed,
+                "runtime_avg_ms": sum(runtimes) / len(runtimes) * 1000 if runtimes else None,
+                "latency_p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+                "latency_p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            }
+            self.reset_window()
+        return summary
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+worker_stats = {}
+
+def log_worker_stats():
+    """Log per worker group task throughput and latency"""
+    for stats in list(worker_stats.values()):
+        summary = stats.summary()
+        if not summary["tasks"]:
+            continue
+        queues = ','.join(stats.queues) if stats.queues else 'default queues'
+        runtime = f"{summary['runtime_avg_ms']:.0f}ms" if summary["runtime_avg_ms"] is not None else "n/a"
+        latency = (
+            f"p50 {summary['latency_p50_ms']:.0f}ms p95 {summary['latency_p95_ms']:.0f}ms"
+            if summary["latency_p50_ms"] is not None else "n/a"
+        )
+        logger.info(
+            f"Worker {stats.name} [{queues}]: {summary['tasks']} tasks "
+            f"({summary['throughput_per_second']:.2f}/s), {summary['failed']} failed, "
+            f"runtime avg {runtime}, latency {latency}"
+        )
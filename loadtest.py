@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone load tester
+# Sends synthetic or recorded capture traffic to a running PostHog at a
+# target event rate, while reader threads run dashboard-style queries against
+# data\posthog.db. Reports capture throughput and latency, read latency per
+# query, how long a writer waits for the SQLite write lock and how much the
+# database grows per million events. With partitioned event storage the
+# queries go through event_partitions. Run it next to the launcher with the
+# bundled interpreter from the installation directory:
+#   python\python.exe loadtest.py --rate 2000 --duration 60
+#   python\python.exe loadtest.py --replay capture.jsonl --concurrency 16 --readers 4 --json data\loadtest.json
+
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import itertools
+import threading
+import http.client
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import sqlite_profile
+import event_partitions
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+data_dir = os.path.join(base_dir, "data")
+config_path = os.path.join(data_dir, "config.json")
+db_path = os.path.join(data_dir, "posthog.db")
+
+REQUEST_TIMEOUT = 30
+LOCK_PROBE_INTERVAL = 0.1
+# After the senders stop, wait this long at most for the ingest buffers to flush
+SETTLE_TIMEOUT = 30
+SETTLE_POLL_INTERVAL = 0.5
+
+BROWSERS = ["Chrome", "Firefox", "Safari", "Microsoft Edge"]
+OPERATING_SYSTEMS = ["Windows", "Mac OS X", "Linux", "iOS", "Android"]
+PAGES = ["/", "/pricing", "/docs", "/blog", "/signup", "/login", "/product", "/about"]
+CUSTOM_EVENTS = ["signed_up", "purchase", "feature_used", "invite_sent", "file_exported"]
+
+def pageview_event(rng, distinct_id, extra_properties):
+    """A $pageview as posthog-js sends it"""
+    page = rng.choice(PAGES)
+    properties = {
+        "$current_url": f"http://localhost:8000{page}",
+        "$host": "localhost:8000",
+        "$pathname": page,
+        "$browser": rng.choice(BROWSERS),
+        "$browser_version": rng.randint(100, 130),
+        "$os": rng.choice(OPERATING_SYSTEMS),
+        "$device_type": rng.choice(["Desktop", "Mobile", "Tablet"]),
+        "$screen_height": rng.choice([768, 900, 1080, 1440]),
+        "$screen_width": rng.choice([1366, 1440, 1920, 2560]),
+        "$referrer": rng.choice(["$direct", "https://www.google.com/", "https://news.ycombinator.com/"]),
+        "$lib": "web",
+        "$lib_version": "1.160.0",
+        "$session_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "$window_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "$pageview_id": str(uuid.UUID(int=rng.getrandbits(128))),
+    }
+    return "$pageview", properties
+
+def custom_event(rng, distinct_id, extra_properties):
+    """A small event as the server SDKs send it"""
+    properties = {
+        "$lib": "posthog-python",
+        "plan": rng.choice(["free", "pro", "enterprise"]),
+        "amount": round(rng.uniform(1, 500), 2),
+    }
+    return rng.choice(CUSTOM_EVENTS), properties
+
+def mixed_event(rng, distinct_id, extra_properties):
+    """Mostly pageviews with some custom events, like a typical product"""
+    return (pageview_event if rng.random() < 0.8 else custom_event)(rng, distinct_id, extra_properties)
+
+SHAPES = {
+    "pageview": pageview_event,
+    "custom": custom_event,
+    "mixed": mixed_event,
+}
+
+class SyntheticSource:
+    """Generates capture payloads of one shape; one per sender thread"""
+
+    def __init__(self, shape, batch_size, distinct_ids, extra_properties, token, seed):
+        self.make_event = SHAPES[shape]
+        self.batch_size = batch_size
+        self.distinct_ids = distinct_ids
+        self.extra_properties = extra_properties
+        self.token = token
+        self.rng = random.Random(seed)
+
+    def next_payload(self):
+        """Return a capture request body and the number of events in it"""
+        now = datetime.now(timezone.utc).isoformat()
+        batch = []
+        for _ in range(self.batch_size):
+            distinct_id = f"user-{self.rng.randrange(self.distinct_ids)}"
+            event, properties = self.make_event(self.rng, distinct_id, self.extra_properties)
+            for i in range(self.extra_properties):
+                properties[f"prop_{i}"] = self.rng.choice(["alpha", "beta", "gamma", "delta"]) + str(self.rng.randrange(1000))
+            properties["distinct_id"] = distinct_id
+            batch.append({
+                "event": event,
+                "distinct_id": distinct_id,
+                "properties": properties,
+                "timestamp": now,
+                "uuid": str(uuid.UUID(int=self.rng.getrandbits(128), version=4)),
+            })
+        return json.dumps({"api_key": self.token, "batch": batch}).encode(), len(batch)
+
+class ReplaySource:
+    """Replays recorded capture payloads from a JSON lines file, looping over it.
+    Each line is a request body: an event, a list of events or {"batch": [...]}"""
+
+    def __init__(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        self.payloads = []
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                payload = json.loads(line)
+                if isinstance(payload, list):
+                    count = len(payload)
+                elif isinstance(payload, dict):
+                    count = len(payload.get('batch') or payload.get('data') or [payload])
+                else:
+                    continue
+                self.payloads.append((line.encode('utf-8'), count))
+        if not self.payloads:
+            raise ValueError(f"No capture payloads in {path}")
+        self.cycle = itertools.cycle(self.payloads)
+        self.lock = threading.Lock()
+
+    def next_payload(self):
+        with self.lock:
+            return next(self.cycle)
+
+class Pacer:
+    """Hands out send times so that all senders together keep the target rate"""
+
+    def __init__(self, rate, duration, max_events):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.deadline = self.started + duration if duration else None
+        self.max_events = max_events
+        self.scheduled_events = 0
+        self.lock = threading.Lock()
+
+    def next_send(self, events):
+        """Return when to send a request with this many events, or None when done"""
+        with self.lock:
+            if self.max_events and self.scheduled_events >= self.max_events:
+                return None
+            due = self.started + self.scheduled_events / self.rate if self.rate else time.monotonic()
+            if self.deadline is not None and due >= self.deadline:
+                return None
+            self.scheduled_events += events
+            return due
+
+class Samples:
+    """Thread-safe latency samples by name"""
+
+    def __init__(self):
+        self.values = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.values[name].append(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def summarize(values):
+    """Latency percentiles in milliseconds"""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    summary = {"count": len(values)}
+    for percent in (50, 95, 99):
+        summary[f"p{percent}_ms"] = round(percentile(values, percent) * 1000, 2)
+    summary["max_ms"] = round(values[-1] * 1000, 2)
+    return summary
+
+def send_capture(args, source, pacer, samples):
+    """Sender thread: post payloads on a keep-alive connection when they are due"""
+    conn = None
+    path = args.path + ('?compression=gzip-js' if args.gzip else '')
+    while True:
+        body, events = source.next_payload()
+        due = pacer.next_send(events)
+        if due is None:
+            break
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if args.gzip:
+            body = gzip.compress(body)
+        began = time.monotonic()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(args.host, args.port, timeout=REQUEST_TIMEOUT)
+            conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            if conn is not None:
+                conn.close()
+            conn = None
+        # Measured from when the request was due, so a server that falls
+        # behind shows up in the latency instead of lowering the send rate
+        samples.add('capture', time.monotonic() - (due if args.rate else began))
+        if ok:
+            samples.count('requests_ok')
+            samples.count('events_sent', events)
+        else:
+            samples.count('requests_failed')
+    if conn is not None:
+        conn.close()
+
+def read_queries(rng, distinct_ids):
+    """Dashboard-style queries on standalone_events as (name, sql, parameters, since)"""
+    now = datetime.now(timezone.utc)
+    day_ago = now - timedelta(days=1)
+    week_ago = now - timedelta(days=7)
+    return [
+        ("recent_events",
+         "SELECT event, distinct_id, timestamp FROM standalone_events ORDER BY id DESC LIMIT 100", (), day_ago),
+        ("event_counts_24h",
+         "SELECT event, COUNT(*) FROM standalone_events WHERE timestamp >= ? GROUP BY event ORDER BY 2 DESC",
+         (day_ago.isoformat(),), day_ago),
+        ("pageview_trend_7d",
+         "SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM standalone_events "
+         "WHERE timestamp >= ? AND event = '$pageview' GROUP BY day ORDER BY day", (week_ago.isoformat(),), week_ago),
+        ("unique_users_24h",
+         "SELECT COUNT(DISTINCT distinct_id) FROM standalone_events WHERE timestamp >= ?",
+         (day_ago.isoformat(),), day_ago),
+        ("browser_breakdown_24h",
+         "SELECT json_extract(properties, '$.\"$browser\"') AS browser, COUNT(*) FROM standalone_events "
+         "WHERE timestamp >= ? AND event = '$pageview' GROUP BY browser ORDER BY 2 DESC",
+         (day_ago.isoformat(),), day_ago),
+        ("person_events",
+         "SELECT event, timestamp FROM standalone_events WHERE distinct_id = ? ORDER BY id DESC LIMIT 50",
+         (f"user-{rng.randrange(distinct_ids)}",), None),
+    ]
+
+def run_reader(args, profile, store, stop, samples, seed):
+    """Reader thread: run the dashboard queries in turn until stopped"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(args.db, check_same_thread=False)
+    sqlite_profile.apply_connection_pragmas(conn, profile)
+    try:
+        while not stop.is_set():
+            for name, sql, parameters, since in read_queries(rng, args.distinct_ids):
+                if stop.is_set():
+                    break
+                began = time.monotonic()
+                try:
+                    if store is not None:
+                        store.query(sql, parameters, start=since)
+                    else:
+                        conn.execute(sql, parameters).fetchall()
+                except sqlite3.Error:
+                    samples.count(f'read_failed.{name}')
+                    continue
+                samples.add(f'read.{name}', time.monotonic() - began)
+                if args.read_interval:
+                    stop.wait(args.read_interval)
+    finally:
+        conn.close()
+
+def probe_write_lock(args, store, stop, samples):
+    """Time how long a writer waits to get the write lock, like the ingest buffer does"""
+    conn = None
+    try:
+        while not stop.wait(LOCK_PROBE_INTERVAL):
+            if conn is None:
+                # Today's partition only exists once the first events are written
+                path = args.db if store is None else store.live_path(store.key_for_day(datetime.now(timezone.utc).date()))
+                if not os.path.exists(path):
+                    continue
+                conn = sqlite3.connect(path, timeout=REQUEST_TIMEOUT, isolation_level=None, check_same_thread=False)
+            began = time.monotonic()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                samples.count('lock_timeouts')
+                continue
+            samples.add('lock_wait', time.monotonic() - began)
+            conn.execute("ROLLBACK")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def database_state(path, store=None):
+    """Logical size of the event storage and the number of events in it"""
+    if store is not None:
+        partitions = store.describe()
+        size = sum(partition["bytes"] for partition in partitions)
+        return {"bytes": size, "file_bytes": size, "events": sum(partition["events"] for partition in partitions)}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        try:
+            # Events are only appended, so the highest id is the count
+            events = conn.execute("SELECT MAX(id) FROM standalone_events").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            events = 0
+    finally:
+        conn.close()
+    files = sum(os.path.getsize(f) for f in (path, f"{path}-wal") if os.path.exists(f))
+    return {"bytes": page_count * page_size, "file_bytes": files, "events": events}
+
+def wait_for_ingest(path, store, expected_events, flush_interval):
+    """Wait until the web workers have written the sent events, or stop changing"""
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    state = database_state(path, store)
+    last_change = time.monotonic()
+    while state["events"] < expected_events and time.monotonic() < deadline:
+        time.sleep(SETTLE_POLL_INTERVAL)
+        current = database_state(path, store)
+        if current["events"] != state["events"]:
+            last_change = time.monotonic()
+        elif time.monotonic() - last_change > max(flush_interval * 3, 2):
+            break
+        state = current
+    return state
+
+def load_config():
+    try:
+        with open(config_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def run_load_test(args):
+    config = load_config()
+    profile = sqlite_profile.load_profile(config.get("sqlite"))
+    flush_interval = (config.get("ingest") or {}).get("flush_interval", 1.0)
+    partition_config = event_partitions.load_partition_config(config.get("partitions"))
+    store = None
+    if partition_config["enabled"]:
+        store = event_partitions.PartitionStore(os.path.dirname(args.db), partition_config, profile)
+    before = database_state(args.db, store)
+
+    if args.replay:
+        replay = ReplaySource(args.replay)
+        sources = [replay] * args.concurrency
+    else:
+        sources = [
+            SyntheticSource(args.shape, args.batch_size, args.distinct_ids, args.properties, args.token, args.seed + i)
+            for i in range(args.concurrency)
+        ]
+
+    samples = Samples()
+    stop = threading.Event()
+    background = [threading.Thread(target=probe_write_lock, args=(args, store, stop, samples), daemon=True)]
+    background += [
+        threading.Thread(target=run_reader, args=(args, profile, store, stop, samples, args.seed + i), daemon=True)
+        for i in range(args.readers)
+    ]
+    for thread in background:
+        thread.start()
+
+    pacer = Pacer(args.rate, args.duration, args.events)
+    senders = [
+        threading.Thread(target=send_capture, args=(args, source, pacer, samples), daemon=True)
+        for source in sources
+    ]
+    for thread in senders:
+        thread.start()
+    for thread in senders:
+        thread.join()
+    send_seconds = time.monotonic() - pacer.started
+
+    sent = samples.counters['events_sent']
+    after = wait_for_ingest(args.db, store, before["events"] + sent, flush_interval)
+    stop.set()
+    for thread in background:
+        thread.join(REQUEST_TIMEOUT)
+    total_seconds = time.monotonic() - pacer.started
+
+    written = after["events"] - before["events"]
+    growth = after["bytes"] - before["bytes"]
+    return {
+        "target_rate": args.rate,
+        "concurrency": args.concurrency,
+        "readers": args.readers,
+        "source": args.replay or f"synthetic:{args.shape}",
+        "send_seconds": round(send_seconds, 2),
+        "capture": {
+            "events_sent": sent,
+            "events_written": written,
+            "requests_ok": samples.counters['requests_ok'],
+            "requests_failed": samples.counters['requests_failed'],
+            "sent_per_second": round(sent / send_seconds, 1) if send_seconds else 0,
+            "written_per_second": round(written / total_seconds, 1) if total_seconds else 0,
+            "latency": summarize(samples.values['capture']),
+        },
+        "reads": {
+            name[len('read.'):]: dict(summarize(values), failed=samples.counters[f'read_failed.{name[len("read."):]}'])
+            for name, values in sorted(samples.values.items()) if name.startswith('read.')
+        },
+        "lock_wait": dict(summarize(samples.values['lock_wait']), timeouts=samples.counters['lock_timeouts']),
+        "database": {
+            "bytes_before": before["bytes"],
+            "bytes_after": after["bytes"],
+            "file_bytes_after": after["file_bytes"],
+            "events_after": after["events"],
+            "bytes_per_million_events": round(growth / written * 1e6) if written > 0 else None,
+        },
+    }
+
+def format_latency(summary):
+    if not summary["count"]:
+        return "no samples"
+    return (f"p50 {summary['p50_ms']:.1f}ms  p95 {summary['p95_ms']:.1f}ms  "
+            f"p99 {summary['p99_ms']:.1f}ms  max {summary['max_ms']:.1f}ms  (n={summary['count']})")
+
+def print_report(report):
+    capture = report["capture"]
+    target = f"target {report['target_rate']:g}/s" if report["target_rate"] else "unthrottled"
+    print(f"\nCapture ({report['source']}, {report['concurrency']} senders, {target}):")
+    print(f"  sent {capture['events_sent']} events in {capture['requests_ok']} requests over {report['send_seconds']:.1f}s, "
+          f"{capture['requests_failed']} failed requests")
+    print(f"  throughput: {capture['sent_per_second']:.0f} events/s sent, "
+          f"{capture['written_per_second']:.0f} events/s written ({capture['events_written']} written)")
+    print(f"  request latency: {format_latency(capture['latency'])}")
+    if report["reads"]:
+        print(f"\nRead queries ({report['readers']} readers):")
+        for name, summary in report["reads"].items():
+            failed = f", {summary['failed']} failed" if summary["failed"] else ""
+            print(f"  {name:<24} {format_latency(summary)}{failed}")
+    lock_wait = report["lock_wait"]
+    print(f"\nSQLite write lock wait: {format_latency(lock_wait)}"
+          + (f", {lock_wait['timeouts']} timeouts" if lock_wait["timeouts"] else ""))
+    database = report["database"]
+    print(f"\nDatabase: {database['bytes_before'] / 1e6:.1f} MB -> {database['bytes_after'] / 1e6:.1f} MB, "
+          f"{database['events_after']} events")
+    if database["bytes_per_million_events"] is not None:
+        print(f"  growth: {database['bytes_per_million_events'] / 1e6:.0f} MB per million events")
+
+def parse_args():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Load test a running PostHog standalone with capture traffic and reads")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config.get("port", 8000))
+    parser.add_argument('--path', default='/batch/', help="capture endpoint (default /batch/)")
+    parser.add_argument('--rate', type=float, default=1000, help="target events per second, 0 for as fast as possible")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to send for")
+    parser.add_argument('--events', type=int, help="stop after this many events instead")
+    parser.add_argument('--concurrency', type=int, default=8, help="parallel capture connections")
+    parser.add_argument('--batch-size', type=int, default=10, help="events per capture request")
+    parser.add_argument('--shape', choices=list(SHAPES), default='mixed', help="synthetic event shape")
+    parser.add_argument('--properties', type=int, default=0, help="extra properties per synthetic event")
+    parser.add_argument('--distinct-ids', type=int, default=10000, help="number of synthetic users")
+    parser.add_argument('--token', default='phc_loadtest')
+    parser.add_argument('--gzip', action='store_true', help="gzip request bodies like posthog-js")
+    parser.add_argument('--replay', help="replay recorded capture bodies from a JSON lines file (.gz allowed)")
+    parser.add_argument('--readers', type=int, default=2, help="threads running dashboard queries")
+    parser.add_argument('--read-interval', type=float, default=0.5, help="pause between a reader's queries")
+    parser.add_argument('--db', default=db_path, help="SQLite database the server writes to")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+    if args.events is not None:
+        args.duration = None
+    return args
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.db):
+        print(f"{args.db} does not exist, start PostHog first")
+        return 1
+    try:
+        http.client.HTTPConnection(args.host, args.port, timeout=5).connect()
+    except OSError as e:
+        print(f"PostHog is not answering on {args.host}:{args.port}: {e}")
+        return 1
+    try:
+        report = run_load_test(args)
+    except (OSError, ValueError) as e:
+        print(f"Load test failed: {e}")
+        return 1
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nFull report written to {args.json}")
+    return 0 if report["capture"]["requests_ok"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone local Redis service
+# Serves one shared fakeredis keyspace over the Redis protocol, so Django,
+# the Celery broker and locks in every process see the same data
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import platform
+import threading
+import socketserver
+
+logger = logging.getLogger('posthog_launcher.redis')
+
+DEFAULT_REDIS_CONFIG = {
+    "enabled": True,
+    "port": 16379,
+    "snapshot": True,
+    "snapshot_interval": 60,
+}
+
+CRLF = b"\r\n"
+RECV_SIZE = 65536
+CLOSED = object()  # Queued after a client disconnects, None is a valid reply
+SNAPSHOT_NAME = "redis-snapshot.json"
+# The Redis version fakeredis emulates, reported by INFO
+REDIS_VERSION = "7.0.0"
+# fakeredis' DUMP payloads are pickles, so RESTORE would run code sent by any
+# local process
+BLOCKED_COMMANDS = {b"dump", b"restore"}
+
+# The command engine below builds on fakeredis' private _fakesocket and
+# _helpers modules, which change between releases. fakeredis is pinned to
+# this version in requirements-standalone.txt; upgrade both together
+FAKEREDIS_VERSION = "2.23.3"
+try:
+    import fakeredis
+    from fakeredis import FakeServer, FakeStrictRedis
+    from fakeredis._fakesocket import FakeSocket
+    from fakeredis._helpers import SimpleString, SimpleError
+    from redis.exceptions import RedisError
+    import_error = None
+except ImportError as e:
+    FakeServer = None
+    import_error = e
+
+def load_redis_config(overrides=None):
+    """Return the local Redis settings merged over their defaults"""
+    config = dict(DEFAULT_REDIS_CONFIG)
+    config.update(overrides or {})
+    return config
+
+def encode_reply(value):
+    """Encode a fakeredis reply in the Redis wire protocol (RESP2)"""
+    if isinstance(value, SimpleString):
+        return b"+" + value.value + CRLF
+    if isinstance(value, SimpleError):
+        return b"-" + value.value.encode() + CRLF
+    if isinstance(value, bool):
+        return b":" + (b"1" if value else b"0") + CRLF
+    if isinstance(value, int):
+        return b":" + str(value).encode() + CRLF
+    if value is None:
+        return b"$-1" + CRLF
+    if isinstance(value, (list, tuple, set)):
+        return b"*" + str(len(value)).encode() + CRLF + b"".join(encode_reply(item) for item in value)
+    if isinstance(value, float):
+        value = repr(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return b"$" + str(len(value)).encode() + CRLF + value + CRLF
+
+if FakeServer is not None:
+    class WireSocket(FakeSocket):
+        """fakeredis command engine that keeps replies in their wire types and
+        answers INFO, which fakeredis doesn't implement"""
+
+        def __init__(self, local_server, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.local_server = local_server
+
+        def _decode_result(self, result):
+            return result
+
+        def _process_command(self, fields):
+            name = fields[0].lower() if fields else None
+            if name in BLOCKED_COMMANDS:
+                self.put_response(SimpleError(f"ERR {name.decode()} is disabled on this server"))
+            elif name == b"info" and self._transaction is None:
+                section = fields[1].decode("utf-8", "replace") if len(fields) > 1 else None
+                self.put_response(self.local_server.info(section).encode())
+            else:
+                super()._process_command(fields)
+
+class RedisRequestHandler(socketserver.BaseRequestHandler):
+    """Feed one client connection through its own fakeredis socket"""
+
+    def handle(self):
+        engine = WireSocket(self.server, self.server.fake_server, db=0)
+        replies = engine.responses
+        writer = threading.Thread(target=self.write_replies, args=(replies,), daemon=True)
+        writer.start()
+        self.server.count_client(1)
+        try:
+            while True:
+                data = self.request.recv(RECV_SIZE)
+                if not data:
+                    break
+                engine.sendall(data)
+        except (OSError, AssertionError, ValueError, StopIteration) as e:
+            # AssertionError comes from the fakeredis parser on malformed input
+            logger.debug(f"Closing Redis client {self.client_address}: {e!r}")
+        finally:
+            self.server.count_client(-1)
+            engine.close()
+            replies.put(CLOSED)
+            writer.join()
+
+    def write_replies(self, replies):
+        """Send replies, including pub/sub messages pushed by other clients"""
+        while True:
+            reply = replies.get()
+            if reply is CLOSED:
+                break
+            try:
+                self.request.sendall(encode_reply(reply))
+            except OSError:
+                break
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    """Threaded TCP server sharing one fakeredis keyspace between all clients"""
+
+    daemon_threads = True
+    allow_reuse_address = os.name != 'nt'
+
+    def __init__(self, port, snapshot_path=None):
+        super().__init__(('127.0.0.1', port), RedisRequestHandler)
+        self.fake_server = FakeServer()
+        self.snapshot_path = snapshot_path
+        self.snapshot_lock = threading.Lock()
+        self.started = time.time()
+        self.clients = 0
+        self.clients_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def count_client(self, change):
+        with self.clients_lock:
+            self.clients += change
+
+    def info(self, section=None):
+        """The INFO reply: the fields health checks and Celery read"""
+        uptime = int(time.time() - self.started)
+        sections = {
+            "server": [
+                ("redis_version", REDIS_VERSION),
+                ("redis_mode", "standalone"),
+                ("os", platform.system()),
+                ("arch_bits", 64 if sys.maxsize > 2 ** 32 else 32),
+                ("process_id", os.getpid()),
+                ("tcp_port", self.server_address[1]),
+                ("uptime_in_seconds", uptime),
+                ("uptime_in_days", uptime // 86400),
+            ],
+            "clients": [("connected_clients", self.clients), ("blocked_clients", 0)],
+            "persistence": [("loading", 0)],
+            "replication": [("role", "master"), ("connected_slaves", 0)],
+            "keyspace": [
+                (f"db{db}", f"keys={size}")
+                for db, size in sorted(
+                    (db, FakeStrictRedis(server=self.fake_server, db=db).dbsize()) for db in list(self.fake_server.dbs)
+                )
+                if size
+            ],
+        }
+        if section and section.lower() not in ("all", "default", "everything"):
+            sections = {name: fields for name, fields in sections.items() if name == section.lower()}
+        lines = []
+        for name, fields in sections.items():
+            lines.append(f"# {name.capitalize()}")
+            lines.extend(f"{field}:{value}" for field, value in fields)
+            lines.append("")
+        return "\r\n".join(lines)
+
+    def queue_lengths(self, names, db=0):
+        """LLEN of each list, e.g. the Celery queues"""
+        client = FakeStrictRedis(server=self.fake_server, db=db)
+        return {name: client.llen(name) for name in names}
+
+    def save_snapshot(self):
+        """Write every key with its remaining TTL to the snapshot file as JSON,
+        so loading it can't run code the way a pickle can"""
+        if not self.snapshot_path:
+            return 0
+        entries = []
+        for db in list(self.fake_server.dbs):
+            client = FakeStrictRedis(server=self.fake_server, db=db)
+            for key in client.scan_iter(count=1000):
+                entry = read_key(client, key)
+                if entry is None:
+                    continue
+                entry.update(db=db, key=encode_bytes(key), ttl=max(client.pttl(key), 0))
+                entries.append(entry)
+        with self.snapshot_lock:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": 1, "entries": entries}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        return len(entries)
+
+    def load_snapshot(self):
+        """Restore the keys saved by an earlier run"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path) as f:
+            entries = json.load(f)["entries"]
+        for entry in entries:
+            write_key(FakeStrictRedis(server=self.fake_server, db=entry["db"]), entry)
+        return len(entries)
+
+def encode_bytes(value):
+    return base64.b64encode(value).decode("ascii")
+
+def decode_bytes(value):
+    return base64.b64decode(value.encode("ascii"))
+
+def read_key(client, key):
+    """A key's type and value in JSON types, or None for types that aren't
+    saved (streams) and keys that expired meanwhile"""
+    kind = client.type(key).decode()
+    if kind == "string":
+        value = encode_bytes(client.get(key))
+    elif kind == "list":
+        value = [encode_bytes(item) for item in client.lrange(key, 0, -1)]
+    elif kind == "set":
+        value = [encode_bytes(item) for item in client.smembers(key)]
+    elif kind == "hash":
+        value = [[encode_bytes(field), encode_bytes(item)] for field, item in client.hgetall(key).items()]
+    elif kind == "zset":
+        value = [[encode_bytes(member), score] for member, score in client.zrange(key, 0, -1, withscores=True)]
+    else:
+        return None
+    return {"type": kind, "value": value}
+
+def write_key(client, entry):
+    """Recreate a key saved by read_key"""
+    key, kind, value = decode_bytes(entry["key"]), entry["type"], entry["value"]
+    pipe = client.pipeline()
+    pipe.delete(key)
+    if kind == "string":
+        pipe.set(key, decode_bytes(value))
+    elif kind == "list":
+        pipe.rpush(key, *[decode_bytes(item) for item in value])
+    elif kind == "set":
+        pipe.sadd(key, *[decode_bytes(item) for item in value])
+    elif kind == "hash":
+        pipe.hset(key, mapping={decode_bytes(field): decode_bytes(item) for field, item in value})
+    elif kind == "zset":
+        pipe.zadd(key, {decode_bytes(member): score for member, score in value})
+    else:
+        raise ValueError(f"Unknown Redis type in snapshot: {kind!r}")
+    if entry["ttl"]:
+        pipe.pexpire(key, entry["ttl"])
+    pipe.execute()
+
+def run_snapshots(server, interval, stop_event):
+    """Snapshot the keyspace periodically until stop_event is set"""
+    while not stop_event.wait(interval):
+        try:
+            server.save_snapshot()
+        except (OSError, RedisError) as e:
+            logger.error(f"Redis snapshot failed: {e}")
+
+def start_local_redis(config, data_dir, stop_event):
+    """Start the shared Redis service, returning None if it is unavailable"""
+    if FakeServer is None:
+        logger.warning(f"fakeredis is not available ({import_error}), processes will not share a Redis")
+        return None
+    if fakeredis.__version__ != FAKEREDIS_VERSION:
+        logger.warning(f"fakeredis {fakeredis.__version__} is installed, local Redis is built for {FAKEREDIS_VERSION}")
+    snapshot_path = os.path.join(data_dir, SNAPSHOT_NAME) if config["snapshot"] else None
+    try:
+        server = LocalRedisServer(config["port"], snapshot_path)
+    except OSError as e:
+        logger.error(f"Could not start local Redis on port {config['port']}: {e}")
+        return None
+    try:
+        restored = server.load_snapshot()
+        if restored:
+            logger.info(f"Restored {restored} Redis keys from snapshot")
+    except (OSError, ValueError, KeyError, TypeError, RedisError) as e:
+        logger.error(f"Could not restore Redis snapshot: {e}")
+
+    threading.Thread(target=server.serve_forever, name='redis', daemon=True).start()
+    if snapshot_path:
+        threading.Thread(
+            target=run_snapshots,
+            args=(server, config["snapshot_interval"], stop_event),
+            name='redis-snapshot',
+            daemon=True
+        ).start()
+    logger.info(f"Local Redis listening on {server.url}")
+    return server
@@ -10,7 +10,7 @@ REM Get the directory of this batch file
 set SCRIPT_DIR=%~dp0
 
 REM Run the Python launcher script with the bundled Python interpreter
-"%SCRIPT_DIR%python\python.exe" "%SCRIPT_DIR%standalone_launcher.py"
+"%SCRIPT_DIR%python\python.exe" "%SCRIPT_DIR%standalone_launcher.py" %*
 
 echo.
 echo PostHog has been shut down.
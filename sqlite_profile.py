@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone SQLite storage profile
+# Applies the tuned PRAGMA profile to the standalone database. Run as
+# "python sqlite_profile.py manage.py <command>" or "python sqlite_profile.py
+# -m celery ..." to run a program with the profile applied to every Django
+# database connection.
+
+import os
+import sys
+import json
+import runpy
+import logging
+
+logger = logging.getLogger('posthog_launcher.sqlite')
+
+# Environment variable the launcher uses to hand the profile to child processes
+PROFILE_ENV = 'POSTHOG_SQLITE_PROFILE'
+
+DEFAULT_PROFILE = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "cache_size": -65536,  # Negative values are KiB, i.e. 64 MB
+    "mmap_size": 268435456,
+    "page_size": 4096,
+    "temp_store": "memory",
+    "checkpoint_interval": 300,
+    "optimize_interval": 3600,
+    "analysis_limit": 1000,
+}
+
+# Pragmas that have to be set on every connection, in this order. busy_timeout
+# goes first so the others wait for locks instead of failing
+CONNECTION_PRAGMAS = ["busy_timeout", "journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"]
+
+def load_profile(overrides=None):
+    """Return the storage profile merged over its defaults"""
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(overrides or {})
+    return profile
+
+def format_pragma(name, value):
+    """Build a PRAGMA statement, refusing anything but plain words and numbers"""
+    value = str(value)
+    if not value.lstrip('-').isalnum():
+        raise ValueError(f"Invalid value for PRAGMA {name}: {value!r}")
+    return f"PRAGMA {name}={value}"
+
+def apply_connection_pragmas(conn, profile):
+    """Apply the per-connection part of the profile to a DB-API connection"""
+    cursor = conn.cursor()
+    try:
+        for name in CONNECTION_PRAGMAS:
+            if profile.get(name) is not None:
+                cursor.execute(format_pragma(name, profile[name]))
+    finally:
+        cursor.close()
+
+def initialize_storage(conn, profile):
+    """Apply the persistent part of the profile to a database file"""
+    # page_size only takes effect before the first table is created
+    tables = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]
+    if tables == 0 and profile.get("page_size"):
+        conn.execute(format_pragma("page_size", profile["page_size"]))
+        conn.execute("VACUUM")
+    apply_connection_pragmas(conn, profile)
+    return conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+def run_maintenance(conn, profile, optimize=False):
+    """Checkpoint the WAL and optionally refresh the query planner statistics"""
+    busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if busy:
+        logger.info(f"WAL checkpoint incomplete, {checkpointed}/{wal_pages} pages written")
+    if optimize:
+        if profile.get("analysis_limit"):
+            conn.execute(format_pragma("analysis_limit", profile["analysis_limit"]))
+        conn.execute("PRAGMA optimize")
+
+def install_connection_hook(profile=None):
+    """Apply the profile to every connection Django opens in this process"""
+    if profile is None:
+        profile = load_profile(json.loads(os.environ.get(PROFILE_ENV) or '{}'))
+
+    from django.db.backends.signals import connection_created
+
+    def apply_profile(sender, connection, **kwargs):
+        if connection.vendor == 'sqlite':
+            apply_connection_pragmas(connection.connection, profile)
+
+    connection_created.connect(apply_profile, weak=False)
+
+def main():
+    if len(sys.argv) < 2 or (sys.argv[1] == '-m' and len(sys.argv) < 3):
+        print("Usage: sqlite_profile.py (manage.py | -m module) [arguments]")
+        return 1
+    install_connection_hook()
+    if sys.argv[1] == '-m':
+        module = sys.argv[2]
+        sys.argv = [module] + sys.argv[3:]
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+        return 0
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+    runpy.run_path(sys.argv[0], run_name='__main__')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,21 +11,21 @@ import atexit
 import signal
 import threading
 import json
+import hashlib
+import argparse
 import sqlite3
 import logging
+import socket
+import queue
+import urllib.request
+import urllib.error
 from pathlib import Path
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='posthog_launcher.log'
-)
+# Logging is set up by main() once the configuration is loaded
 logger = logging.getLogger('posthog_launcher')
 
 # Get the base directory
 base_dir = os.path.abspath(os.path.dirname(__file__))
-logger.info(f"Base directory: {base_dir}")
 
 # Add bundled Python to path
 python_dir = os.path.join(base_dir, "python")
@@ -36,19 +36,39 @@ sys.path.insert(0, os.path.join(python_dir, "Lib"))
 sys.path.insert(0, os.path.join(python_dir, "Lib", "site-packages"))
 sys.path.insert(0, base_dir)
 
+# Launcher modules and bundled packages are importable from here on
+import sqlite_profile
+import event_ingest
+import event_partitions
+import local_redis
+import launcher_logging
+import launcher_status
+import launcher_supervisor
+
 # Node.js executable path
 node_exe = os.path.join(base_dir, "node", "node.exe")
 
 # Application paths
 manage_py = os.path.join(base_dir, "manage.py")
+web_server_py = os.path.join(base_dir, "web_server.py")
+sqlite_profile_py = os.path.join(base_dir, "sqlite_profile.py")
+command_runner_py = os.path.join(base_dir, "command_runner.py")
+
+# Management commands run through sqlite_profile.py so every Django
+# connection gets the tuned SQLite storage profile
+manage_command = [sys.executable, sqlite_profile_py, manage_py]
+celery_command = [sys.executable, sqlite_profile_py, "-m", "celery", "-A", "posthog"]
 plugin_server_path = os.path.join(base_dir, "plugin-server", "dist", "index.js")
 data_dir = os.path.join(base_dir, "data")
+log_dir = os.path.join(data_dir, "logs")
+# Web workers write request latency samples here
+run_dir = os.path.join(data_dir, "run")
 os.makedirs(data_dir, exist_ok=True)
 
 # Set environment variables
 os.environ['DEBUG'] = '0'
 os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(data_dir, "posthog.db")}'
-os.environ['REDIS_URL'] = ''  # Will use a fake Redis implementation
+os.environ['REDIS_URL'] = ''  # Replaced by the shared local Redis once it is running
 os.environ['SECRET_KEY'] = 'windows_standalone_secret_key'
 os.environ['DISABLE_SECURE_SSL_REDIRECT'] = '1'
 os.environ['SKIP_SERVICE_VERSION_REQUIREMENTS'] = '1'
@@ -59,12 +79,79 @@ os.environ['PYTHONUNBUFFERED'] = '1'
 os.environ['CLICKHOUSE_ENABLED'] = 'false'
 os.environ['KAFKA_ENABLED'] = 'false'
 
-# Initialize services
-processes = []
+# Resource accounting, the restart policy lives in launcher_supervisor
+METRICS_INTERVAL = 10
+metrics_path = os.path.join(data_dir, "metrics.json")
+# Latency files older than this belong to workers that are gone
+LATENCY_STALE_SECONDS = 30
+# Celery's queue when a worker group doesn't name its own
+DEFAULT_CELERY_QUEUE = "celery"
+redis_server = None
+partition_store = None  # Partitioned event storage, None while it is disabled
+
+# Defaults for the production web tier, overridable in config.json
+DEFAULT_SERVER_CONFIG = {
+    "workers": None,  # Defaults to the core count, capped for SQLite
+    "threads": 8,
+    "backlog": 1024,
+    "connection_limit": 1000,
+    "channel_timeout": 120,
+    "drain_timeout": 30,  # Seconds a retired worker gets to finish its requests on reload
+}
+MAX_DEFAULT_WEB_WORKERS = 4
+
+# Reloads replace the web workers on the same listening socket. They are
+# requested with SIGHUP, a POST to the status endpoint's /reload or by
+# creating data/run/reload (standalone_launcher.py --reload)
+WEB_READY_LINE = "posthog-web-ready"  # Printed by web_server.py once it can serve
+reload_path = os.path.join(run_dir, "reload")
+reload_requested = threading.Event()
+reload_lock = threading.Lock()
+web_socket = None
+next_web_worker = 0
+
+# Defaults for each Celery worker group in config.json's "workers" list
+DEFAULT_WORKER_CONFIG = {
+    "name": "default",
+    "queues": None,  # None consumes the queues the posthog Celery app routes to by default
+    "pool": "threads",  # prefork is not supported by Celery on Windows
+    "concurrency": None,  # Defaults to the core count, capped for SQLite
+    "prefetch_multiplier": 1,
+    "max_tasks_per_child": 100,  # Only honoured by the prefork pool
+    "loglevel": "info",
+}
+MAX_DEFAULT_WORKER_CONCURRENCY = 8
+WORKER_STATS_INTERVAL = 60
+
+# One-shot management commands run in a warm Django process, which stops
+# after idle_timeout seconds without commands
+DEFAULT_COMMANDS_CONFIG = {
+    "warm": True,
+    "idle_timeout": 300,
+}
+command_runner = None
+
+# Directories whose migrations are fingerprinted to skip unchanged migrate runs
+MIGRATION_ROOTS = ["posthog", "ee"]
+config_path = os.path.join(data_dir, "config.json")
+db_path = os.path.join(data_dir, "posthog.db")
+
+# Startup readiness tracking
+STARTUP_TIMEOUT = 300
+PROBE_INTERVAL = 0.25
+PLUGIN_SERVER_HEALTH_URL = 'http://127.0.0.1:6738/_health'
+SERVICES = ('django', 'plugin-server', 'worker')
+
+startup_began = time.monotonic()
+service_ready = {name: threading.Event() for name in SERVICES}
+service_timings = {}
+# Seconds spent in each startup phase, written with the service timings to
+# data/run/startup.json for benchmark.py
+startup_phases = {}
+startup_report_path = os.path.join(run_dir, "startup.json")
 
 def create_default_config():
     """Create default configuration if it doesn't exist"""
-    config_path = os.path.join(data_dir, "config.json")
     if not os.path.exists(config_path):
         default_config = {
             "first_run": True,
@@ -78,114 +165,777 @@ def create_default_config():
     with open(config_path, 'r') as f:
         return json.load(f)
 
-def initialize_database():
-    """Initialize the SQLite database if it doesn't exist"""
-    db_path = os.path.join(data_dir, "posthog.db")
+def save_config(config):
+    """Write the configuration back to data/config.json"""
+    tmp_path = f"{config_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, config_path)
+
+def get_config_section(config, name, defaults):
+    """Return a config.json section merged over its defaults"""
+    section = dict(defaults)
+    section.update(config.get(name) or {})
+    return section
+
+def initialize_database(profile):
+    """Initialize the SQLite database and apply the storage profile"""
     if not os.path.exists(db_path):
         logger.info("Initializing database...")
+    try:
+        conn = sqlite3.connect(db_path)
         try:
-            # Create an empty database file
-            conn = sqlite3.connect(db_path)
+            journal_mode = sqlite_profile.initialize_storage(conn, profile)
+        finally:
             conn.close()
-            logger.info("Database initialized")
-            return True
-        except Exception as e:
-            logger.error(f"Error initializing database: {e}")
+        logger.info(f"Database ready (journal_mode={journal_mode})")
+        return True
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Error initializing database: {e}")
+        return False
+
+def run_database_maintenance(profile):
+    """Periodically checkpoint the WAL and run PRAGMA optimize"""
+    interval = profile["checkpoint_interval"]
+    next_optimize = time.monotonic() + profile["optimize_interval"]
+    while not launcher_supervisor.shutting_down.wait(interval):
+        optimize = time.monotonic() >= next_optimize
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                sqlite_profile.apply_connection_pragmas(conn, profile)
+                sqlite_profile.run_maintenance(conn, profile, optimize=optimize)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Database maintenance failed: {e}")
+            continue
+        if optimize:
+            logger.info("Database statistics optimized")
+            next_optimize = time.monotonic() + profile["optimize_interval"]
+
+def run_partition_maintenance(interval):
+    """Periodically drop expired event partitions and compact old ones"""
+    while not launcher_supervisor.shutting_down.wait(interval):
+        try:
+            partition_store.maintain()
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Event partition maintenance failed: {e}")
+
+class CommandRunner:
+    """A warm Django process that runs management commands via call_command"""
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self.process = None
+        self.messages = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.idle_timer = None
+
+    def start(self):
+        """Start the runner and wait until Django is loaded"""
+        self.process = subprocess.Popen(
+            [sys.executable, command_runner_py],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.messages = queue.Queue()
+        threading.Thread(
+            target=self.read_messages,
+            args=(self.process.stdout, self.messages),
+            name='commands-protocol',
+            daemon=True
+        ).start()
+        threading.Thread(
+            target=launcher_supervisor.pump_stream,
+            args=('django-commands', self.process.stderr),
+            name='django-commands-output',
+            daemon=True
+        ).start()
+
+        try:
+            message = self.messages.get(timeout=STARTUP_TIMEOUT)
+        except queue.Empty:
+            message = None
+        if not message or not message.get("ready"):
+            logger.error("Management command runner failed to start")
+            launcher_supervisor.log_recent_output('django-commands')
+            self.stop()
             return False
-    return True
+        logger.info(f"Management command runner ready after {message['startup_seconds']:.1f}s")
+        return True
+
+    def read_messages(self, stream, messages):
+        """Parse protocol messages from the runner until its stdout closes"""
+        try:
+            for raw in iter(stream.readline, b''):
+                try:
+                    messages.put(json.loads(raw))
+                except ValueError:
+                    launcher_supervisor.record_output('django-commands', raw.decode('utf-8', errors='replace').rstrip())
+        finally:
+            stream.close()
+            messages.put(None)
+
+    def run(self, command):
+        """Run a command in the warm runner, None if the runner isn't available"""
+        with self.lock:
+            if self.idle_timer is not None:
+                self.idle_timer.cancel()
+            if self.process is None or self.process.poll() is not None:
+                if not self.start():
+                    return None
+
+            self.next_id += 1
+            request_id = self.next_id
+            name, *args = command.split()
+            try:
+                request = json.dumps({"id": request_id, "command": name, "args": args})
+                self.process.stdin.write(request.encode() + b"\n")
+                self.process.stdin.flush()
+            except OSError as e:
+                logger.error(f"Could not send command to the runner: {e}")
+                self.stop()
+                return None
+
+            service = f"django-{name}"
+            while True:
+                message = self.messages.get()
+                if message is None:
+                    # The runner died while running the command, don't retry it
+                    self.stop()
+                    return {"exit_code": -1, "error": "management command runner exited"}
+                if "stream" in message:
+                    launcher_supervisor.record_output(service, message["line"])
+                elif message.get("id") == request_id:
+                    break
+
+            self.idle_timer = threading.Timer(self.idle_timeout, self.stop_if_idle)
+            self.idle_timer.daemon = True
+            self.idle_timer.start()
+            return {
+                "exit_code": message["exit_code"],
+                "error": message["error"],
+                "duration_seconds": message["duration_seconds"],
+            }
+
+    def stop_if_idle(self):
+        with self.lock:
+            # A command may have started while this timer was waiting
+            if self.idle_timer is not threading.current_thread():
+                return
+            logger.info("Stopping idle management command runner")
+            self.stop()
+
+    def stop(self, grace_period=launcher_supervisor.STOP_GRACE_PERIOD):
+        """Close the runner's stdin so it exits, killing it if it doesn't"""
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=grace_period)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+def run_command_subprocess(command, service):
+    """Run a management command in its own manage.py process"""
+    began = time.monotonic()
+    try:
+        process = subprocess.Popen(manage_command + command.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        readers = launcher_supervisor.start_output_pump(service, process)
+        returncode = process.wait()
+        for reader in readers:
+            reader.join()
+    except OSError as e:
+        return {"exit_code": -1, "error": str(e), "duration_seconds": round(time.monotonic() - began, 2)}
+    return {"exit_code": returncode, "error": None, "duration_seconds": round(time.monotonic() - began, 2)}
 
 def run_django_command(command):
-    """Run a Django management command"""
+    """Run a Django management command and return its result as a dict"""
     logger.info(f"Running Django command: {command}")
+    service = f"django-{command.split()[0]}"
+    result = command_runner.run(command) if command_runner is not None else None
+    if result is not None:
+        result["runner"] = "warm"
+    else:
+        result = run_command_subprocess(command, service)
+        result["runner"] = "subprocess"
+    result["command"] = command
+    result["ok"] = result["exit_code"] == 0
+
+    if not result["ok"]:
+        logger.error(f"Command failed with exit code {result['exit_code']}: {command}")
+        if result["error"]:
+            logger.error(f"[{service}] {result['error']}")
+        launcher_supervisor.log_recent_output(service)
+    else:
+        logger.info(f"Command finished in {result.get('duration_seconds', 0):.1f}s ({result['runner']}): {command}")
+    return result
+
+def record_phase(phase, began):
+    """Record how long a startup phase took"""
+    startup_phases[phase] = round(time.monotonic() - began, 3)
+    write_startup_report()
+
+def write_startup_report():
+    """Write the startup phase and service timings to data/run/startup.json"""
+    report = {
+        "pid": os.getpid(),
+        "phases": dict(startup_phases),
+        "services": {name: round(elapsed, 3) for name, elapsed in list(service_timings.items())},
+    }
+    try:
+        os.makedirs(run_dir, exist_ok=True)
+        tmp_path = f"{startup_report_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, startup_report_path)
+    except OSError as e:
+        logger.error(f"Failed to write startup timings: {e}")
+
+def mark_ready(service):
+    """Record that a service has passed its readiness check"""
+    elapsed = time.monotonic() - startup_began
+    service_timings[service] = elapsed
+    service_ready[service].set()
+    write_startup_report()
+    logger.info(f"Service {service} ready after {elapsed:.1f}s")
+    print(f"  {service} ready ({elapsed:.1f}s)")
+
+def probe_port(port, host='127.0.0.1', timeout=1):
+    """Return True if something accepts TCP connections on the port"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def probe_http(url, timeout=2):
+    """Return True if the URL answers with anything but a server error"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+def wait_until(check, timeout=STARTUP_TIMEOUT, process=None):
+    """Poll check() until it succeeds, the timeout expires or the process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        time.sleep(PROBE_INTERVAL)
+    return False
+
+def collect_request_latency():
+    """Merge the latency samples the web workers wrote to data/run"""
+    durations = []
+    window_seconds = None
+    now = time.time()
     try:
-        cmd = [sys.executable, manage_py] + command.split()
-        result = subprocess.run(cmd, check=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-        logger.info(f"Command output: {result.stdout.decode()}")
+        names = [name for name in os.listdir(run_dir) if name.startswith('latency-') and name.endswith('.json')]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(run_dir, name)) as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - samples["updated"] > LATENCY_STALE_SECONDS:
+            continue
+        durations.extend(samples["durations_ms"])
+        window_seconds = samples["window_seconds"]
+    durations.sort()
+    latency = {"count": len(durations), "window_seconds": window_seconds}
+    for percent in (50, 90, 95, 99):
+        latency[f"p{percent}_ms"] = launcher_supervisor.percentile(durations, percent) if durations else None
+    return latency
+
+def collect_database_sizes():
+    """Size of the SQLite database and its WAL and shared-memory files"""
+    sizes = {}
+    for name, path in (("db", db_path), ("wal", f"{db_path}-wal"), ("shm", f"{db_path}-shm")):
+        try:
+            sizes[name] = os.path.getsize(path)
+        except OSError:
+            sizes[name] = 0
+    if partition_store is not None:
+        sizes["partitions"] = partition_store.total_bytes()
+    return sizes
+
+def collect_queue_lengths():
+    """Tasks waiting in each Celery queue of the local Redis, None without it"""
+    if redis_server is None:
+        return None
+    names = {DEFAULT_CELERY_QUEUE}
+    for stats in list(launcher_supervisor.worker_stats.values()):
+        names.update(stats.queues or ())
+    return redis_server.queue_lengths(sorted(names))
+
+def collect_metrics():
+    """Sample every service and return the launcher's resource snapshot"""
+    for service in list(launcher_supervisor.services.values()):
+        service.sample()
+    return {
+        "timestamp": time.time(),
+        "uptime_seconds": round(time.monotonic() - startup_began, 1),
+        "services": {name: service.metrics() for name, service in list(launcher_supervisor.services.items())},
+        "workers": {name: dict(stats.totals) for name, stats in list(launcher_supervisor.worker_stats.items())},
+        "request_latency": collect_request_latency(),
+        "database": collect_database_sizes(),
+        "queues": collect_queue_lengths(),
+    }
+
+def write_metrics():
+    """Write the current resource snapshot to data/metrics.json"""
+    tmp_path = f"{metrics_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(collect_metrics(), f, indent=2)
+    os.replace(tmp_path, metrics_path)
+
+def check_reload():
+    """Start a reload of the web workers if one was requested"""
+    if reload_requested.is_set() or os.path.exists(reload_path):
+        reload_requested.clear()
+        try:
+            os.remove(reload_path)
+        except OSError:
+            pass
+        threading.Thread(target=reload_web_workers, name='reload', daemon=True).start()
+
+def record_metrics():
+    try:
+        write_metrics()
+    except OSError as e:
+        logger.error(f"Failed to write metrics: {e}")
+
+def create_listen_socket(port, backlog):
+    """Open the web tier's listening socket, shared by all web workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if os.name != 'nt':
+        # On Windows SO_REUSEADDR would let another process steal the port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', port))
+    sock.listen(backlog)
+    return sock
+
+def spawn_web_workers(server_config):
+    """Start a generation of web workers on the shared socket"""
+    global next_web_worker
+    workers = server_config["workers"] or min(os.cpu_count() or 1, MAX_DEFAULT_WEB_WORKERS)
+    command = [
+        sys.executable, web_server_py,
+        "--threads", str(server_config["threads"]),
+        "--connection-limit", str(server_config["connection_limit"]),
+        "--channel-timeout", str(server_config["channel_timeout"]),
+        "--drain-timeout", str(server_config["drain_timeout"]),
+    ]
+    started = []
+    for i in range(next_web_worker, next_web_worker + workers):
+        started.append(launcher_supervisor.supervise(
+            f'web-{i}', command + ["--name", f"web-{i}"], listen_socket=web_socket, ready_line=WEB_READY_LINE
+        ))
+    next_web_worker += workers
+    return started
+
+def start_web_workers(port, server_config):
+    """Serve Django under waitress in several worker processes"""
+    global web_socket
+    web_socket = create_listen_socket(port, server_config["backlog"])
+    workers = spawn_web_workers(server_config)
+    logger.info(f"Serving on port {port} with {len(workers)} workers x {server_config['threads']} threads")
+    return workers
+
+def reload_web_workers():
+    """Replace the web workers without refusing a connection: start new ones on
+    the same socket, wait until they are ready, then drain the old ones"""
+    if web_socket is None:
+        logger.warning("Reload needs the WSGI web workers, it is not available with runserver")
+        return False
+    if not reload_lock.acquire(blocking=False):
+        logger.warning("A reload is already in progress")
+        return False
+    try:
+        began = time.monotonic()
+        logger.info("Reloading web workers...")
+        config = create_default_config()
+        server_config = get_config_section(config, "server", DEFAULT_SERVER_CONFIG)
+        if config.get("port", 8000) != web_socket.getsockname()[1]:
+            logger.warning("Changing the port needs a full restart, reloading on the current port")
+        # New workers pick up changed settings from the environment
+        os.environ[sqlite_profile.PROFILE_ENV] = json.dumps(sqlite_profile.load_profile(config.get("sqlite")))
+        os.environ[event_ingest.INGEST_ENV] = json.dumps(event_ingest.load_ingest_config(config.get("ingest")))
+        os.environ[event_partitions.PARTITIONS_ENV] = json.dumps(
+            event_partitions.load_partition_config(config.get("partitions"))
+        )
+        if not migrate_if_needed(config):
+            logger.error("Reload aborted, the current web workers keep serving")
+            return False
+
+        old = [service for name, service in list(launcher_supervisor.services.items()) if name.startswith('web-')]
+        new = spawn_web_workers(server_config)
+        wait_until(lambda: all(service.ready.is_set() or service.process.poll() is not None for service in new))
+        if not all(service.ready.is_set() for service in new):
+            logger.error("New web workers did not become ready, the current ones keep serving")
+            for service in new:
+                service.stop()
+                launcher_supervisor.services.pop(service.name, None)
+                launcher_supervisor.log_recent_output(service.name)
+            return False
+
+        # Retire the old generation in parallel, each finishing its own requests
+        drains = [
+            threading.Thread(target=service.drain, args=(server_config["drain_timeout"],), daemon=True)
+            for service in old
+        ]
+        for thread in drains:
+            thread.start()
+        for thread in drains:
+            thread.join()
+        for service in old:
+            launcher_supervisor.services.pop(service.name, None)
+        logger.info(f"Reloaded {len(new)} web workers in {time.monotonic() - began:.1f}s, retired {len(old)}")
+        return True
+    finally:
+        reload_lock.release()
+
+def compute_migration_fingerprint():
+    """Hash the bundled migration files together with the migrations the database has applied"""
+    digest = hashlib.sha256()
+    for root in MIGRATION_ROOTS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(base_dir, root)):
+            dirnames.sort()
+            if os.path.basename(dirpath) != 'migrations':
+                continue
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(path, base_dir).encode())
+                with open(path, 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+
+    # Third-party apps ship migrations too, so installed versions count as well
+    site_packages = os.path.join(python_dir, "Lib", "site-packages")
+    if os.path.isdir(site_packages):
+        for name in sorted(os.listdir(site_packages)):
+            if name.endswith('.dist-info'):
+                digest.update(name.encode())
+
+    # Not schema_version: PRAGMA optimize and the ingest table bump it too
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            applied = conn.execute("SELECT app, name FROM django_migrations ORDER BY app, name").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    for app, name in applied:
+        digest.update(f"{app}.{name}\n".encode())
+    return digest.hexdigest()
+
+def migrate_if_needed(config, force=False):
+    """Run migrate unless migrations and schema are unchanged since the last run"""
+    state = config.setdefault("migrations", {})
+    if not force and state.get("fingerprint") and compute_migration_fingerprint() == state["fingerprint"]:
+        saved = state.get("duration_seconds", 0)
+        logger.info(f"Migrations unchanged since last run, skipped migrate (saved ~{saved:.1f}s)")
         return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed: {e.stderr.decode()}")
+
+    began = time.monotonic()
+    if not run_django_command("migrate --noinput")["ok"]:
         return False
+    state["duration_seconds"] = round(time.monotonic() - began, 2)
+    state["fingerprint"] = compute_migration_fingerprint()
+    try:
+        save_config(config)
+    except OSError as e:
+        logger.error(f"Failed to save migration fingerprint: {e}")
+    logger.info(f"Migrations applied in {state['duration_seconds']:.1f}s")
+    return True
 
-def start_django():
-    """Start the Django web server"""
+def start_django(config, use_runserver=False, force_migrate=False):
+    """Start the Django web server and wait until it answers HTTP requests"""
     logger.info("Starting Django web server...")
+    port = config.get("port", 8000)
     try:
-        run_django_command("migrate --noinput")
-        run_django_command("runserver 0.0.0.0:8000")
+        began = time.monotonic()
+        migrate_if_needed(config, force=force_migrate)
+        record_phase('migrate', began)
+        if use_runserver:
+            launcher_supervisor.supervise(
+                'django',
+                manage_command + ["runserver", f"0.0.0.0:{port}", "--noreload"]
+            )
+        else:
+            start_web_workers(port, get_config_section(config, "server", DEFAULT_SERVER_CONFIG))
     except Exception as e:
         logger.error(f"Error starting Django: {e}")
+        return False
+
+    url = f'http://127.0.0.1:{port}/'
+    if wait_until(lambda: probe_port(port) and probe_http(url)):
+        mark_ready('django')
+        return True
+    logger.error(f"Django did not answer on port {port}")
+    for name in launcher_supervisor.services:
+        if name == 'django' or name.startswith('web-'):
+            launcher_supervisor.log_recent_output(name)
+    return False
 
 def start_plugin_server():
-    """Start the plugin server"""
+    """Start the plugin server and wait for its health check"""
     logger.info("Starting plugin server...")
     try:
-        process = subprocess.Popen(
-            [node_exe, plugin_server_path],
-            env=os.environ.copy(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        processes.append(process)
-        return process
+        service = launcher_supervisor.supervise('plugin-server', [node_exe, plugin_server_path])
     except Exception as e:
         logger.error(f"Error starting plugin server: {e}")
+        print("Failed to start plugin server. See log for details.")
         return None
 
-def start_worker():
-    """Start a minimal worker"""
+    if wait_until(lambda: probe_http(PLUGIN_SERVER_HEALTH_URL)):
+        mark_ready('plugin-server')
+    else:
+        logger.error("Plugin server health check failed")
+        launcher_supervisor.log_recent_output('plugin-server')
+    return service
+
+def build_worker_command(worker_config):
+    """Build the celery worker command line for one worker group"""
+    concurrency = worker_config["concurrency"] or min(os.cpu_count() or 1, MAX_DEFAULT_WORKER_CONCURRENCY)
+    command = celery_command + [
+        "worker",
+        f"--loglevel={worker_config['loglevel']}",
+        "--hostname", f"{worker_config['name']}@%h",
+        "--pool", worker_config["pool"],
+        "--concurrency", str(concurrency),
+        "--prefetch-multiplier", str(worker_config["prefetch_multiplier"]),
+    ]
+    if worker_config["queues"]:
+        command += ["--queues", ",".join(worker_config["queues"])]
+    if worker_config["max_tasks_per_child"] and worker_config["pool"] == "prefork":
+        command += ["--max-tasks-per-child", str(worker_config["max_tasks_per_child"])]
+    return command
+
+def start_worker(config):
+    """Start the configured Celery worker groups"""
     logger.info("Starting worker...")
-    try:
-        run_django_command("celery worker --loglevel=info")
-    except Exception as e:
-        logger.error(f"Error starting worker: {e}")
+    worker_configs = [
+        dict(DEFAULT_WORKER_CONFIG, **worker) for worker in config.get("workers") or [{}]
+    ]
+    pending = {worker_config["name"] for worker_config in worker_configs}
+
+    started = []
+    for worker_config in worker_configs:
+        name = worker_config["name"]
+        stats = launcher_supervisor.TaskStats(name, worker_config["queues"])
+        launcher_supervisor.worker_stats[name] = stats
+
+        # Celery prints "<name>@<host> ready." once it is consuming tasks, the
+        # worker service counts as ready when every group is
+        def on_line(line, name=name, stats=stats):
+            stats.on_line(line)
+            if name in pending and line.endswith('ready.'):
+                pending.discard(name)
+                if not pending:
+                    mark_ready('worker')
+
+        try:
+            started.append(launcher_supervisor.supervise(f'worker-{name}', build_worker_command(worker_config), on_line=on_line))
+        except Exception as e:
+            logger.error(f"Error starting worker {name}: {e}")
+    return started
+
+def log_startup_summary():
+    """Log how long each startup phase and service took"""
+    for phase, seconds in startup_phases.items():
+        logger.info(f"Startup phase: {phase} {seconds:.2f}s")
+    for service in SERVICES:
+        if service in service_timings:
+            logger.info(f"Startup timing: {service} {service_timings[service]:.1f}s")
+        else:
+            logger.info(f"Startup timing: {service} not ready yet")
 
 def cleanup():
-    """Clean up all processes on exit"""
+    """Stop all supervised services on exit"""
     logger.info("Cleaning up processes...")
-    for process in processes:
-        try:
-            process.terminate()
-            logger.info(f"Terminated process {process.pid}")
-        except:
-            logger.error(f"Failed to terminate process")
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    launcher_supervisor.shutting_down.set()
+    if command_runner is not None:
+        command_runner.stop()
+    # Web workers drain so their ingest buffers get flushed, terminating them
+    # on Windows would throw the queued events away
+    drains = [
+        threading.Thread(target=service.drain, args=(launcher_supervisor.STOP_GRACE_PERIOD,), daemon=True)
+        for name, service in list(launcher_supervisor.services.items())
+        if name.startswith('web-') and service.process is not None and service.process.poll() is None
+    ]
+    for thread in drains:
+        thread.start()
+    for name, service in list(launcher_supervisor.services.items()):
+        if not name.startswith('web-'):
+            service.stop()
+    for thread in drains:
+        thread.join()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PostHog Windows Standalone launcher")
+    parser.add_argument(
+        '--runserver',
+        action='store_true',
+        help="serve with Django's development server instead of the WSGI workers (for debugging)"
+    )
+    parser.add_argument(
+        '--force-migrate',
+        action='store_true',
+        help="run migrations even if they are unchanged since the last start"
+    )
+    parser.add_argument(
+        '--reload',
+        action='store_true',
+        help="ask the running launcher to replace its web workers without downtime, then exit"
+    )
+    return parser.parse_args()
 
 def main():
     """Main entry point"""
-    logger.info("Starting PostHog services...")
+    global command_runner, redis_server, partition_store
+    args = parse_args()
+    if args.reload:
+        os.makedirs(run_dir, exist_ok=True)
+        with open(reload_path, 'w'):
+            pass
+        print("Reload requested, the running launcher picks it up within a second")
+        return
     print("Starting PostHog... (this may take a minute)")
-    print("Check posthog_launcher.log for detailed logs")
+    print(f"Check {log_dir} for detailed logs")
     
     # Create default configuration
+    began = time.monotonic()
     config = create_default_config()
+    record_phase('config', began)
+    
+    # Log calls only queue records, a listener thread writes the files
+    logging_config = launcher_logging.load_logging_config(config.get("logging"))
+    log_listener = launcher_logging.setup_logging(log_dir, logging_config)
+    atexit.register(launcher_logging.stop_logging, log_listener)
+    logger.info("Starting PostHog services...")
+    logger.info(f"Base directory: {base_dir}")
     
-    # Initialize database
-    if not initialize_database():
+    # Initialize database with the storage profile, children inherit it
+    began = time.monotonic()
+    sqlite_config = sqlite_profile.load_profile(config.get("sqlite"))
+    os.environ[sqlite_profile.PROFILE_ENV] = json.dumps(sqlite_config)
+    if not initialize_database(sqlite_config):
         print("Failed to initialize database. See log for details.")
         return
+    record_phase('database', began)
+    
+    # One Redis keyspace shared by the web workers, the Celery broker and locks
+    redis_config = local_redis.load_redis_config(config.get("redis"))
+    if redis_config["enabled"]:
+        began = time.monotonic()
+        redis_server = local_redis.start_local_redis(redis_config, data_dir, launcher_supervisor.shutting_down)
+        if redis_server is not None:
+            os.environ['REDIS_URL'] = redis_server.url
+            atexit.register(redis_server.save_snapshot)
+        record_phase('redis', began)
+    
+    # Web workers batch captured events through the ingest write buffer
+    ingest_config = event_ingest.load_ingest_config(config.get("ingest"))
+    os.environ[event_ingest.INGEST_ENV] = json.dumps(ingest_config)
+    partition_config = event_partitions.load_partition_config(config.get("partitions"))
+    os.environ[event_partitions.PARTITIONS_ENV] = json.dumps(partition_config)
+    if partition_config["enabled"]:
+        partition_store = event_partitions.PartitionStore(data_dir, partition_config, sqlite_config)
     
     # Register cleanup handler
     atexit.register(cleanup)
     signal.signal(signal.SIGINT, lambda sig, frame: sys.exit(0))
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda sig, frame: reload_requested.set())
     
-    # Start plugin server in a separate process
-    plugin_server = start_plugin_server()
-    if not plugin_server:
-        print("Failed to start plugin server. See log for details.")
+    port = config.get("port", 8000)
+    os.environ['SITE_URL'] = f'http://localhost:{port}'
+    server_config = get_config_section(config, "server", DEFAULT_SERVER_CONFIG)
+    use_runserver = args.runserver or server_config.get("mode") == "runserver"
     
-    # Start worker in a thread
-    worker_thread = threading.Thread(target=start_worker)
-    worker_thread.daemon = True
-    worker_thread.start()
+    # One-shot management commands reuse a warm Django process
+    commands_config = get_config_section(config, "commands", DEFAULT_COMMANDS_CONFIG)
+    if commands_config["warm"]:
+        command_runner = CommandRunner(commands_config["idle_timeout"])
     
-    # Wait for services to initialize
-    time.sleep(5)
-    print("Opening browser...")
+    # A reload requested while no launcher was running is moot
+    try:
+        os.remove(reload_path)
+    except OSError:
+        pass
+    
+    # Forward child process output to the log and watch over the services
+    threading.Thread(target=launcher_supervisor.log_output_lines, name='output-log', daemon=True).start()
+    threading.Thread(
+        target=launcher_supervisor.run_supervisor,
+        args=([
+            (0, check_reload),
+            (METRICS_INTERVAL, record_metrics),
+            (WORKER_STATS_INTERVAL, launcher_supervisor.log_worker_stats),
+        ],),
+        name='supervisor',
+        daemon=True
+    ).start()
+    launcher_status.start_status_server(
+        launcher_status.load_status_config(config.get("status")), collect_metrics, reload=reload_requested.set
+    )
+    threading.Thread(
+        target=run_database_maintenance,
+        args=(sqlite_config,),
+        name='db-maintenance',
+        daemon=True
+    ).start()
+    if partition_store is not None:
+        threading.Thread(
+            target=run_partition_maintenance,
+            args=(partition_config["maintenance_interval"],),
+            name='partition-maintenance',
+            daemon=True
+        ).start()
+    
+    # Start all services at the same time, each one probes its own readiness
+    starters = {
+        'plugin-server': (start_plugin_server, ()),
+        'worker': (start_worker, (config,)),
+        'django': (start_django, (config, use_runserver, args.force_migrate)),
+    }
+    threads = {}
+    for name, (target, starter_args) in starters.items():
+        thread = threading.Thread(target=target, args=starter_args, name=f'start-{name}', daemon=True)
+        thread.start()
+        threads[name] = thread
     
-    # Open browser
-    webbrowser.open('http://localhost:8000')
+    # Open the browser only once Django actually answers
+    threads['django'].join(STARTUP_TIMEOUT)
+    log_startup_summary()
+    if not service_ready['django'].is_set():
+        print("PostHog did not start. See log for details.")
+        return
+    
+    print("Opening browser...")
+    webbrowser.open(f'http://localhost:{port}')
     
-    # Start Django in the main thread
-    start_django()
+    # Keep running until interrupted, the supervisor restarts crashed services
+    while not launcher_supervisor.shutting_down.is_set():
+        time.sleep(1)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+import zipfile
+
+import pytest
+
+import build_archive
+
+def make_tree(root):
+    files = {
+        "readme.txt": b"hello " * 1000,
+        "nested/deeper/data.bin": os.urandom(64 * 1024),
+        "nested/image.png": b"\x89PNG" + os.urandom(1024),
+        "empty.txt": b"",
+    }
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    (root / "empty-dir").mkdir()
+    return files
+
+def read_tree(root):
+    return {
+        os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"):
+            open(os.path.join(dirpath, filename), "rb").read()
+        for dirpath, dirnames, filenames in os.walk(root)
+        for filename in filenames
+    }
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_round_trip(tmp_path, monkeypatch, parallel):
+    if not parallel:
+        monkeypatch.setattr(build_archive, "PARALLEL_WRITE_VERSIONS", set())
+    files = make_tree(tmp_path / "src")
+    archive = tmp_path / "out.zip"
+
+    total = build_archive.create_archive(str(archive), str(tmp_path / "src"), workers=4)
+    assert total == sum(len(content) for content in files.values())
+    assert not os.path.exists(f"{archive}.tmp")
+
+    build_archive.extract_archive(str(archive), str(tmp_path / "dest"), workers=4)
+    assert read_tree(tmp_path / "dest") == files
+    assert (tmp_path / "dest" / "empty-dir").is_dir()
+
+def test_compression_type_per_member(tmp_path):
+    make_tree(tmp_path / "src")
+    archive = tmp_path / "out.zip"
+    build_archive.create_archive(str(archive), str(tmp_path / "src"))
+    with zipfile.ZipFile(archive) as zf:
+        types = {info.filename: info.compress_type for info in zf.infolist()}
+    assert types["readme.txt"] == zipfile.ZIP_DEFLATED
+    # Already compressed formats and incompressible data are stored
+    assert types["nested/image.png"] == zipfile.ZIP_STORED
+    assert types["nested/deeper/data.bin"] == zipfile.ZIP_STORED
+
+def test_level_zero_stores_everything(tmp_path):
+    make_tree(tmp_path / "src")
+    archive = tmp_path / "out.zip"
+    build_archive.create_archive(str(archive), str(tmp_path / "src"), level=0)
+    with zipfile.ZipFile(archive) as zf:
+        assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+
+def test_corrupt_archive_fails_verification(tmp_path):
+    make_tree(tmp_path / "src")
+    archive = tmp_path / "out.zip"
+    build_archive.create_archive(str(archive), str(tmp_path / "src"))
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo("readme.txt")
+        members = len(zf.infolist())
+    data = bytearray(archive.read_bytes())
+    # Flip bytes in the member's compressed data, past its local header
+    offset = info.header_offset + 30 + len(info.filename) + 10
+    data[offset:offset + 4] = bytes(b ^ 0xFF for b in data[offset:offset + 4])
+    archive.write_bytes(bytes(data))
+
+    with pytest.raises(build_archive.ArchiveError):
+        build_archive.verify_archive(str(archive), members)
+
+def test_member_count_is_checked(tmp_path):
+    make_tree(tmp_path / "src")
+    archive = tmp_path / "out.zip"
+    build_archive.create_archive(str(archive), str(tmp_path / "src"))
+    with zipfile.ZipFile(archive) as zf:
+        members = len(zf.infolist())
+    with pytest.raises(build_archive.ArchiveError):
+        build_archive.verify_archive(str(archive), members + 1)
+
+def test_member_paths_stay_inside_the_target(tmp_path):
+    root = str(tmp_path)
+    assert build_archive.member_path("../../etc/passwd", root) == os.path.join(root, "etc", "passwd")
+    assert build_archive.member_path("/abs/file", root) == os.path.join(root, "abs", "file")
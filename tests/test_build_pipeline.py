@@ -0,0 +1,125 @@
+import subprocess
+import sys
+
+import pytest
+
+import build_pipeline
+from build_pipeline import PipelineError, run_pipeline, step
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # State and reports are written under build/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def make_steps(calls, fail=()):
+    """source -> compile -> package, plus an independent docs step"""
+    def action(name, output=None):
+        def run():
+            calls.append(name)
+            if name in fail:
+                return False
+            if output:
+                with open(output, "w") as f:
+                    f.write(open("input.txt").read() if name == "compile" else name)
+        return run
+
+    return [
+        step("source", action("source", "source.out"), inputs=["input.txt"], outputs=["source.out"]),
+        step("compile", action("compile", "compile.out"), deps=["source"], inputs=["input.txt"], outputs=["compile.out"]),
+        step("package", action("package", "package.out"), deps=["compile"], outputs=["package.out"]),
+        step("docs", action("docs", "docs.out"), outputs=["docs.out"]),
+    ]
+
+def report(pipeline="test"):
+    return build_pipeline.load_json(build_pipeline.report_file(pipeline))["steps"]
+
+def test_unchanged_steps_are_skipped(workdir):
+    (workdir / "input.txt").write_text("v1")
+    calls = []
+    assert run_pipeline(make_steps(calls), "test")
+    assert sorted(calls) == ["compile", "docs", "package", "source"]
+
+    calls.clear()
+    assert run_pipeline(make_steps(calls), "test")
+    assert calls == []
+    assert {entry["status"] for entry in report().values()} == {"skipped"}
+
+def test_changed_inputs_rerun_the_step_and_its_dependents(workdir):
+    (workdir / "input.txt").write_text("v1")
+    run_pipeline(make_steps([]), "test")
+
+    (workdir / "input.txt").write_text("v2")
+    calls = []
+    assert run_pipeline(make_steps(calls), "test")
+    assert sorted(calls) == ["compile", "package", "source"]
+
+def test_missing_outputs_rerun_the_step(workdir):
+    (workdir / "input.txt").write_text("v1")
+    run_pipeline(make_steps([]), "test")
+    (workdir / "docs.out").unlink()
+    calls = []
+    run_pipeline(make_steps(calls), "test")
+    assert calls == ["docs"]
+
+def test_force_reruns_everything(workdir):
+    (workdir / "input.txt").write_text("v1")
+    run_pipeline(make_steps([]), "test")
+    calls = []
+    run_pipeline(make_steps(calls), "test", force=True)
+    assert len(calls) == 4
+
+def test_failure_blocks_dependents_only(workdir):
+    (workdir / "input.txt").write_text("v1")
+    calls = []
+    assert not run_pipeline(make_steps(calls, fail={"compile"}), "test")
+    assert "package" not in calls
+    statuses = {name: entry["status"] for name, entry in report().items()}
+    assert statuses == {"source": "ran", "compile": "failed", "package": "blocked", "docs": "ran"}
+
+    # A failed step isn't recorded as done, so the next run tries it again
+    calls = []
+    assert run_pipeline(make_steps(calls), "test")
+    assert sorted(calls) == ["compile", "package"]
+
+def test_exceptions_fail_the_step(workdir):
+    def broken():
+        raise RuntimeError("boom")
+
+    assert not run_pipeline([step("broken", broken), step("after", lambda: None, deps=["broken"])], "test")
+    entries = report()
+    assert entries["broken"]["error"] == "RuntimeError: boom"
+    assert entries["after"]["status"] == "blocked"
+
+def test_pipelines_keep_separate_state(workdir):
+    (workdir / "input.txt").write_text("v1")
+    run_pipeline(make_steps([]), "one")
+    calls = []
+    run_pipeline(make_steps(calls), "two")
+    assert len(calls) == 4
+
+def test_targets_select_their_dependencies(workdir):
+    (workdir / "input.txt").write_text("v1")
+    calls = []
+    run_pipeline(make_steps(calls), "test", targets=["compile"])
+    assert calls == ["source", "compile"]
+
+def test_unknown_targets_and_dependencies_are_errors(workdir):
+    with pytest.raises(PipelineError):
+        run_pipeline(make_steps([]), "test", targets=["nope"])
+    with pytest.raises(PipelineError):
+        run_pipeline([step("a", lambda: None, deps=["missing"])], "test")
+
+def test_cycles_are_errors(workdir):
+    steps = [step("a", lambda: None, deps=["b"]), step("b", lambda: None, deps=["a"])]
+    with pytest.raises(PipelineError):
+        run_pipeline(steps, "test")
+
+def test_run_process_accounts_child_cpu(workdir):
+    build_pipeline.step_local.child_cpu = 0.0
+    command = f'"{sys.executable}" -c "sum(range(2000000))"'
+    assert build_pipeline.run_process(command).returncode == 0
+    assert build_pipeline.step_local.child_cpu > 0
+
+    with pytest.raises(subprocess.CalledProcessError):
+        build_pipeline.run_process(f'"{sys.executable}" -c "raise SystemExit(3)"')
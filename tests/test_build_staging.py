@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+import build_staging
+
+@pytest.fixture
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_staging, "MANIFEST_DIR", tmp_path / "manifests")
+    src = tmp_path / "src"
+    dest = tmp_path / "dest"
+    (src / "pkg").mkdir(parents=True)
+    (src / "pkg" / "module.py").write_text("VALUE = 1\n")
+    (src / "pkg" / "data").mkdir()
+    (src / "pkg" / "data" / "table.csv").write_text("a,b\n")
+    (src / "top.txt").write_text("top\n")
+    return src, dest
+
+def stage(src, dest):
+    return build_staging.stage_tree(str(src), str(dest), "test")
+
+def updated(counts):
+    return counts["copied"] + counts["cloned"] + counts["linked"]
+
+def test_first_run_stages_everything(staging):
+    src, dest = staging
+    counts = stage(src, dest)
+    assert updated(counts) == 3
+    assert (dest / "pkg" / "module.py").read_text() == "VALUE = 1\n"
+    assert (build_staging.MANIFEST_DIR / "test.json").exists()
+
+def test_unchanged_files_are_skipped(staging):
+    src, dest = staging
+    stage(src, dest)
+    counts = stage(src, dest)
+    assert updated(counts) == 0
+    assert counts["unchanged"] == 3
+
+def test_touched_but_identical_files_are_not_copied(staging):
+    src, dest = staging
+    stage(src, dest)
+    path = src / "top.txt"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    counts = stage(src, dest)
+    assert updated(counts) == 0
+
+def test_changed_files_are_copied_again(staging, monkeypatch):
+    # Copies, so that writing the source can't change the staged file through a link
+    monkeypatch.setattr(build_staging, "LINK_MODE", "copy")
+    src, dest = staging
+    stage(src, dest)
+    (src / "pkg" / "module.py").write_text("VALUE = 22\n")
+    counts = stage(src, dest)
+    assert counts["copied"] == 1
+    assert (dest / "pkg" / "module.py").read_text() == "VALUE = 22\n"
+
+def test_same_size_edits_are_noticed(staging, monkeypatch):
+    monkeypatch.setattr(build_staging, "LINK_MODE", "copy")
+    src, dest = staging
+    stage(src, dest)
+    path = src / "top.txt"
+    st = path.stat()
+    path.write_text("pot\n")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert stage(src, dest)["copied"] == 1
+    assert (dest / "top.txt").read_text() == "pot\n"
+
+def test_deleted_files_are_removed(staging):
+    src, dest = staging
+    stage(src, dest)
+    (src / "pkg" / "data" / "table.csv").unlink()
+    (src / "pkg" / "data").rmdir()
+    counts = stage(src, dest)
+    assert counts["removed"] == 1
+    assert not (dest / "pkg" / "data").exists()
+    assert (dest / "pkg" / "module.py").exists()
+
+def test_replaced_staged_files_are_restored(staging, monkeypatch):
+    monkeypatch.setattr(build_staging, "LINK_MODE", "copy")
+    src, dest = staging
+    stage(src, dest)
+    (dest / "top.txt").write_text("modified in staging\n")
+    stage(src, dest)
+    assert (dest / "top.txt").read_text() == "top\n"
+
+def test_without_a_manifest_stray_files_are_removed(staging):
+    src, dest = staging
+    (dest / "stale").mkdir(parents=True)
+    (dest / "stale" / "old.py").write_text("")
+    counts = stage(src, dest)
+    assert counts["removed"] == 1
+    assert not (dest / "stale").exists()
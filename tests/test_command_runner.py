@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Just enough of Django for command_runner.py
+STUB_DJANGO = {
+    "django/__init__.py": "def setup():\n    pass\n",
+    "django/core/__init__.py": "",
+    "django/core/management/__init__.py": """\
+import sys
+from django.core.management.base import CommandError
+
+def call_command(name, *args, stdout=None, stderr=None):
+    if name == "echo":
+        stdout.write(" ".join(args) + "\\n")
+        print("through sys.stdout")
+        stdout.write("partial")
+    elif name == "fail":
+        stderr.write("about to fail\\n")
+        raise CommandError("it failed")
+    elif name == "exit":
+        sys.exit(3)
+    else:
+        raise KeyError(name)
+""",
+    "django/core/management/base.py": "class CommandError(Exception):\n    pass\n",
+    "django/db/__init__.py": "class Connections:\n    def close_all(self):\n        pass\n\nconnections = Connections()\n",
+    "django/db/backends/__init__.py": "",
+    "django/db/backends/signals.py": "class Signal:\n    def connect(self, receiver, **kwargs):\n        pass\n\nconnection_created = Signal()\n",
+}
+
+@pytest.fixture
+def runner(tmp_path):
+    for name, content in STUB_DJANGO.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    env = dict(os.environ, PYTHONPATH=str(tmp_path))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "command_runner.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    yield process
+    process.stdin.close()
+    process.wait(10)
+    process.stdout.close()
+    process.stderr.close()
+
+def request(process, request_id, command, *args):
+    process.stdin.write(json.dumps({"id": request_id, "command": command, "args": list(args)}).encode() + b"\n")
+    process.stdin.flush()
+    messages = []
+    while True:
+        message = json.loads(process.stdout.readline())
+        messages.append(message)
+        if "exit_code" in message:
+            return messages
+
+def test_ready_message_comes_first(runner):
+    assert json.loads(runner.stdout.readline())["ready"] is True
+
+def test_output_lines_and_result(runner):
+    runner.stdout.readline()
+    *lines, result = request(runner, 1, "echo", "hello", "world")
+    assert {"id": 1, "stream": "stdout", "line": "hello world"} in lines
+    # A partial last line is sent once the command finishes
+    assert {"id": 1, "stream": "stdout", "line": "partial"} in lines
+    assert {"id": 1, "stream": "stdout", "line": "through sys.stdout"} in lines
+    assert (result["id"], result["exit_code"], result["error"]) == (1, 0, None)
+
+def test_failures_are_reported_and_the_runner_keeps_going(runner):
+    runner.stdout.readline()
+    *lines, result = request(runner, 1, "fail")
+    assert {"id": 1, "stream": "stderr", "line": "about to fail"} in lines
+    assert (result["exit_code"], result["error"]) == (1, "it failed")
+
+    assert request(runner, 2, "exit")[-1]["exit_code"] == 3
+    result = request(runner, 3, "unknown")[-1]
+    assert result["exit_code"] == 1
+    assert result["error"].startswith("KeyError")
+    assert request(runner, 4, "echo", "still", "alive")[-1]["exit_code"] == 0
@@ -0,0 +1,141 @@
+import io
+import os
+import gzip
+import json
+import base64
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import event_ingest
+import event_partitions
+
+def make_buffer(tmp_path, name="web-0", **overrides):
+    """A buffer whose writer thread does nothing, so tests decide when to flush"""
+    config = event_ingest.load_ingest_config(overrides)
+    buffer = event_ingest.EventWriteBuffer(str(tmp_path / "posthog.db"), config, name=name)
+    buffer.thread = threading.Thread(target=lambda: None)
+    return buffer.start()
+
+def crash(buffer):
+    """Stop using a buffer the way a killed process would, leaving its spill segment"""
+    if buffer.spill_file is not None:
+        buffer.spill_file.close()
+    buffer.conn.close()
+
+def rows(count, start=0):
+    now = datetime.now(timezone.utc).isoformat()
+    return [(f"uuid-{i}", "pageview", "user", "token", "{}", now, now) for i in range(start, start + count)]
+
+def stored_uuids(tmp_path):
+    conn = sqlite3.connect(tmp_path / "posthog.db")
+    try:
+        return sorted(uuid for (uuid,) in conn.execute("SELECT uuid FROM standalone_events"))
+    finally:
+        conn.close()
+
+def spill_files(tmp_path):
+    return sorted(os.listdir(tmp_path / "ingest-spill"))
+
+def test_flush_writes_queued_rows(tmp_path):
+    buffer = make_buffer(tmp_path)
+    assert buffer.submit(rows(3)) == 3
+    assert buffer.flush() == 3
+    assert stored_uuids(tmp_path) == ["uuid-0", "uuid-1", "uuid-2"]
+    stats = buffer.get_stats()
+    assert (stats["accepted"], stats["written"], stats["batches"], stats["queue_depth"]) == (3, 3, 1, 0)
+    buffer.close()
+
+def test_batches_that_do_not_fit_are_rejected_whole(tmp_path):
+    buffer = make_buffer(tmp_path, max_queue=3)
+    assert buffer.submit(rows(2)) == 2
+    assert buffer.submit(rows(2, start=2)) == 0
+    stats = buffer.get_stats()
+    assert stats["dropped"] == 2
+    assert stats["queue_depth"] == 2
+    buffer.close()
+    assert stored_uuids(tmp_path) == ["uuid-0", "uuid-1"]
+
+def test_close_flushes_the_queue(tmp_path):
+    buffer = make_buffer(tmp_path)
+    buffer.submit(rows(2))
+    buffer.close()
+    assert stored_uuids(tmp_path) == ["uuid-0", "uuid-1"]
+
+def test_spilled_rows_are_replayed_after_a_crash(tmp_path):
+    buffer = make_buffer(tmp_path, durability="spill")
+    buffer.submit(rows(3))
+    crash(buffer)
+    assert stored_uuids(tmp_path) == []
+
+    replayed = make_buffer(tmp_path, durability="spill")
+    assert stored_uuids(tmp_path) == ["uuid-0", "uuid-1", "uuid-2"]
+    # Only the new worker's own open segment is left
+    assert spill_files(tmp_path) == [os.path.basename(replayed.spill_file.name)]
+    replayed.close()
+    assert spill_files(tmp_path) == []
+
+def test_flushed_segments_are_removed(tmp_path):
+    buffer = make_buffer(tmp_path, durability="spill")
+    buffer.submit(rows(2))
+    buffer.flush()
+    assert spill_files(tmp_path) == [os.path.basename(buffer.spill_file.name)]
+    crash(buffer)
+
+    # Nothing to replay, the flushed rows aren't written twice
+    make_buffer(tmp_path, durability="spill").close()
+    assert stored_uuids(tmp_path) == ["uuid-0", "uuid-1"]
+
+def test_torn_spill_lines_are_skipped(tmp_path):
+    os.makedirs(tmp_path / "ingest-spill")
+    with open(tmp_path / "ingest-spill" / "web-0-1-1.jsonl", "w") as f:
+        f.write(json.dumps(rows(1)[0]) + "\n" + '["uuid-torn", "pagev')
+    # Other workers' segments are left to them
+    with open(tmp_path / "ingest-spill" / "web-1-1-1.jsonl", "w") as f:
+        f.write(json.dumps(rows(1, start=1)[0]) + "\n")
+
+    make_buffer(tmp_path, durability="spill").close()
+    assert stored_uuids(tmp_path) == ["uuid-0"]
+    assert spill_files(tmp_path) == ["web-1-1-1.jsonl"]
+
+def test_rows_past_partition_retention_count_as_expired(tmp_path):
+    partitions = event_partitions.PartitionStore(
+        str(tmp_path), event_partitions.load_partition_config({"enabled": True, "retention_days": 7})
+    )
+    config = event_ingest.load_ingest_config()
+    buffer = event_ingest.EventWriteBuffer(str(tmp_path / "posthog.db"), config, partitions=partitions)
+    buffer.thread = threading.Thread(target=lambda: None)
+    buffer.start()
+    old = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    buffer.submit(rows(2) + [("uuid-old", "pageview", "user", "token", "{}", old, old)])
+    assert buffer.flush() == 2
+    assert buffer.get_stats()["expired"] == 1
+    buffer.close()
+
+def test_decode_payload_formats():
+    event = {"event": "pageview", "distinct_id": "user"}
+    batch = json.dumps({"api_key": "key", "batch": [event, event]}).encode()
+    assert event_ingest.decode_payload(batch) == ([event, event], "key")
+    assert event_ingest.decode_payload(gzip.compress(batch))[0] == [event, event]
+    encoded = base64.b64encode(json.dumps(event).encode()).decode()
+    assert event_ingest.decode_payload(f"data={encoded}".encode()) == ([event], None)
+
+def capture(app, body):
+    environ = {
+        "PATH_INFO": "/batch/",
+        "REQUEST_METHOD": "POST",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    status = []
+    response = app(environ, lambda code, headers: status.append(code))
+    return status[0], json.loads(b"".join(response))
+
+def test_capture_answers_503_when_the_queue_is_full(tmp_path):
+    buffer = make_buffer(tmp_path, max_queue=2)
+    app = event_ingest.CaptureMiddleware(lambda environ, start_response: [], buffer)
+    events = [{"event": "pageview", "distinct_id": "user"}] * 2
+    assert capture(app, json.dumps({"batch": events}).encode()) == ("200 OK", {"status": 1})
+    assert capture(app, json.dumps({"batch": events}).encode())[0] == "503 Service Unavailable"
+    assert capture(app, b"{not json")[0] == "400 Bad Request"
+    buffer.close()
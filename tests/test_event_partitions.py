@@ -0,0 +1,139 @@
+import os
+import stat
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import event_partitions
+from event_ingest import INSERT_SQL
+
+TODAY = datetime.now(timezone.utc).date()
+
+def row(uuid, day, event="pageview"):
+    return (uuid, event, "user", "token", "{}", f"{day.isoformat()}T12:00:00+00:00", f"{day.isoformat()}T12:00:00+00:00")
+
+def make_store(tmp_path, **overrides):
+    config = event_partitions.load_partition_config(dict({"enabled": True}, **overrides))
+    return event_partitions.PartitionStore(str(tmp_path), config)
+
+def write_partition(store, key, rows):
+    """Write rows straight into a partition, as a writer did on that day"""
+    conn = store.open_writer(key)
+    conn.executemany(INSERT_SQL, rows)
+    store.close_writer(key)
+
+def uuids(store, start=None, end=None):
+    return sorted(uuid for (uuid,) in store.query("SELECT uuid FROM standalone_events", start=start, end=end))
+
+def test_rows_go_to_their_own_day_until_the_write_horizon(tmp_path):
+    store = make_store(tmp_path, compact_after_days=2)
+    yesterday = TODAY - timedelta(days=1)
+    late = TODAY - timedelta(days=5)
+    assert store.write_rows([row("a", TODAY), row("b", yesterday), row("c", late)]) == 3
+    store.close()
+
+    keys = [partition.key for partition in store.partitions()]
+    assert keys == [yesterday.isoformat(), TODAY.isoformat()]
+    # The late event is filed under today but still found by its timestamp
+    assert uuids(store, start=late, end=late) == ["c"]
+    assert uuids(store) == ["a", "b", "c"]
+
+def test_week_granularity_uses_iso_weeks(tmp_path):
+    store = make_store(tmp_path, granularity="week")
+    store.write_rows([row("a", TODAY)])
+    store.close()
+    year, week, _ = TODAY.isocalendar()
+    assert [partition.key for partition in store.partitions()] == [f"{year}-W{week:02d}"]
+
+def test_rows_past_retention_are_not_written(tmp_path):
+    store = make_store(tmp_path, retention_days=7, compact_after_days=2)
+    rows = [row("a", TODAY), row("b", TODAY - timedelta(days=6)), row("c", TODAY - timedelta(days=8))]
+    assert store.write_rows(rows) == 2
+    store.close()
+    assert uuids(store) == ["a", "b"]
+
+def test_retention_removes_whole_partitions(tmp_path):
+    store = make_store(tmp_path, retention_days=7, compact_after_days=2)
+    old = TODAY - timedelta(days=10)
+    recent = TODAY - timedelta(days=3)
+    write_partition(store, old.isoformat(), [row("old", old)])
+    write_partition(store, recent.isoformat(), [row("recent", recent)])
+
+    assert store.apply_retention(TODAY) == [old.isoformat()]
+    assert not os.path.exists(store.live_path(old.isoformat()))
+    assert uuids(store) == ["recent"]
+
+def test_retention_is_off_by_default(tmp_path):
+    store = make_store(tmp_path)
+    old = TODAY - timedelta(days=400)
+    write_partition(store, old.isoformat(), [row("old", old)])
+    assert store.apply_retention(TODAY) == []
+
+def test_retention_must_outlast_compaction():
+    with pytest.raises(ValueError):
+        event_partitions.load_partition_config({"retention_days": 2, "compact_after_days": 2})
+
+def test_compaction_writes_read_only_files(tmp_path):
+    store = make_store(tmp_path, compact_after_days=2)
+    day = TODAY - timedelta(days=5)
+    key = day.isoformat()
+    write_partition(store, key, [row("a", day), row("b", day)])
+
+    assert store.compact(TODAY) == [key]
+    assert not os.path.exists(store.live_path(key))
+    assert os.path.exists(store.compact_path(key))
+    assert not os.stat(store.compact_path(key)).st_mode & stat.S_IWUSR
+    assert uuids(store, start=day, end=day) == ["a", "b"]
+    # Recent partitions are still written to and stay live
+    store.write_rows([row("c", TODAY)])
+    store.close()
+    assert store.compact(TODAY) == []
+
+def test_compaction_folds_in_an_earlier_compaction_once(tmp_path):
+    store = make_store(tmp_path, compact_after_days=2)
+    day = TODAY - timedelta(days=5)
+    key = day.isoformat()
+    write_partition(store, key, [row("a", day)])
+    store.compact(TODAY)
+    # A live file next to the compacted one, e.g. after compact_after_days grew
+    write_partition(store, key, [row("a", day), row("b", day)])
+
+    assert store.compact(TODAY) == [key]
+    assert uuids(store) == ["a", "b"]
+
+def test_compacted_partitions_are_pruned_by_their_timestamps(tmp_path):
+    store = make_store(tmp_path, compact_after_days=2)
+    day = TODAY - timedelta(days=5)
+    late = day - timedelta(days=10)
+    write_partition(store, day.isoformat(), [row("late", late), row("on-time", day)])
+    store.compact(TODAY)
+
+    keys = lambda start, end: [partition.key for partition in store.prune(start, end)]
+    assert keys(late, late) == [day.isoformat()]
+    assert keys(late - timedelta(days=3), late - timedelta(days=1)) == []
+    assert keys(day + timedelta(days=1), None) == []
+    assert uuids(store, start=late, end=late) == ["late"]
+
+def test_interrupted_compaction_is_restored(tmp_path):
+    store = make_store(tmp_path)
+    day = TODAY - timedelta(days=5)
+    key = day.isoformat()
+    write_partition(store, key, [row("a", day)])
+    os.replace(store.live_path(key), store.live_path(key) + event_partitions.TOMBSTONE_SUFFIX)
+
+    store.restore_tombstones()
+    assert os.path.exists(store.live_path(key))
+    assert uuids(store) == ["a"]
+
+def test_query_without_partitions_is_empty(tmp_path):
+    store = make_store(tmp_path)
+    assert store.query("SELECT COUNT(*) FROM standalone_events") == [(0,)]
+
+def test_describe_counts_events(tmp_path):
+    store = make_store(tmp_path)
+    store.write_rows([row("a", TODAY), row("b", TODAY)])
+    store.close()
+    [partition] = store.describe()
+    assert partition["key"] == TODAY.isoformat()
+    assert partition["events"] == 2
+    assert not partition["compacted"]
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# PostHog Windows Standalone web worker
+# Serves the Django application with waitress on a listening socket that is
+# owned by standalone_launcher and handed to every worker process. Once the
+# application is loaded the worker prints READY_LINE; a "drain" line on stdin
+# makes it stop accepting, finish its in-flight requests and exit
+
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import base64
+import socket
+import _thread
+import argparse
+import logging
+import threading
+from collections import deque
+
+# The launcher timestamps every line it reads from us
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(name)s - %(levelname)s - %(message)s',
+    stream=sys.stderr
+)
+logger = logging.getLogger('posthog_web')
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+db_path = os.path.join(base_dir, "data", "posthog.db")
+run_dir = os.path.join(base_dir, "data", "run")
+
+# Request durations of the last LATENCY_WINDOW seconds are written to
+# data/run/latency-<name>.json every LATENCY_INTERVAL seconds for the launcher
+LATENCY_WINDOW = 60
+LATENCY_INTERVAL = 5
+LATENCY_MAX_SAMPLES = 10000
+
+# The launcher waits for this line before it sends traffic to a reloaded worker
+READY_LINE = "posthog-web-ready"
+DRAIN_POLL_INTERVAL = 0.1
+# A connection without a request for this long is closed while draining; a
+# freshly accepted one may not have sent its request yet
+DRAIN_IDLE_SECONDS = 1
+WARM_UP_PATH = '/_health'
+
+class LatencyRecorder:
+    """WSGI middleware that samples how long requests take"""
+
+    def __init__(self, application, name):
+        self.application = application
+        self.name = name
+        self.samples = deque(maxlen=LATENCY_MAX_SAMPLES)
+        self.path = os.path.join(run_dir, f"latency-{name}.json")
+
+    def __call__(self, environ, start_response):
+        began = time.monotonic()
+        try:
+            response = self.application(environ, start_response)
+        except Exception:
+            self.samples.append((time.time(), time.monotonic() - began))
+            raise
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and isinstance(response, file_wrapper):
+            # Wrapping would take static files off waitress's file sending path
+            self.samples.append((time.time(), time.monotonic() - began))
+            return response
+        return TimedResponse(response, self.samples, began)
+
+    def write_samples(self):
+        """Write the durations of the current window, in milliseconds"""
+        cutoff = time.time() - LATENCY_WINDOW
+        durations = [round(seconds * 1000, 2) for ended, seconds in list(self.samples) if ended >= cutoff]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"name": self.name, "pid": os.getpid(), "updated": time.time(),
+                       "window_seconds": LATENCY_WINDOW, "durations_ms": durations}, f)
+        os.replace(tmp_path, self.path)
+
+    def run(self):
+        os.makedirs(run_dir, exist_ok=True)
+        while True:
+            time.sleep(LATENCY_INTERVAL)
+            try:
+                self.write_samples()
+            except OSError as e:
+                logger.error(f"Could not write latency samples: {e}")
+
+    def start(self):
+        threading.Thread(target=self.run, name='latency', daemon=True).start()
+        return self
+
+class TimedResponse:
+    """Response iterable that records the request's duration once it is sent"""
+
+    def __init__(self, response, samples, began):
+        self.response = response
+        self.samples = samples
+        self.began = began
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        try:
+            if hasattr(self.response, 'close'):
+                self.response.close()
+        finally:
+            self.samples.append((time.time(), time.monotonic() - self.began))
+
+def receive_socket(args):
+    """Rebuild the listening socket passed down by the launcher"""
+    if args.fd is not None:
+        # POSIX: the descriptor was inherited through pass_fds
+        return socket.socket(fileno=args.fd)
+    # Windows: the launcher writes socket.share() data to our stdin
+    return socket.fromshare(base64.b64decode(sys.stdin.buffer.raw.readline()))
+
+def load_asset_manifest(static_root):
+    """Hashes and cacheability of the assets the build precompressed"""
+    try:
+        with open(os.path.join(static_root, "assets-manifest.json")) as f:
+            return json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def get_application(static_root, name):
+    """Load the Django WSGI application with whitenoise serving static files"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posthog.settings')
+    from django.core.wsgi import get_wsgi_application
+    from whitenoise import WhiteNoise
+
+    import sqlite_profile
+    sqlite_profile.install_connection_hook()
+
+    # whitenoise picks up the .gz and .br variants written at build time;
+    # assets with content-hashed names are cached for good
+    manifest = load_asset_manifest(static_root)
+
+    def immutable_file_test(path, url):
+        rel_path = os.path.relpath(path, static_root).replace(os.sep, '/')
+        return manifest.get(rel_path, {}).get("immutable", False)
+
+    application = WhiteNoise(get_wsgi_application(), immutable_file_test=immutable_file_test)
+    if os.path.isdir(static_root):
+        application.add_files(static_root, prefix='static/')
+
+    # Capture requests go to the batched SQLite write buffer
+    import event_ingest
+    import event_partitions
+    ingest_config = event_ingest.load_ingest_config(json.loads(os.environ.get(event_ingest.INGEST_ENV) or '{}'))
+    if ingest_config["enabled"]:
+        profile = sqlite_profile.load_profile(json.loads(os.environ.get(sqlite_profile.PROFILE_ENV) or '{}'))
+        partition_config = event_partitions.load_partition_config(
+            json.loads(os.environ.get(event_partitions.PARTITIONS_ENV) or '{}')
+        )
+        partitions = None
+        if partition_config["enabled"]:
+            partitions = event_partitions.PartitionStore(os.path.dirname(db_path), partition_config, profile)
+        buffer = event_ingest.EventWriteBuffer(
+            db_path, ingest_config, profile=profile, name=name, partitions=partitions
+        ).start()
+        atexit.register(buffer.close)
+        application = event_ingest.CaptureMiddleware(application, buffer)
+    return LatencyRecorder(application, name).start()
+
+def warm_up(application):
+    """Send one request through the application so the first client doesn't pay for lazy imports"""
+    from wsgiref.util import setup_testing_defaults
+    environ = {"PATH_INFO": WARM_UP_PATH, "REQUEST_METHOD": "GET"}
+    setup_testing_defaults(environ)
+    try:
+        response = application(environ, lambda status, headers, exc_info=None: None)
+        try:
+            b"".join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+    except Exception as e:
+        logger.warning(f"Warm-up request to {WARM_UP_PATH} failed: {e}")
+
+def closing_task_class():
+    from waitress.task import WSGITask
+
+    class ClosingTask(WSGITask):
+        """Answers with Connection: close so keep-alive clients reconnect to another worker"""
+
+        def build_response_header(self):
+            self.request.headers["CONNECTION"] = "close"
+            return super().build_response_header()
+
+    return ClosingTask
+
+def drain(server, timeout):
+    """Stop accepting, close connections as their requests finish, then stop the server"""
+    # The other workers keep accepting on the shared socket
+    server.accepting = False
+    task_class = closing_task_class()
+    deadline = time.monotonic() + timeout
+    logger.info(f"Web worker {os.getpid()} draining {len(server.active_channels)} connections")
+    while time.monotonic() < deadline:
+        channels = list(server.active_channels.values())
+        if not channels:
+            break
+        for channel in channels:
+            channel.task_class = task_class
+            idle = not channel.requests and channel.request is None and not channel.total_outbufs_len
+            if idle and time.time() - channel.last_activity >= DRAIN_IDLE_SECONDS:
+                channel.will_close = True
+        server.pull_trigger()
+        time.sleep(DRAIN_POLL_INTERVAL)
+    else:
+        logger.warning(f"Web worker {os.getpid()} still had open connections after {timeout}s")
+    # Unwinds server.run() in the main thread, so atexit handlers still run
+    _thread.interrupt_main()
+
+def read_commands(server, drain_timeout):
+    """Wait for the launcher to ask for a drain; EOF means the launcher is gone"""
+    # Unbuffered, a buffered read would hold its lock at interpreter shutdown
+    for line in iter(sys.stdin.buffer.raw.readline, b''):
+        if line.strip() == b'drain':
+            break
+    drain(server, drain_timeout)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PostHog standalone web worker")
+    parser.add_argument('--fd', type=int, help="inherited listening socket descriptor")
+    parser.add_argument('--name', default='web', help="worker name used for logs and spill files")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--connection-limit', type=int, default=1000)
+    parser.add_argument('--channel-timeout', type=int, default=120)
+    parser.add_argument('--drain-timeout', type=int, default=30)
+    parser.add_argument('--static-root', default=os.path.join(base_dir, 'frontend', 'dist'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    sock = receive_socket(args)
+    application = get_application(args.static_root, args.name)
+    warm_up(application.application)
+
+    # Exit through SystemExit on terminate so the ingest buffer gets flushed
+    signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+
+    from waitress.server import create_server
+
+    server = create_server(
+        application,
+        sockets=[sock],
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        channel_timeout=args.channel_timeout,
+        ident='PostHog'
+    )
+    threading.Thread(target=read_commands, args=(server, args.drain_timeout), name='control', daemon=True).start()
+    logger.info(f"Web worker {os.getpid()} serving on {sock.getsockname()} with {args.threads} threads")
+    print(READY_LINE, flush=True)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"Web worker {os.getpid()} stopped")
+
+if __name__ == '__main__':
+    main()